@@ -2,9 +2,13 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+import argparse
 import warnings
+from stream_profile import profile_csv
 warnings.filterwarnings('ignore')
 
+IMPORTANT_COLUMNS = ['title', 'abstract', 'publish_time', 'journal', 'authors']
+
 def basic_exploration():
     print("=== STARTING BASIC DATA EXPLORATION ===")
     print("=" * 50)
@@ -18,6 +22,14 @@ def basic_exploration():
         print("Please download the dataset from Kaggle and place it in this folder")
         return None
     
+    return explore_data(df)
+
+def explore_data(df):
+    """Print the exploration statistics of an already loaded DataFrame.
+
+    Returns the summary that write_exploration_results() saves, so the caller
+    can drop the raw frame before the results are written.
+    """
     # Basic information
     print(f"\nDATASET SHAPE: {df.shape}")
     print(f"Number of rows: {df.shape[0]:,}")
@@ -60,9 +72,8 @@ def basic_exploration():
         print("No numerical columns found")
     
     # Check important columns
-    important_cols = ['title', 'abstract', 'publish_time', 'journal', 'authors']
     print(f"\nIMPORTANT COLUMNS STATUS:")
-    for col in important_cols:
+    for col in IMPORTANT_COLUMNS:
         if col in df.columns:
             non_null = df[col].notnull().sum()
             percentage = (non_null / len(df)) * 100
@@ -83,18 +94,128 @@ def basic_exploration():
                 sample = df[col].iloc[0]
                 print(f"    Sample value: {sample}")
     
-    return df
+    return {
+        'shape': df.shape,
+        'columns': list(df.columns),
+        'missing': missing_data
+    }
+
+def stream_exploration(input_file='metadata.csv', chunksize=100_000):
+    """Print the same sections as explore_data() from one streaming pass over input_file.
+
+    Only one chunk is held in memory at a time. Distinct counts (HyperLogLog)
+    and quartiles (t-digest) are approximate; everything else is exact.
+    """
+    print("=== STARTING STREAMING DATA EXPLORATION ===")
+    print("=" * 50)
+    print(f"Reading '{input_file}' in chunks of {chunksize:,} rows")
+    
+    try:
+        profile = profile_csv(input_file, chunksize=chunksize)
+    except FileNotFoundError:
+        print(f"ERROR: {input_file} not found!")
+        print("Please download the dataset from Kaggle and place it in this folder")
+        return None
+    print(f"SUCCESS: {profile.chunks} chunks profiled")
+    
+    rows, columns = profile.shape
+    print(f"\nDATASET SHAPE: {profile.shape}")
+    print(f"Number of rows: {rows:,}")
+    print(f"Number of columns: {columns}")
+    
+    print("\nFIRST 3 ROWS:")
+    print(profile.head)
+    
+    # Column information (what df.info() shows)
+    dtypes = profile.dtypes()
+    non_null = profile.non_null()
+    print("\nCOLUMN INFORMATION:")
+    print(f"{rows:,} entries, {columns} columns")
+    for col in dtypes.index:
+        print(f"  {col:<20}{non_null[col]:>12,} non-null  {dtypes[col]}")
+    
+    print("\nDATA TYPES:")
+    print(dtypes.value_counts())
+    print("\nDetailed dtypes:")
+    for col in dtypes.index:
+        print(f"  {col}: {dtypes[col]}")
+    
+    print("\nMISSING VALUES ANALYSIS:")
+    missing_data = profile.missing()
+    missing_df = pd.DataFrame({
+        'Column': missing_data.index,
+        'Missing_Count': missing_data,
+        'Missing_Percentage': (missing_data / rows) * 100 if rows else 0.0
+    }).sort_values('Missing_Count', ascending=False)
+    print(missing_df.head(15))
+    
+    print("\nBASIC STATISTICS (quartiles approximate):")
+    stats = profile.describe()
+    if len(stats.columns) > 0:
+        print(stats)
+    else:
+        print("No numerical columns found")
+    
+    print(f"\nIMPORTANT COLUMNS STATUS:")
+    for col in IMPORTANT_COLUMNS:
+        if col in dtypes.index:
+            percentage = (non_null[col] / rows) * 100
+            sample_val = profile.first_row[col] if non_null[col] > 0 else "N/A"
+            print(f"  {col}: {non_null[col]:,} non-null ({percentage:.1f}%)")
+            print(f"    Sample: {str(sample_val)[:80]}...")
+        else:
+            print(f"  {col}: COLUMN NOT FOUND")
+    
+    print(f"\nDATE-LIKE COLUMNS:")
+    date_cols = [col for col in dtypes.index if 'date' in col.lower() or 'time' in col.lower()]
+    for col in date_cols:
+        print(f"  {col}: {non_null[col]:,} non-null")
+        if non_null[col] > 0:
+            print(f"    Sample value: {profile.first_row[col]}")
+    
+    column_table = profile.column_table()
+    print("\nCOLUMN PROFILE (distinct counts approximate):")
+    print(shorten_values(column_table))
+    
+    return {
+        'shape': profile.shape,
+        'columns': list(dtypes.index),
+        'missing': missing_data,
+        'profile': column_table
+    }
+
+def shorten_values(table, width=40):
+    """Copy of table with long text values cut to width characters"""
+    return table.apply(lambda col: col.map(lambda value: value[:width - 3] + '...'
+                                           if isinstance(value, str) and len(value) > width else value))
+
+def write_exploration_results(summary, results_file='exploration_results.txt'):
+    """Write the summary returned by explore_data() or stream_exploration()"""
+    with open(results_file, 'w', encoding='utf-8') as f:
+        f.write("CORD-19 Dataset Exploration Results\n")
+        f.write("=" * 40 + "\n")
+        f.write(f"Dataset shape: {summary['shape']}\n")
+        f.write(f"Columns: {summary['columns']}\n")
+        f.write("\nMissing values:\n")
+        f.write(str(summary['missing']))
+        if 'profile' in summary:
+            f.write("\n\nColumn profile (distinct counts approximate):\n")
+            f.write(shorten_values(summary['profile']).to_string())
 
 if __name__ == "__main__":
-    df = basic_exploration()
+    parser = argparse.ArgumentParser(description="Explore the CORD-19 metadata.csv file")
+    parser.add_argument('--stream', action='store_true',
+                        help="Profile the file in one pass over chunks instead of loading it whole")
+    parser.add_argument('--chunksize', type=int, default=100_000,
+                        help="Rows per chunk in streaming mode (default: 100,000)")
+    args = parser.parse_args()
+    
+    if args.stream:
+        summary = stream_exploration('metadata.csv', chunksize=args.chunksize)
+    else:
+        summary = basic_exploration()
     
     # Save exploration results
-    if df is not None:
-        with open('exploration_results.txt', 'w', encoding='utf-8') as f:
-            f.write("CORD-19 Dataset Exploration Results\n")
-            f.write("=" * 40 + "\n")
-            f.write(f"Dataset shape: {df.shape}\n")
-            f.write(f"Columns: {list(df.columns)}\n")
-            f.write("\nMissing values:\n")
-            f.write(str(df.isnull().sum()))
+    if summary is not None:
+        write_exploration_results(summary)
         print("\nEXPLORATION RESULTS saved to 'exploration_results.txt'")
\ No newline at end of file
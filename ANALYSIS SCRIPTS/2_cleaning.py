@@ -2,101 +2,580 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime
+from collections import Counter
+import argparse
+import functools
+import os
+import shutil
+import tempfile
+from text_features import count_words
+from date_parsing import parse_publish_time
+from dedup import Deduplicator
+from delta_ingest import STORE_DIR, CleanedStore
+from parallel_clean import clean_partitions, read_partition
+from raw_dtypes import infer_csv_dtypes
+from data_store import (ABSTRACT_PLACEHOLDER, CACHE_FILE, ColumnarCacheWriter, load_cleaned_data, memory_report,
+                        optimize_dtypes, write_cleaned_csv, write_columnar_cache)
+from heavy_hitters import SKETCH_FILE, JournalSketch, top_counts, top_journal_counts
+from search_index import INDEX_DIR, SearchIndexBuilder, build_search_index, merge_search_indexes
+from text_store import TEXT_DIR, TextStoreWriter, text_store_is_fresh, write_text_store
+import instrumentation
+from instrumentation import span
 import warnings
 warnings.filterwarnings('ignore')
 
-def clean_data(df):
+UNKNOWN_JOURNAL = 'Unknown Journal'
+
+def print_date_report(date_formats, unparsed_dates, missing_dates):
+    """Print how many publish_time values were found in each format"""
+    for label, count in sorted(date_formats.items(), key=lambda item: -item[1]):
+        print(f"   Format {label}: {count:,} values")
+    print(f"   Unparseable values: {unparsed_dates:,}")
+    print(f"   Missing values: {missing_dates:,}")
+
+def print_dedup_report(deduplicator):
+    """Print the rows removed, time and memory of every deduplication tier"""
+    for tier, removed, seconds, memory_bytes in deduplicator.report():
+        print(f"   {tier}: removed {removed:,} rows ({seconds:.2f}s, {memory_bytes / 1e6:,.1f} MB of state)")
+
+def clean_frame(df, id_offset=0, workers=1):
+    """Apply the per-row cleaning steps to a DataFrame (or one chunk of it) without printing.
+
+    Returns the cleaned frame and a dict of counts for the cleaning report.
+    Duplicate titles are NOT removed here, so chunks can be deduplicated globally.
+    workers > 1 counts words on several threads.
+    """
+    counts = {}
+    
+    # 1. Handle missing titles (essential column)
+    with span('clean.1_missing_titles', rows_in=len(df)) as step:
+        counts['missing_titles'] = int(df['title'].isnull().sum())
+        df_clean = df[df['title'].notna()]
+        step.rows_out = len(df_clean)
+    rows = len(df_clean)
+    
+    # 2. Handle abstract column: missing abstracts stay missing values in memory
+    # (an abstract that is just the placeholder text counts as missing too);
+    # ABSTRACT_PLACEHOLDER is only written out to the CSV
+    with span('clean.2_abstracts', rows_in=rows) as step:
+        df_clean['abstract'] = df_clean['abstract'].mask(df_clean['abstract'] == ABSTRACT_PLACEHOLDER)
+        counts['empty_abstracts'] = int(df_clean['abstract'].isnull().sum())
+        step.rows_out = rows
+    
+    # 3. Convert publish_time to datetime: each distinct string is parsed once,
+    # one vectorized call per detected format (see date_parsing.py)
+    with span('clean.3_publish_time', rows_in=rows) as step:
+        df_clean['publish_time'], date_report = parse_publish_time(df_clean['publish_time'])
+        counts['date_formats'] = Counter(date_report['formats'])
+        counts['unparsed_dates'] = date_report['failed']
+        counts['missing_dates'] = date_report['missing']
+        counts['valid_dates'] = int(df_clean['publish_time'].notnull().sum())
+        counts['invalid_dates'] = int(df_clean['publish_time'].isnull().sum())
+        step.rows_out = rows
+        step.set(distinct_values=date_report['distinct_values'])
+    
+    # 4. Extract year and month from valid dates only (nullable ints, so the dtype
+    # doesn't depend on whether a given chunk happens to contain a missing date)
+    with span('clean.4_year_month', rows_in=rows) as step:
+        df_clean['year'] = df_clean['publish_time'].dt.year.astype('Int64')
+        df_clean['month'] = df_clean['publish_time'].dt.month.astype('Int64')
+        counts['years_extracted'] = int(df_clean['year'].notnull().sum())
+        step.rows_out = rows
+    
+    # 5. Handle journal column
+    with span('clean.5_journal', rows_in=rows) as step:
+        df_clean['journal'] = df_clean['journal'].fillna(UNKNOWN_JOURNAL)
+        counts['unknown_journals'] = int((df_clean['journal'] == UNKNOWN_JOURNAL).sum())
+        step.rows_out = rows
+    
+    # 6. Create new features
+    with span('clean.6_features', rows_in=rows) as step:
+        # Abstract and title word counts (vectorized, same counts as len(str(x).split()))
+        df_clean['abstract_word_count'] = count_words(df_clean['abstract'], workers=workers)
+        df_clean['title_word_count'] = count_words(df_clean['title'], workers=workers)
+        
+        # Has abstract flag
+        df_clean['has_abstract'] = df_clean['abstract'].notnull()
+        
+        # Paper ID (create if doesn't exist)
+        if 'cord_uid' in df_clean.columns:
+            df_clean['paper_id'] = df_clean['cord_uid']
+        else:
+            df_clean['paper_id'] = range(id_offset, id_offset + len(df_clean))
+        step.rows_out = rows
+    
+    return df_clean, counts
+
+def clean_data(df, workers=1, near_duplicates=False):
     print("=== STARTING DATA CLEANING PROCESS ===")
     print("=" * 50)
     
-    # Create a copy
-    df_clean = df.copy()
-    original_size = len(df_clean)
+    original_size = len(df)
     
     print(f"Original dataset size: {original_size:,} rows")
-    print(f"Original columns: {list(df_clean.columns)}")
+    print(f"Original columns: {list(df.columns)}")
+    
+    # Steps 1-5 (clean_frame filters rows, so no separate copy of df is needed)
+    df_clean, counts = clean_frame(df, workers=workers)
     
-    # 1. Handle missing titles (essential column)
     print("\n1. Handling missing titles...")
-    missing_titles = df_clean['title'].isnull().sum()
-    print(f"   Removing {missing_titles} rows with missing titles")
-    df_clean = df_clean[df_clean['title'].notna()]
+    print(f"   Removing {counts['missing_titles']} rows with missing titles")
     
-    # 2. Handle abstract column
     print("\n2. Handling abstract column...")
-    df_clean['abstract'] = df_clean['abstract'].fillna('No abstract available')
-    empty_abstracts = (df_clean['abstract'] == 'No abstract available').sum()
-    print(f"   Empty abstracts: {empty_abstracts}")
+    print(f"   Empty abstracts: {counts['empty_abstracts']}")
     
-    # 3. Convert publish_time to datetime - handle various formats
     print("\n3. Converting publish_time to datetime...")
+    print_date_report(counts['date_formats'], counts['unparsed_dates'], counts['missing_dates'])
+    print(f"   Successfully converted: {counts['valid_dates']} dates")
+    print(f"   Failed to convert: {counts['invalid_dates']} dates")
+    print(f"   Years extracted: {counts['years_extracted']}")
     
-    # First, check what the publish_time format looks like
-    sample_times = df_clean['publish_time'].dropna().head(5)
-    print(f"   Sample publish_time values: {list(sample_times)}")
+    print("\n4. Handling journal column...")
+    print(f"   Unknown journals: {counts['unknown_journals']}")
     
-    # Try to convert to datetime
-    df_clean['publish_time'] = pd.to_datetime(df_clean['publish_time'], errors='coerce', utc=True)
+    print("\n5. Creating new features...")
     
-    # Check conversion results
-    valid_dates = df_clean['publish_time'].notnull().sum()
-    invalid_dates = df_clean['publish_time'].isnull().sum()
-    print(f"   Successfully converted: {valid_dates} dates")
-    print(f"   Failed to convert: {invalid_dates} dates")
+    # 7. Remove duplicates: same normalized title, optionally near-identical title + abstract
+    print("\n6. Removing duplicate titles...")
+    deduplicator = Deduplicator(near_duplicates=near_duplicates)
+    with span('clean.7_duplicates', rows_in=len(df_clean)) as step:
+        df_clean = deduplicator.filter(df_clean)
+        step.rows_out = len(df_clean)
+    print_dedup_report(deduplicator)
     
-    # 4. Extract year and month from valid dates only
-    df_clean['year'] = df_clean['publish_time'].dt.year
-    df_clean['month'] = df_clean['publish_time'].dt.month
+    # 8. Compact dtypes (categorical journal, small ints, shared paper_id)
+    print("\n7. Optimizing dtypes...")
+    with span('clean.8_optimize_dtypes', rows_in=len(df_clean)) as step:
+        optimize_dtypes(df_clean)
+        step.rows_out = len(df_clean)
     
-    # For invalid dates, we'll keep them as NaN for now
-    print(f"   Years extracted: {df_clean['year'].notnull().sum()}")
+    # Final report
+    final_size = len(df_clean)
+    retention_rate = (final_size / original_size) * 100
     
-    # 5. Handle journal column
-    print("\n4. Handling journal column...")
-    df_clean['journal'] = df_clean['journal'].fillna('Unknown Journal')
-    unknown_journals = (df_clean['journal'] == 'Unknown Journal').sum()
-    print(f"   Unknown journals: {unknown_journals}")
+    print(f"\nCLEANING SUMMARY:")
+    print(f"   Original size: {original_size:,} rows")
+    print(f"   Final size: {final_size:,} rows")
+    print(f"   Retention rate: {retention_rate:.1f}%")
+    print(f"   Columns in cleaned data: {len(df_clean.columns)}")
     
-    # 6. Create new features
-    print("\n5. Creating new features...")
+    return df_clean
+
+def clean_data_streaming(input_file='metadata.csv', output_file='cleaned_metadata.csv',
+                         chunksize=100_000, cache_file=CACHE_FILE, workers=1, index_dir=INDEX_DIR,
+                         near_duplicates=False, text_dir=TEXT_DIR, sketch_file=SKETCH_FILE):
+    """Clean input_file chunk by chunk and append each cleaned chunk to output_file.
+
+    Peak memory is bounded by chunksize rather than by the size of the corpus.
+    The output is identical to clean_data() followed by to_csv(index=False):
+    paper ids continue across chunks and titles (and, with near_duplicates,
+    near-identical papers) are deduplicated against every earlier chunk.
+    A first pass over the file finds the dtypes read_csv infers for the whole
+    of it (see raw_dtypes.py), and every chunk is read with them.
+    Each cleaned chunk gets the compact dtypes of data_store.DTYPE_PLAN and
+    is also appended to the typed Parquet cache (see data_store.py), the
+    text store (see text_store.py), the journal sketch (see heavy_hitters.py)
+    and the search index (see search_index.py) unless index_dir is None.
+    Returns the same statistics dict as analyze_cleaned_data().
+    """
+    print("=== STARTING STREAMING DATA CLEANING PROCESS ===")
+    print("=" * 50)
+    print(f"Reading '{input_file}' in chunks of {chunksize:,} rows")
+    
+    totals = Counter()
+    deduplicator = Deduplicator(near_duplicates=near_duplicates)
+    cleaned = CleanedTotals()
+    date_formats = Counter()
+    original_size = 0
+    id_offset = 0
+    cache_writer = ColumnarCacheWriter(cache_file)
+    text_writer = TextStoreWriter(text_dir)
+    index_builder = SearchIndexBuilder() if index_dir else None
+    
+    # Read every chunk with the dtypes of the whole file, as clean_data() gets them
+    with span('clean.dtypes') as step:
+        dtypes = infer_csv_dtypes(input_file, chunksize)
+        step.set(columns=len(dtypes))
+    reader = pd.read_csv(input_file, chunksize=chunksize, dtype=dtypes, low_memory=False)
+    for chunk_number, chunk in enumerate(reader, start=1):
+        original_size += len(chunk)
+        
+        with span('clean.chunk', rows_in=len(chunk), chunk=chunk_number) as chunk_span:
+            chunk_clean, counts = clean_frame(chunk, id_offset=id_offset, workers=workers)
+            id_offset += len(chunk_clean)
+            date_formats.update(counts.pop('date_formats'))
+            totals.update(counts)
+            
+            # Remove duplicates, both within this chunk and against earlier chunks
+            with span('clean.7_duplicates', rows_in=len(chunk_clean)) as step:
+                chunk_clean = deduplicator.filter(chunk_clean)
+                step.rows_out = len(chunk_clean)
+            
+            # Compact dtypes
+            with span('clean.8_optimize_dtypes', rows_in=len(chunk_clean)) as step:
+                optimize_dtypes(chunk_clean)
+                step.rows_out = len(chunk_clean)
+            
+            # Append to the output, writing the header only once
+            with span('clean.write', rows_in=len(chunk_clean)) as step:
+                write_cleaned_csv(chunk_clean, output_file, append=chunk_number > 1)
+                cache_writer.write(chunk_clean)
+                text_writer.add(chunk_clean)
+                if index_builder is not None:
+                    index_builder.add(chunk_clean['title'], chunk_clean['abstract'])
+                step.rows_out = len(chunk_clean)
+            chunk_span.rows_out = len(chunk_clean)
+        
+        # Running statistics for the analysis section of the report
+        cleaned.add(chunk_clean)
+        
+        print(f"   Chunk {chunk_number}: {len(chunk):,} rows in, {len(chunk_clean):,} rows out")
+    
+    if cache_writer.close():
+        print(f"Columnar cache written to '{cache_file}'")
+    if text_writer.close():
+        print(f"Text store written to '{text_dir}/'")
+    cleaned.journals.save(sketch_file)
+    print(f"Journal sketch written to '{sketch_file}'")
+    if index_builder is not None:
+        index_builder.save(index_dir)
+        print(f"Search index written to '{index_dir}/'")
+    
+    print(f"\n1. Rows removed for missing titles: {totals['missing_titles']}")
+    print(f"2. Empty abstracts: {totals['empty_abstracts']}")
+    print(f"3. Dates converted: {totals['valid_dates']} (failed: {totals['invalid_dates']})")
+    print_date_report(date_formats, totals['unparsed_dates'], totals['missing_dates'])
+    print(f"4. Unknown journals: {totals['unknown_journals']}")
+    print(f"6. Duplicates removed:")
+    print_dedup_report(deduplicator)
+    
+    print_cleaning_summary(original_size, cleaned)
+    return cleaned.stats(lambda: load_cleaned_data(['journal'], output_file, cache_file)['journal'])
+
+def clean_data_parallel(input_file='metadata.csv', output_file='cleaned_metadata.csv', processes=2,
+                        cache_file=CACHE_FILE, workers=1, index_dir=INDEX_DIR, near_duplicates=False,
+                        text_dir=TEXT_DIR, sketch_file=SKETCH_FILE):
+    """Clean input_file on `processes` processes, one byte range of the file per task.
+    
+    The partitions are parsed and cleaned in parallel (see parallel_clean.py).
+    As they come back, in file order, the parent removes duplicate titles (and,
+    with near_duplicates, near-identical papers) across all of them, continues
+    the paper ids and appends the rows to output_file, the Parquet cache, the
+    text store and the journal sketch,
+    so the output is identical to clean_data() followed by save_cleaned_data()
+    (every partition is read with the dtypes of the whole file). The
+    partitions' search indexes are merged instead of tokenizing the text again.
+    Returns the same statistics dict as analyze_cleaned_data().
+    """
+    print("=== STARTING PARALLEL DATA CLEANING PROCESS ===")
+    print("=" * 50)
+    print(f"Cleaning '{input_file}' on {processes} processes")
+    
+    totals = Counter()
+    deduplicator = Deduplicator(near_duplicates=near_duplicates)
+    cleaned = CleanedTotals()
+    date_formats = Counter()
+    original_size = 0
+    id_offset = 0
+    cache_writer = ColumnarCacheWriter(cache_file)
+    text_writer = TextStoreWriter(text_dir)
+    index_parts = []
+    
+    # Partitions (Arrow files and search indexes) are handed over next to the output
+    work_dir = tempfile.mkdtemp(prefix='clean-partitions-', dir=os.path.dirname(os.path.abspath(output_file)))
+    try:
+        partitions = clean_partitions(input_file, functools.partial(clean_frame, workers=workers), processes,
+                                      work_dir, index=index_dir is not None)
+        for result in partitions:
+            number = result['number'] + 1
+            original_size += result['rows_in']
+            
+            with span('clean.partition', rows_in=result['rows_in'], partition=number) as partition_span:
+                partition_clean = read_partition(result)
+                partition_rows = len(partition_clean)
+                if 'cord_uid' not in partition_clean.columns:
+                    partition_clean['paper_id'] += id_offset
+                id_offset += partition_rows
+                counts = result['counts']
+                date_formats.update(counts.pop('date_formats'))
+                totals.update(counts)
+                
+                # Remove duplicates, both within this partition and against earlier ones
+                with span('clean.7_duplicates', rows_in=partition_rows) as step:
+                    partition_clean = deduplicator.filter(partition_clean, result['hashes'])
+                    step.rows_out = len(partition_clean)
+                if result['index_dir'] is not None:
+                    row_map = np.full(partition_rows, -1, dtype=np.int64)
+                    row_map[partition_clean.index.to_numpy()] = cleaned.rows + np.arange(len(partition_clean))
+                    index_parts.append((result['index_dir'], row_map))
+                
+                # Compact dtypes
+                with span('clean.8_optimize_dtypes', rows_in=len(partition_clean)) as step:
+                    optimize_dtypes(partition_clean)
+                    step.rows_out = len(partition_clean)
+                
+                # Append to the output, writing the header only once
+                with span('clean.write', rows_in=len(partition_clean)) as step:
+                    write_cleaned_csv(partition_clean, output_file, append=number > 1)
+                    cache_writer.write(partition_clean)
+                    text_writer.add(partition_clean)
+                    step.rows_out = len(partition_clean)
+                partition_span.rows_out = len(partition_clean)
+            
+            cleaned.add(partition_clean)
+            print(f"   Partition {number}: {result['rows_in']:,} rows in, {len(partition_clean):,} rows out "
+                  f"(cleaned in {result['seconds']:.2f}s)")
+        
+        if cache_writer.close():
+            print(f"Columnar cache written to '{cache_file}'")
+        if text_writer.close():
+            print(f"Text store written to '{text_dir}/'")
+        cleaned.journals.save(sketch_file)
+        print(f"Journal sketch written to '{sketch_file}'")
+        if index_dir is not None:
+            with span('clean.merge_search_index', rows_in=cleaned.rows) as step:
+                step.rows_out = merge_search_indexes(index_parts, index_dir)
+            print(f"Search index written to '{index_dir}/'")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    print(f"\n1. Rows removed for missing titles: {totals['missing_titles']}")
+    print(f"2. Empty abstracts: {totals['empty_abstracts']}")
+    print(f"3. Dates converted: {totals['valid_dates']} (failed: {totals['invalid_dates']})")
+    print_date_report(date_formats, totals['unparsed_dates'], totals['missing_dates'])
+    print(f"4. Unknown journals: {totals['unknown_journals']}")
+    print(f"6. Duplicates removed:")
+    print_dedup_report(deduplicator)
+    
+    print_cleaning_summary(original_size, cleaned)
+    return cleaned.stats(lambda: load_cleaned_data(['journal'], output_file, cache_file)['journal'])
+
+def clean_data_incremental(input_file='metadata.csv', output_file='cleaned_metadata.csv',
+                           store_dir=STORE_DIR, workers=1, index_dir=INDEX_DIR, raw=None,
+                           cache_file=CACHE_FILE, text_dir=TEXT_DIR, sketch_file=SKETCH_FILE):
+    """Clean only the papers of input_file that were added or changed since the last incremental run.
+    
+    Papers are matched by cord_uid (see delta_ingest.py): the cleaned rows of
+    unchanged papers are kept in the cleaned store, the delta is cleaned and
+    appended to it as a new segment, and removed papers are dropped. The
+    output file and its Parquet cache are then rewritten from the store and
+    the search index is merged from the segments' indexes (no row is cleaned
+    or tokenized again for that); if nothing changed they are left as they
+    are. raw is input_file if the caller already parsed it.
+    Returns the same statistics dict as analyze_cleaned_data().
+    """
+    print("=== STARTING INCREMENTAL DATA CLEANING PROCESS ===")
+    print("=" * 50)
+    
+    if raw is None:
+        with span('load') as step:
+            raw = pd.read_csv(input_file, low_memory=False)
+            step.rows_out = len(raw)
+    raw = raw.reset_index(drop=True)
     
-    # Abstract word count
-    df_clean['abstract_word_count'] = df_clean['abstract'].apply(
-        lambda x: len(str(x).split()) if pd.notnull(x) and x != 'No abstract available' else 0
-    )
+    store = CleanedStore(store_dir)
+    if store.columns is not None and list(raw.columns) != store.columns:
+        print("Columns changed since the last run, cleaning every row again")
+        store.reset()
     
-    # Title word count
-    df_clean['title_word_count'] = df_clean['title'].apply(
-        lambda x: len(str(x).split()) if pd.notnull(x) else 0
-    )
+    # Compare every row's content hash with the last snapshot's
+    with span('incremental.diff', rows_in=len(raw)) as step:
+        delta = store.diff(raw)
+        step.rows_out = int(delta['clean'].sum())
+    print(f"Snapshot '{input_file}': {len(raw):,} rows")
+    print(f"   Papers added: {len(delta['added']):,}")
+    print(f"   Papers changed: {len(delta['changed']):,}")
+    print(f"   Papers removed: {len(delta['removed']):,}")
+    print(f"   Duplicates taking over a removed title: {delta['promoted']:,}")
+    print(f"   Rows to clean: {int(delta['clean'].sum()):,} of {len(raw):,}")
     
-    # Has abstract flag
-    df_clean['has_abstract'] = df_clean['abstract'] != 'No abstract available'
+    # Clean the delta and append it to the store
+    with span('incremental.clean', rows_in=int(delta['clean'].sum())) as step:
+        counts = store.ingest(raw, delta, lambda df: clean_frame(df, workers=workers),
+                              index=index_dir is not None)
+        step.rows_out = store.segments.get(counts['segment'], 0)
+    with span('incremental.compact') as step:
+        compacted = store.compact()
+        step.set(segments=len(compacted))
+    store.save()
     
-    # Paper ID (create if doesn't exist)
-    if 'cord_uid' in df_clean.columns:
-        df_clean['paper_id'] = df_clean['cord_uid']
+    print(f"\n1. Rows removed for missing titles: {counts['missing_titles']}")
+    print(f"2. Empty abstracts: {counts['empty_abstracts']}")
+    print(f"3. Dates converted: {counts['valid_dates']} (failed: {counts['invalid_dates']})")
+    print_date_report(counts['date_formats'], counts['unparsed_dates'], counts['missing_dates'])
+    print(f"4. Unknown journals: {counts['unknown_journals']}")
+    print(f"6. Duplicate titles removed: {counts['duplicates']}")
+    if counts['segment'] is not None:
+        print(f"Stored {store.segments[counts['segment']]:,} cleaned rows as segment {counts['segment']}")
+    if compacted:
+        print(f"Compacted segments: {', '.join(map(str, compacted))}")
+    
+    # Rewrite the cleaned outputs from the live rows of the store
+    changed = delta['clean'].any() or delta['replaced'].any()
+    memory_totals = None
+    if (changed or not os.path.exists(output_file) or not text_store_is_fresh(output_file, text_dir)
+            or not os.path.exists(sketch_file)):
+        with span('incremental.export', rows_in=store.live_count()):
+            memory_totals, columns = export_cleaned_store(store, output_file, cache_file, index_dir, text_dir,
+                                                          sketch_file)
     else:
-        df_clean['paper_id'] = range(len(df_clean))
+        print("No changes since the last run, cleaned outputs left as they are")
+        columns = len(pd.read_csv(output_file, nrows=0).columns)
     
-    # 7. Remove duplicates based on title
-    print("\n6. Removing duplicate titles...")
-    initial_count = len(df_clean)
-    df_clean = df_clean.drop_duplicates(subset=['title'])
-    duplicates_removed = initial_count - len(df_clean)
-    print(f"   Removed {duplicates_removed} duplicate titles")
+    aggregates = store.aggregates
+    final_size = store.live_count()
+    print(f"\nCLEANING SUMMARY:")
+    print(f"   Snapshot size: {len(raw):,} rows")
+    print(f"   Final size: {final_size:,} rows")
+    print(f"   Rows cleaned in this run: {int(delta['clean'].sum()):,}")
+    print(f"   Columns in cleaned data: {columns}")
     
-    # Final report
-    final_size = len(df_clean)
-    retention_rate = (final_size / original_size) * 100
+    year_series = aggregates.year_counts()
+    top_journals = aggregates.top_journals(10)
+    avg_words = aggregates.mean_length()
+    print_cleaned_stats(year_series, top_journals, avg_words, aggregates.has_abstract, final_size)
+    print_memory_report(memory_totals)
+    
+    return {
+        'year_counts': year_series,
+        'top_journals': top_journals,
+        'avg_abstract_length': avg_words,
+        'rows': final_size,
+        'columns': columns,
+        'has_abstract_count': aggregates.has_abstract,
+        'memory': memory_totals
+    }
+
+def export_cleaned_store(store, output_file='cleaned_metadata.csv', cache_file=CACHE_FILE, index_dir=INDEX_DIR,
+                         text_dir=TEXT_DIR, sketch_file=SKETCH_FILE):
+    """Write the live rows of a cleaned store to output_file, its Parquet cache, the text
+    store and the journal sketch, one segment at a time, and (unless index_dir is None) merge
+    the segments' search indexes.
+    
+    Returns the memory report summed over the segments and the number of columns.
+    """
+    cache_writer = ColumnarCacheWriter(cache_file)
+    text_writer = TextStoreWriter(text_dir)
+    journal_sketch = JournalSketch()
+    memory_totals = None
+    columns = 0
+    first = True
+    for df in store.iter_live():
+        write_cleaned_csv(df, output_file, append=not first)
+        cache_writer.write(df)
+        text_writer.add(df)
+        journal_sketch.add(df)
+        segment_memory = memory_report(df)
+        if memory_totals is None:
+            memory_totals = segment_memory
+        else:
+            memory_totals[['bytes_before', 'bytes_after']] += segment_memory[['bytes_before', 'bytes_after']]
+        columns = len(df.columns)
+        first = False
+    if first:
+        # No live rows: an empty file with the columns of the last snapshot
+        pd.DataFrame(columns=store.columns or []).to_csv(output_file, index=False)
+    if cache_writer.close():
+        print(f"Columnar cache written to '{cache_file}'")
+    if text_writer.close():
+        print(f"Text store written to '{text_dir}/'")
+    journal_sketch.save(sketch_file)
+    print(f"Journal sketch written to '{sketch_file}'")
+    if index_dir is not None:
+        merge_search_indexes(store.search_index_parts(), index_dir)
+        print(f"Search index written to '{index_dir}/'")
+    return memory_totals, columns
+
+class CleanedTotals:
+    """Running statistics of the cleaned chunks written so far, for the analysis section of the report"""
+    
+    def __init__(self):
+        self.year_counts = Counter()
+        self.journals = JournalSketch()
+        self.abstract_words = 0
+        self.has_abstract_count = 0
+        self.rows = 0
+        self.columns = 0
+        self.memory = None
+    
+    def add(self, chunk_clean):
+        self.rows += len(chunk_clean)
+        self.year_counts.update(chunk_clean['year'].dropna().astype(int).value_counts().to_dict())
+        self.journals.add(chunk_clean)
+        self.abstract_words += int(chunk_clean['abstract_word_count'].sum())
+        self.has_abstract_count += int(chunk_clean['has_abstract'].sum())
+        self.columns = len(chunk_clean.columns)
+        chunk_memory = memory_report(chunk_clean)
+        if self.memory is None:
+            self.memory = chunk_memory
+        else:
+            self.memory[['bytes_before', 'bytes_after']] += chunk_memory[['bytes_before', 'bytes_after']]
     
+    def stats(self, journal_column=None):
+        """Print the cleaned data analysis; returns the same statistics dict as analyze_cleaned_data().
+        
+        journal_column() returns the journal column of the written data, which is counted
+        exactly if the journal sketch can't guarantee its top 10.
+        """
+        year_series = pd.Series(self.year_counts, dtype='int64').sort_index()
+        top_journals, exact = self.journals.top(10)
+        if not exact and journal_column is not None:
+            top_journals, exact = top_counts(journal_column().value_counts(sort=False), 10), True
+        avg_words = self.abstract_words / self.rows if self.rows else 0.0
+        print_cleaned_stats(year_series, top_journals, avg_words, self.has_abstract_count, self.rows,
+                            journals_exact=exact)
+        print_memory_report(self.memory)
+        
+        return {
+            'year_counts': year_series,
+            'top_journals': top_journals,
+            'avg_abstract_length': avg_words,
+            'rows': self.rows,
+            'columns': self.columns,
+            'has_abstract_count': self.has_abstract_count,
+            'memory': self.memory,
+            'journal_sketch': self.journals
+        }
+
+def print_cleaning_summary(original_size, cleaned):
+    """Print the rows kept out of original_size (cleaned is a CleanedTotals)"""
+    retention_rate = (cleaned.rows / original_size) * 100 if original_size else 0.0
     print(f"\nCLEANING SUMMARY:")
     print(f"   Original size: {original_size:,} rows")
-    print(f"   Final size: {final_size:,} rows")
+    print(f"   Final size: {cleaned.rows:,} rows")
     print(f"   Retention rate: {retention_rate:.1f}%")
-    print(f"   Columns in cleaned data: {len(df_clean.columns)}")
+    print(f"   Columns in cleaned data: {cleaned.columns}")
+
+def print_cleaned_stats(year_counts, top_journals, avg_words, has_abstract_count, total_rows, journals_exact=True):
+    """Print the year, journal and abstract sections of the cleaned data analysis"""
+    if not year_counts.empty:
+        print("\nPUBLICATION YEARS:")
+        for year, count in year_counts.head(10).items():  # Show top 10 years
+            if pd.notnull(year):
+                print(f"   {int(year)}: {count:,} papers")
+    else:
+        print("No valid years found")
     
-    return df_clean
+    print(f"\nTOP 10 JOURNALS:" if journals_exact else f"\nTOP 10 JOURNALS (approximate, counts are upper bounds):")
+    for journal, count in top_journals.items():
+        print(f"   {journal}: {count:,} papers")
+    
+    print(f"\nABSTRACT STATISTICS:")
+    print(f"   Average abstract length: {avg_words:.1f} words")
+    print(f"   Papers with abstracts: {has_abstract_count:,}")
+    print(f"   Papers without abstracts: {total_rows - has_abstract_count:,}")
+
+def print_memory_report(report):
+    """Print the bytes per column before and after the dtype optimization"""
+    if report is None or report.empty:
+        return
+    print(f"\nMEMORY BY COLUMN (before -> after dtype optimization):")
+    for col, row in report.iterrows():
+        print(f"   {col} ({row['dtype']}): {row['bytes_before'] / 1e6:,.2f} MB -> "
+              f"{row['bytes_after'] / 1e6:,.2f} MB")
+    before, after = report['bytes_before'].sum(), report['bytes_after'].sum()
+    saved = (1 - after / before) * 100 if before else 0.0
+    print(f"   Total: {before / 1e6:,.2f} MB -> {after / 1e6:,.2f} MB ({saved:.1f}% saved)")
 
 def analyze_cleaned_data(df_clean):
     print("\nANALYZING CLEANED DATA")
@@ -106,63 +585,151 @@ def analyze_cleaned_data(df_clean):
     valid_years = df_clean['year'].notnull()
     if valid_years.any():
         year_counts = df_clean[valid_years]['year'].value_counts().sort_index()
-        print("\nPUBLICATION YEARS:")
-        for year, count in year_counts.head(10).items():  # Show top 10 years
-            if pd.notnull(year):
-                print(f"   {int(year)}: {count:,} papers")
     else:
-        print("No valid years found")
+        year_counts = pd.Series()
     
-    # Journal statistics
-    top_journals = df_clean['journal'].value_counts().head(10)
-    print(f"\nTOP 10 JOURNALS:")
-    for journal, count in top_journals.items():
-        print(f"   {journal}: {count:,} papers")
+    # Journal statistics: the top 10 from a heavy-hitters sketch, which is saved with the
+    # cleaned data so later views don't count every journal again
+    journal_sketch = JournalSketch.from_frame(df_clean)
+    top_journals, _ = top_journal_counts(df_clean['journal'], 10, journal_sketch)
     
     # Abstract statistics
     avg_words = df_clean['abstract_word_count'].mean()
     has_abstract_count = df_clean['has_abstract'].sum()
-    print(f"\nABSTRACT STATISTICS:")
-    print(f"   Average abstract length: {avg_words:.1f} words")
-    print(f"   Papers with abstracts: {has_abstract_count:,}")
-    print(f"   Papers without abstracts: {len(df_clean) - has_abstract_count:,}")
+    
+    print_cleaned_stats(year_counts, top_journals, avg_words, has_abstract_count, len(df_clean))
+    
+    memory = memory_report(df_clean)
+    print_memory_report(memory)
     
     return {
-        'year_counts': year_counts if valid_years.any() else pd.Series(),
+        'year_counts': year_counts,
         'top_journals': top_journals,
-        'avg_abstract_length': avg_words
+        'avg_abstract_length': avg_words,
+        'rows': len(df_clean),
+        'columns': len(df_clean.columns),
+        'has_abstract_count': int(has_abstract_count),
+        'memory': memory,
+        'journal_sketch': journal_sketch
     }
 
+def save_cleaned_data(df_clean, output_file='cleaned_metadata.csv', index_dir=INDEX_DIR, journal_sketch=None):
+    """Write the cleaned CSV, its Parquet cache, the text store, the journal sketch (built from
+    df_clean unless given) and (unless index_dir is None) the search index"""
+    with span('save.csv', rows_in=len(df_clean)):
+        write_cleaned_csv(df_clean, output_file)
+    
+    # Typed columnar copy for the analysis stage and the dashboard
+    with span('save.columnar_cache', rows_in=len(df_clean)):
+        if write_columnar_cache(df_clean):
+            print(f"Columnar cache written to '{CACHE_FILE}'")
+    
+    # Titles and abstracts as one memory-mapped blob, read lazily by the dashboard
+    with span('save.text_store', rows_in=len(df_clean)):
+        if write_text_store(df_clean):
+            print(f"Text store written to '{TEXT_DIR}/'")
+    
+    # Heavy-hitters sketch of the journals, for top-N queries that don't count every journal
+    with span('save.journal_sketch', rows_in=len(df_clean)):
+        (journal_sketch or JournalSketch.from_frame(df_clean)).save()
+    print(f"Journal sketch written to '{SKETCH_FILE}'")
+    
+    # Inverted index for keyword search in the dashboard
+    if index_dir is not None:
+        with span('save.search_index', rows_in=len(df_clean)):
+            build_search_index(df_clean['title'], df_clean['abstract'], index_dir=index_dir)
+        print(f"Search index written to '{index_dir}/'")
+
+def write_cleaning_report(stats, report_file='cleaning_report.txt'):
+    """Write the cleaning report from the statistics returned by the cleaning stage"""
+    with open(report_file, 'w', encoding='utf-8') as f:
+        f.write("CORD-19 Data Cleaning Report\n")
+        f.write("=" * 40 + "\n")
+        f.write(f"Final dataset size: {stats['rows']:,} rows\n")
+        f.write(f"Columns: {stats['columns']}\n")
+        f.write(f"Average abstract length: {stats['avg_abstract_length']:.1f} words\n")
+        f.write(f"Papers with abstracts: {stats['has_abstract_count']:,}\n")
+        memory = stats.get('memory')
+        if memory is not None and not memory.empty:
+            f.write("\nMemory by column (bytes before -> after dtype optimization):\n")
+            for col, row in memory.iterrows():
+                f.write(f"  {col} ({row['dtype']}): {row['bytes_before']:,} -> {row['bytes_after']:,}\n")
+            f.write(f"  Total: {memory['bytes_before'].sum():,} -> {memory['bytes_after'].sum():,}\n")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean the CORD-19 metadata.csv file")
+    parser.add_argument('--stream', action='store_true',
+                        help="Clean the file in chunks instead of loading it whole")
+    parser.add_argument('--chunksize', type=int, default=100_000,
+                        help="Rows per chunk in streaming mode (default: 100,000)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Threads used for word counting (default: 1)")
+    parser.add_argument('--processes', type=int, default=1,
+                        help="Clean partitions of the file on this many processes (default: 1, no partitioning)")
+    parser.add_argument('--skip-index', action='store_true',
+                        help="Don't build the title/abstract search index")
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help="Also remove near-duplicate papers (MinHash/LSH over title + abstract)")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Only clean the papers added or changed since the last incremental run "
+                             f"(matched by cord_uid, kept in {STORE_DIR}/)")
+    parser.add_argument('--trace', default=None,
+                        help="Time every cleaning step and write the trace to this file "
+                             "(.json: Chrome trace format, otherwise JSON lines)")
+    parser.add_argument('--profile', action='append', default=[],
+                        help="Also run this step under cProfile (repeatable, '*' for all)")
+    args = parser.parse_args()
+    if args.incremental and (args.stream or args.near_duplicates):
+        parser.error("--incremental can't be combined with --stream or --near-duplicates")
+    if args.processes > 1 and (args.stream or args.incremental):
+        parser.error("--processes can't be combined with --stream or --incremental")
+    if args.trace or args.profile:
+        instrumentation.enable(args.trace, profile=args.profile)
+    
+    output_file = 'cleaned_metadata.csv'
     try:
-        # Load data with specific settings for mixed types
-        print("Loading metadata.csv...")
-        df = pd.read_csv('metadata.csv', low_memory=False)
-        print(f"Loaded {len(df):,} rows")
-        
-        # Clean data
-        df_clean = clean_data(df)
-        
-        # Analyze cleaned data
-        stats = analyze_cleaned_data(df_clean)
-        
-        # Save cleaned data
-        output_file = 'cleaned_metadata.csv'
-        df_clean.to_csv(output_file, index=False)
+        if args.incremental:
+            stats = clean_data_incremental('metadata.csv', output_file, workers=args.workers,
+                                           index_dir=None if args.skip_index else INDEX_DIR)
+        elif args.processes > 1:
+            stats = clean_data_parallel('metadata.csv', output_file, processes=args.processes,
+                                        workers=args.workers, index_dir=None if args.skip_index else INDEX_DIR,
+                                        near_duplicates=args.near_duplicates)
+        elif args.stream:
+            stats = clean_data_streaming('metadata.csv', output_file, chunksize=args.chunksize,
+                                         workers=args.workers,
+                                         index_dir=None if args.skip_index else INDEX_DIR,
+                                         near_duplicates=args.near_duplicates)
+        else:
+            # Load data with specific settings for mixed types
+            print("Loading metadata.csv...")
+            with span('load') as step:
+                df = pd.read_csv('metadata.csv', low_memory=False)
+                step.rows_out = len(df)
+            print(f"Loaded {len(df):,} rows")
+            
+            # Clean data
+            with span('clean_data', rows_in=len(df)) as step:
+                df_clean = clean_data(df, workers=args.workers, near_duplicates=args.near_duplicates)
+                step.rows_out = len(df_clean)
+            
+            # Analyze cleaned data
+            with span('analyze_cleaned_data', rows_in=len(df_clean)):
+                stats = analyze_cleaned_data(df_clean)
+            
+            # Save cleaned data, its columnar cache and the search index
+            with span('save_cleaned_data', rows_in=len(df_clean)):
+                save_cleaned_data(df_clean, output_file, index_dir=None if args.skip_index else INDEX_DIR,
+                                  journal_sketch=stats['journal_sketch'])
         print(f"\nCLEANED DATA saved to '{output_file}'")
         
         # Save cleaning report
-        with open('cleaning_report.txt', 'w', encoding='utf-8') as f:
-            f.write("CORD-19 Data Cleaning Report\n")
-            f.write("=" * 40 + "\n")
-            f.write(f"Final dataset size: {len(df_clean):,} rows\n")
-            f.write(f"Columns: {len(df_clean.columns)}\n")
-            f.write(f"Average abstract length: {stats['avg_abstract_length']:.1f} words\n")
-            f.write(f"Papers with abstracts: {df_clean['has_abstract'].sum():,}\n")
-            
+        write_cleaning_report(stats)
         print("CLEANING REPORT saved to 'cleaning_report.txt'")
         
     except Exception as e:
         print(f"ERROR during cleaning: {e}")
         import traceback
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+    
+    instrumentation.finish()
\ No newline at end of file
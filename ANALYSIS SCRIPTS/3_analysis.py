@@ -1,27 +1,82 @@
 # 3_analysis_fixed.py
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from wordcloud import WordCloud
-from collections import Counter
-import re
+from wordcloud import WordCloud, STOPWORDS
 import numpy as np
 import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from data_store import CSV_FILE, load_cleaned_data
+from delta_ingest import STORE_DIR, CleanedStore
+from word_frequency import WordFrequencyIndex
+from heavy_hitters import load_journal_sketch, top_journal_counts
+from text_store import TextStore, text_store_is_fresh
+from figure_cache import FigureCache, figure_key
+import instrumentation
+from instrumentation import span
 import warnings
 warnings.filterwarnings('ignore')
 
-def create_all_visualizations(df):
-    """Create all required visualizations for the assignment"""
-    print("CREATING ALL VISUALIZATIONS...")
-    
-    # Create figures directory
-    if not os.path.exists('figures'):
-        os.makedirs('figures')
+# Words left out of the word frequency chart and the word cloud
+STOP_WORDS = {
+    'this', 'that', 'with', 'from', 'have', 'were', 'been', 'their', 
+    'which', 'study', 'using', 'based', 'during', 'among', 'between',
+    'analysis', 'research', 'paper', 'article', 'journal', 'results'
+}
+
+# Where the figures are written
+FIGURES_DIR = 'figures'
+FIGURE_DPI = 300
+
+# Abstract length histogram: longer abstracts are left out as outliers
+MAX_ABSTRACT_LENGTH = 1000
+LENGTH_BINS = 50
+
+def compute_aggregates(df, texts=None, journal_sketch=None):
+    """Compute the small aggregates every figure is drawn from (titles are read from
+    texts, e.g. the text store, if given, otherwise from df; the top journals from
+    journal_sketch when it guarantees them, otherwise from df)"""
+    # Titles are tokenized once into per-partition counts (no joined string of all titles)
+    with span('aggregate.word_index', rows_in=len(df)):
+        word_index = WordFrequencyIndex.from_frame(df, texts=None if texts is None else texts.iter_texts('title'))
     
-    # 1. Publications over time
-    print("1. Creating publications over time plot...")
-    plt.figure(figsize=(12, 6))
-    yearly_counts = df['year'].value_counts().sort_index()
+    with span('aggregate.counts', rows_in=len(df)):
+        # Remove outliers for better visualization
+        abstract_lengths = df.loc[df['abstract_word_count'] <= MAX_ABSTRACT_LENGTH, 'abstract_word_count']
+        length_counts, length_edges = np.histogram(abstract_lengths, bins=LENGTH_BINS)
+        
+        return {
+            'total_papers': len(df),
+            'yearly_counts': df['year'].value_counts().sort_index(),
+            'top_journals': top_journal_counts(df['journal'], 15, journal_sketch)[0],
+            'common_words': word_index.top_words(20, STOP_WORDS),
+            # The word cloud only ever draws its 100 most frequent words
+            'cloud_words': dict(word_index.top_words(100, STOPWORDS | STOP_WORDS)),
+            'length_counts': length_counts,
+            'length_edges': length_edges,
+            'avg_abstract_length': abstract_lengths.mean()
+        }
+
+def aggregates_from_counts(counts):
+    """compute_aggregates() from the running counts of the incremental cleaned store
+    (see delta_ingest.RunningAggregates), without reading any cleaned row"""
+    lengths, papers = counts.length_counts(MAX_ABSTRACT_LENGTH)
+    length_counts, length_edges = np.histogram(lengths, bins=LENGTH_BINS, weights=papers)
+    return {
+        'total_papers': counts.rows,
+        'yearly_counts': counts.year_counts(),
+        'top_journals': counts.top_journals(15),
+        'common_words': counts.top_words(20, STOP_WORDS),
+        'cloud_words': dict(counts.top_words(100, STOPWORDS | STOP_WORDS)),
+        'length_counts': length_counts.astype(np.int64),
+        'length_edges': length_edges,
+        'avg_abstract_length': (lengths * papers).sum() / papers.sum() if papers.sum() else float('nan')
+    }
+
+def plot_publications_by_year(aggregates):
+    fig = plt.figure(figsize=(12, 6))
+    yearly_counts = aggregates['yearly_counts']
     plt.bar(yearly_counts.index, yearly_counts.values, color='skyblue', edgecolor='navy', alpha=0.8)
     plt.title('Number of COVID-19 Publications by Year', fontsize=14, fontweight='bold')
     plt.xlabel('Year')
@@ -29,104 +84,197 @@ def create_all_visualizations(df):
     plt.grid(axis='y', alpha=0.3)
     plt.xticks(rotation=45)
     plt.tight_layout()
-    plt.savefig('figures/publications_by_year.png', dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # 2. Top journals
-    print("2. Creating top journals plot...")
-    plt.figure(figsize=(12, 8))
-    top_journals = df['journal'].value_counts().head(15)
+    return fig
+
+def plot_top_journals(aggregates):
+    fig = plt.figure(figsize=(12, 8))
+    top_journals = aggregates['top_journals']
     colors = plt.cm.Set3(np.linspace(0, 1, len(top_journals)))
     top_journals.sort_values().plot(kind='barh', color=colors)
     plt.title('Top 15 Journals Publishing COVID-19 Research', fontsize=14, fontweight='bold')
     plt.xlabel('Number of Publications')
     plt.grid(axis='x', alpha=0.3)
     plt.tight_layout()
-    plt.savefig('figures/top_journals.png', dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # 3. Word frequency analysis
-    print("3. Creating word frequency plot...")
-    all_titles = ' '.join(df['title'].dropna().astype(str))
-    words = re.findall(r'\b[a-zA-Z]{4,}\b', all_titles.lower())
-    
-    stop_words = {
-        'this', 'that', 'with', 'from', 'have', 'were', 'been', 'their', 
-        'which', 'study', 'using', 'based', 'during', 'among', 'between',
-        'analysis', 'research', 'paper', 'article', 'journal', 'results'
-    }
-    
-    filtered_words = [word for word in words if word not in stop_words]
-    word_freq = Counter(filtered_words)
-    common_words = word_freq.most_common(20)
-    
-    words, counts = zip(*common_words)
+    return fig
+
+def plot_common_words(aggregates):
+    words, counts = zip(*aggregates['common_words'])
     
-    plt.figure(figsize=(12, 8))
+    fig = plt.figure(figsize=(12, 8))
     plt.barh(words, counts, color='lightgreen')
     plt.title('Most Frequent Words in Paper Titles', fontsize=14, fontweight='bold')
     plt.xlabel('Frequency')
     plt.gca().invert_yaxis()
     plt.grid(axis='x', alpha=0.3)
     plt.tight_layout()
-    plt.savefig('figures/common_words.png', dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # 4. Word cloud
-    print("4. Creating word cloud...")
-    plt.figure(figsize=(12, 6))
+    return fig
+
+def plot_wordcloud(aggregates):
+    fig = plt.figure(figsize=(12, 6))
     wordcloud = WordCloud(width=800, height=400, background_color='white', 
-                         max_words=100, colormap='viridis').generate(all_titles)
+                         max_words=100, colormap='viridis').generate_from_frequencies(
+                             aggregates['cloud_words'])
     plt.imshow(wordcloud, interpolation='bilinear')
     plt.axis('off')
     plt.title('Word Cloud of Paper Titles', fontsize=16, fontweight='bold')
     plt.tight_layout()
-    plt.savefig('figures/wordcloud.png', dpi=300, bbox_inches='tight')
-    plt.show()
-    
-    # 5. Abstract length distribution
-    print("5. Creating abstract length distribution...")
-    plt.figure(figsize=(12, 6))
-    # Remove outliers for better visualization
-    abstract_lengths = df[df['abstract_word_count'] <= 1000]['abstract_word_count']
-    plt.hist(abstract_lengths, bins=50, color='orange', edgecolor='black', alpha=0.7)
+    return fig
+
+def plot_abstract_length(aggregates):
+    fig = plt.figure(figsize=(12, 6))
+    edges = aggregates['length_edges']
+    plt.hist(edges[:-1], bins=edges, weights=aggregates['length_counts'],
+             color='orange', edgecolor='black', alpha=0.7)
     plt.title('Distribution of Abstract Word Count', fontsize=14, fontweight='bold')
     plt.xlabel('Word Count')
     plt.ylabel('Frequency')
-    plt.axvline(abstract_lengths.mean(), color='red', linestyle='--', 
-                label=f'Mean: {abstract_lengths.mean():.1f} words')
+    plt.axvline(aggregates['avg_abstract_length'], color='red', linestyle='--', 
+                label=f"Mean: {aggregates['avg_abstract_length']:.1f} words")
     plt.legend()
     plt.grid(alpha=0.3)
     plt.tight_layout()
-    plt.savefig('figures/abstract_length.png', dpi=300, bbox_inches='tight')
-    plt.show()
+    return fig
+
+# (file name, description, plotting function, aggregates it uses) for every figure
+FIGURES = [
+    ('publications_by_year', 'publications over time plot', plot_publications_by_year, ['yearly_counts']),
+    ('top_journals', 'top journals plot', plot_top_journals, ['top_journals']),
+    ('common_words', 'word frequency plot', plot_common_words, ['common_words']),
+    ('wordcloud', 'word cloud', plot_wordcloud, ['cloud_words']),
+    ('abstract_length', 'abstract length distribution', plot_abstract_length,
+     ['length_counts', 'length_edges', 'avg_abstract_length']),
+]
+
+def figure_path(name):
+    return os.path.join(FIGURES_DIR, f'{name}.png')
+
+def render_figure(name, plot, aggregates, dpi=FIGURE_DPI, show=False):
+    """Draw one figure, save it as figures/<name>.png and return the seconds it took"""
+    start = time.perf_counter()
+    with span(f'figure.{name}'):
+        with span(f'figure.{name}.draw'):
+            fig = plot(aggregates)
+        with span(f'figure.{name}.save', dpi=dpi):
+            fig.savefig(figure_path(name), dpi=dpi, bbox_inches='tight')
+        if show:
+            plt.show()
+        plt.close(fig)
+    return time.perf_counter() - start
+
+def _render_in_worker(name, plot, aggregates, dpi, trace=False):
+    """Process-pool entry point: always render headless.
+
+    Returns the seconds it took and, if trace is set, the worker's span records.
+    """
+    plt.switch_backend('Agg')
+    if trace:
+        instrumentation.enable()
+    elapsed = render_figure(name, plot, aggregates, dpi)
+    tracer = instrumentation.disable()
+    return elapsed, tracer.records if tracer is not None else []
+
+def render_all_figures(aggregates, batch=False, workers=None, use_cache=True):
+    """Write every figure in FIGURES to the figures folder.
+
+    In batch mode the figures are rendered headless (no plt.show()) and
+    concurrently in a process pool of `workers` processes. Figures whose
+    aggregates, dpi and plotting code are unchanged are copied from the
+    figure cache instead of being rendered again.
+    """
+    # Create figures directory
+    if not os.path.exists(FIGURES_DIR):
+        os.makedirs(FIGURES_DIR)
+    
+    # Reuse unchanged figures from the cache
+    cache = FigureCache() if use_cache else None
+    pending = []
+    for number, (name, description, plot, inputs) in enumerate(FIGURES, start=1):
+        key = figure_key(name, plot, {input_name: aggregates[input_name] for input_name in inputs},
+                         FIGURE_DPI)
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            with open(figure_path(name), 'wb') as f:
+                f.write(cached)
+            print(f"{number}. Reused cached {description}")
+        else:
+            pending.append((number, name, description, plot, key))
     
-    print("✅ ALL VISUALIZATIONS CREATED SUCCESSFULLY!")
+    def store(name, key):
+        if cache is not None:
+            with open(figure_path(name), 'rb') as f:
+                cache.put(key, f.read())
+    
+    if batch and pending:
+        plt.switch_backend('Agg')
+        tracer = instrumentation.active_tracer()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_render_in_worker, name, plot, aggregates, FIGURE_DPI,
+                                   trace=tracer is not None)
+                       for _, name, _, plot, _ in pending]
+            for (number, name, description, _, key), future in zip(pending, futures):
+                elapsed, records = future.result()
+                if tracer is not None:
+                    tracer.extend(records)
+                print(f"{number}. Created {description} in {elapsed:.2f}s")
+                store(name, key)
+    else:
+        for number, name, description, plot, key in pending:
+            print(f"{number}. Creating {description}...")
+            elapsed = render_figure(name, plot, aggregates, show=not batch)
+            store(name, key)
+            print(f"   done in {elapsed:.2f}s")
+
+def analysis_stats(aggregates):
+    """The aggregates the analysis report is written from"""
     return {
-        'yearly_counts': yearly_counts,
-        'top_journals': top_journals,
-        'common_words': common_words,
-        'avg_abstract_length': abstract_lengths.mean()
+        'total_papers': aggregates['total_papers'],
+        'yearly_counts': aggregates['yearly_counts'],
+        'top_journals': aggregates['top_journals'],
+        'common_words': aggregates['common_words'],
+        'avg_abstract_length': aggregates['avg_abstract_length']
     }
 
-def main():
-    # Load cleaned data
-    try:
-        df = pd.read_csv('cleaned_metadata.csv')
-        print(f"Loaded {len(df)} rows for analysis")
-    except FileNotFoundError:
-        print("ERROR: cleaned_metadata.csv not found! Run cleaning script first.")
-        return
+def create_all_visualizations(df, batch=False, workers=None, use_cache=True, aggregates=None, texts=None,
+                              journal_sketch=None):
+    """Create all required visualizations for the assignment (see render_all_figures).
     
-    # Create all visualizations
-    stats = create_all_visualizations(df)
+    aggregates, if given, are used instead of computing them from df (and texts and journal_sketch).
+    """
+    print("CREATING ALL VISUALIZATIONS...")
     
-    # Generate report
-    with open('analysis_report.txt', 'w') as f:
+    start = time.perf_counter()
+    if aggregates is None:
+        with span('compute_aggregates', rows_in=len(df)):
+            aggregates = compute_aggregates(df, texts, journal_sketch)
+        print(f"Aggregates computed in {time.perf_counter() - start:.2f}s")
+    
+    with span('render_all_figures'):
+        render_all_figures(aggregates, batch=batch, workers=workers, use_cache=use_cache)
+    
+    print(f"✅ ALL VISUALIZATIONS CREATED SUCCESSFULLY! ({time.perf_counter() - start:.2f}s)")
+    return analysis_stats(aggregates)
+
+# Columns used by the visualizations and the report
+ANALYSIS_COLUMNS = ['title', 'journal', 'year', 'abstract_word_count']
+
+def load_analysis_data():
+    """(cleaned frame, texts): the titles are streamed from the text store when it is up
+    to date (texts), otherwise they are loaded into the frame (texts is None)"""
+    if text_store_is_fresh(CSV_FILE):
+        texts = TextStore()
+        df = load_cleaned_data(columns=[col for col in ANALYSIS_COLUMNS if col != 'title'])
+        if 'title' in texts.columns and texts.rows == len(df):
+            return df, texts
+    return load_cleaned_data(columns=ANALYSIS_COLUMNS), None
+
+def write_analysis_report(stats, report_file='analysis_report.txt'):
+    """Write the analysis report from the statistics returned by create_all_visualizations()"""
+    years = stats['yearly_counts'].index
+    with open(report_file, 'w') as f:
         f.write("CORD-19 ANALYSIS REPORT\n")
         f.write("=" * 40 + "\n")
-        f.write(f"Total papers analyzed: {len(df)}\n")
-        f.write(f"Publication range: {int(df['year'].min())}-{int(df['year'].max())}\n")
+        f.write(f"Total papers analyzed: {stats['total_papers']}\n")
+        f.write(f"Publication range: {int(years.min())}-{int(years.max())}\n")
         f.write(f"Peak publication year: {stats['yearly_counts'].idxmax()} "
                 f"({stats['yearly_counts'].max()} papers)\n")
         f.write(f"Top journal: {stats['top_journals'].index[0]} "
@@ -134,8 +282,58 @@ def main():
         f.write(f"Most common word: '{stats['common_words'][0][0]}' "
                 f"({stats['common_words'][0][1]} appearances)\n")
         f.write(f"Average abstract length: {stats['avg_abstract_length']:.1f} words\n")
+
+def main(batch=False, workers=None, use_cache=True, incremental=False):
+    # The incremental cleaned store keeps the aggregates up to date, so no row is read
+    if incremental:
+        store = CleanedStore(STORE_DIR)
+        if store.columns is None:
+            print(f"ERROR: {STORE_DIR}/ not found! Run the cleaning script with --incremental first.")
+            return
+        print(f"Using the running aggregates of {store.aggregates.rows:,} papers in '{STORE_DIR}/'")
+        stats = create_all_visualizations(None, batch=batch, workers=workers, use_cache=use_cache,
+                                          aggregates=aggregates_from_counts(store.aggregates))
+        write_analysis_report(stats)
+        print("✅ ANALYSIS COMPLETE! Check the 'figures' folder for all visualizations.")
+        return
+    
+    # Load cleaned data (typed Parquet cache if fresh, CSV otherwise)
+    try:
+        with span('load_cleaned_data') as step:
+            df, texts = load_analysis_data()
+            step.rows_out = len(df)
+        print(f"Loaded {len(df)} rows for analysis")
+    except FileNotFoundError:
+        print("ERROR: cleaned_metadata.csv not found! Run cleaning script first.")
+        return
+    
+    # Create all visualizations
+    stats = create_all_visualizations(df, batch=batch, workers=workers, use_cache=use_cache, texts=texts,
+                                      journal_sketch=load_journal_sketch(CSV_FILE, len(df)))
+    
+    # Generate report
+    write_analysis_report(stats)
     
     print("✅ ANALYSIS COMPLETE! Check the 'figures' folder for all visualizations.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Create the CORD-19 figures and analysis report")
+    parser.add_argument('--batch', action='store_true',
+                        help="Render headless and in parallel, without showing the figures")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Processes used in batch mode (default: one per CPU)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Render every figure even if an identical one is cached")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Draw the figures from the running aggregates in {STORE_DIR}/ "
+                             f"(kept by 2_cleaning.py --incremental)")
+    parser.add_argument('--trace', default=None,
+                        help="Time every step and figure and write the trace to this file "
+                             "(.json: Chrome trace format, otherwise JSON lines)")
+    parser.add_argument('--profile', action='append', default=[],
+                        help="Also run this step under cProfile (repeatable, '*' for all)")
+    args = parser.parse_args()
+    if args.trace or args.profile:
+        instrumentation.enable(args.trace, profile=args.profile)
+    main(batch=args.batch, workers=args.workers, use_cache=not args.no_cache, incremental=args.incremental)
+    instrumentation.finish()
\ No newline at end of file
@@ -0,0 +1,143 @@
+# aggregate_cube.py
+"""Precomputed year x journal x abstract-length aggregate cube.
+
+AggregateCube.from_frame() groups the cleaned data once by (year, journal code,
+abstract word count) and keeps the paper count and abstract word-count sum of
+each group. Filters and the dashboard's summary numbers are then answered from
+the (much smaller) cube instead of scanning every row, so their cost depends on
+the number of distinct groups, not on the number of papers.
+
+Abstract lengths are kept exactly (one bucket per word count), so every answer,
+including the abstract-length histogram, is identical to the row-level one.
+"""
+import numpy as np
+import pandas as pd
+
+# Code used for rows without a publication year
+MISSING_YEAR = -1
+
+def cell_keys(df):
+    """Per-row cell coordinates: (years, journal codes, journal names, abstract lengths)"""
+    n = len(df)
+    if 'year' in df.columns:
+        years = df['year'].astype('Float64').fillna(MISSING_YEAR).astype(np.int32).to_numpy()
+    else:
+        years = np.full(n, MISSING_YEAR, dtype=np.int32)
+    if 'journal' in df.columns and isinstance(df['journal'].dtype, pd.CategoricalDtype):
+        journal_codes = df['journal'].cat.codes.to_numpy(dtype=np.int32)
+        journals = np.asarray(df['journal'].cat.categories, dtype=object)
+    elif 'journal' in df.columns:
+        journal_codes, journals = pd.factorize(df['journal'], sort=True)
+        journal_codes = journal_codes.astype(np.int32)
+        journals = np.asarray(journals, dtype=object)
+    else:
+        journal_codes, journals = np.full(n, -1, dtype=np.int32), np.array([], dtype=object)
+    if 'abstract_word_count' in df.columns:
+        lengths = df['abstract_word_count'].to_numpy(dtype=np.int64)
+    else:
+        lengths = np.zeros(n, dtype=np.int64)
+    return years, journal_codes, journals, lengths
+
+def cell_mask(years, journal_codes, lengths, journals, year_range=None, selected_journals=None,
+              length_range=None):
+    """Boolean mask of the cells inside an inclusive year range, a set of journal names
+    and an inclusive length range.
+
+    A year range excludes papers without a year; no journals means all journals.
+    """
+    mask = np.ones(len(years), dtype=bool)
+    if year_range:
+        mask &= (years != MISSING_YEAR) & (years >= year_range[0]) & (years <= year_range[1])
+    if selected_journals:
+        wanted = np.flatnonzero(np.isin(journals, list(selected_journals)))
+        mask &= np.isin(journal_codes, wanted)
+    if length_range:
+        mask &= (lengths >= length_range[0]) & (lengths <= length_range[1])
+    return mask
+
+class AggregateCube:
+    """Sparse cube: one entry per non-empty (year, journal, abstract length) cell"""
+
+    def __init__(self, years, journal_codes, lengths, counts, word_sums, journals):
+        self.years = years
+        self.journal_codes = journal_codes
+        self.lengths = lengths
+        self.counts = counts
+        self.word_sums = word_sums
+        self.journals = journals
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build the cube from a frame with year, journal and abstract_word_count columns"""
+        years, journal_codes, journals, lengths = cell_keys(df)
+        cells = pd.DataFrame({'year': years, 'journal': journal_codes, 'length': lengths})
+        grouped = cells.groupby(['year', 'journal', 'length'], sort=True)['length'].agg(['size', 'sum'])
+        index = grouped.index
+        return cls(
+            years=index.get_level_values('year').to_numpy(dtype=np.int32),
+            journal_codes=index.get_level_values('journal').to_numpy(dtype=np.int32),
+            lengths=index.get_level_values('length').to_numpy(dtype=np.int64),
+            counts=grouped['size'].to_numpy(dtype=np.int64),
+            word_sums=grouped['sum'].to_numpy(dtype=np.int64),
+            journals=journals
+        )
+
+    def __len__(self):
+        """Number of non-empty cells"""
+        return len(self.counts)
+
+    def _subset(self, mask):
+        return AggregateCube(self.years[mask], self.journal_codes[mask], self.lengths[mask],
+                             self.counts[mask], self.word_sums[mask], self.journals)
+
+    def filter(self, year_range=None, journals=None, length_range=None):
+        """Cells inside an inclusive year range, a set of journal names and a length range"""
+        mask = cell_mask(self.years, self.journal_codes, self.lengths, self.journals,
+                         year_range, journals, length_range)
+        return self._subset(mask)
+
+    def total(self):
+        """Number of papers"""
+        return int(self.counts.sum())
+
+    def unique_journals(self):
+        return len(np.unique(self.journal_codes[self.journal_codes >= 0]))
+
+    def years_covered(self):
+        return len(np.unique(self.years[self.years != MISSING_YEAR]))
+
+    def year_range(self):
+        """(first, last) publication year, or None if no paper has a year"""
+        years = self.years[self.years != MISSING_YEAR]
+        return (int(years.min()), int(years.max())) if len(years) else None
+
+    def mean_length(self):
+        """Mean abstract word count (NaN when empty)"""
+        total = self.total()
+        return self.word_sums.sum() / total if total else float('nan')
+
+    def year_counts(self):
+        """Papers per year, sorted by year (papers without a year are left out)"""
+        known = self.years != MISSING_YEAR
+        counts = pd.Series(self.counts[known], name='count').groupby(self.years[known]).sum()
+        counts.index.name = 'year'
+        return counts
+
+    def journal_totals(self):
+        """Papers per journal, unsorted (journals without papers have 0); see
+        heavy_hitters.top_counts() for the top n without sorting every journal"""
+        known = self.journal_codes >= 0
+        counts = np.bincount(self.journal_codes[known], weights=self.counts[known],
+                             minlength=len(self.journals)).astype(np.int64)
+        return pd.Series(counts, index=pd.Index(self.journals, name='journal'), name='count')
+
+    def journal_counts(self):
+        """Papers per journal, most published first"""
+        counts = self.journal_totals().to_numpy()
+        order = np.argsort(-counts, kind='stable')
+        order = order[counts[order] > 0]
+        return pd.Series(counts[order], index=pd.Index(self.journals[order], name='journal'), name='count')
+
+    def length_histogram(self, bins=20):
+        """(counts, bin edges) of abstract word counts, as np.histogram over the rows would give"""
+        return np.histogram(self.lengths, bins=bins, weights=self.counts)
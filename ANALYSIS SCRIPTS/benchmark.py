@@ -0,0 +1,528 @@
+# benchmark.py
+"""Benchmark the pipeline on synthetic CORD-19 metadata of increasing size.
+
+generate_metadata() writes a deterministic metadata.csv look-alike: the same
+columns as the real file, titles and abstracts drawn from a Zipf-weighted
+vocabulary, publish_time in the formats CORD-19 mixes, Zipf-distributed
+journals, author lists and cord_uids that repeat (the same paper listed by
+several sources). Each size is generated once into benchmark_data/.
+
+Every size runs in a fresh process, which times and samples the peak resident
+memory of:
+
+    load          pd.read_csv of the raw file
+    clean         clean_data()
+    analyze       analyze_cleaned_data()
+    word_freq     WordFrequencyIndex.from_frame() + top_words()
+    dashboard     AggregateCube.from_frame() + sidebar filter/aggregate queries
+
+Results are written to a JSON file; --compare prints the change against an
+earlier results file and flags regressions.
+
+--scaling instead times the whole cleaning stage (load, clean, CSV, Parquet
+cache, text store and search index) serially and with clean_data_parallel()
+on each given number of processes, reports the speedup over the serial run and
+checks that the CSV, text store and search index are byte-for-byte the same,
+on the generated file and on a small one whose pubmed_id is only filled in its
+first half (so partitions that inferred their own dtypes would differ).
+
+    python benchmark.py --sizes 10k,100k
+    python benchmark.py --compare benchmark_results_before.json
+    python benchmark.py --sizes 1M --scaling 1,2,4,8
+
+--load-test N instead replays a scripted dashboard workload from N concurrent
+sessions (threads) against one process: every request searches, filters the
+cube and the row bitmaps and counts title words for its session's filter state,
+most sessions sitting on the default state. The same script runs once with each
+request computing its own results and once through a shared QueryService; the
+p50/p99 request latency of both is reported.
+
+    python benchmark.py --sizes 100k --load-test 20
+"""
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+from aggregate_cube import AggregateCube
+from bitmap_index import BitmapIndex, bitmap_count
+from heavy_hitters import top_counts
+from pipeline_graph import PeakMemory
+from query_service import QueryService, query_key
+from search_index import SearchIndex, build_search_index
+from word_frequency import WordFrequencyIndex
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1M': 1_000_000, '5M': 5_000_000}
+BENCHMARKS = ['load', 'clean', 'analyze', 'word_freq', 'dashboard']
+DATA_DIR = 'benchmark_data'
+RESULTS_FILE = 'benchmark_results.json'
+SEED = 19
+GENERATOR_CHUNK = 100_000
+DASHBOARD_QUERIES = 50
+
+# Rows of the file whose raw dtypes differ between its halves (--scaling identity check)
+MIXED_DTYPE_ROWS = 6_000
+
+# Load test: requests per session, and the share of them made on the default filters
+SESSION_REQUESTS = 20
+DEFAULT_STATE_SHARE = 0.6
+SEARCH_TERMS = ['covid', 'vaccine', 'children', '"intensive care"', 'mask OR distancing']
+
+# Slower (or a higher peak RSS) than the baseline by more than this counts as a regression
+TOLERANCE = 0.2
+
+# Most frequent first: the generator draws word i with probability ~ 1 / (i + 1)
+WORDS = np.array([
+    'the', 'of', 'and', 'in', 'with', 'for', 'to', 'a', 'on', 'from', 'by', 'was', 'were',
+    'this', 'study', 'analysis', 'results', 'using', 'among', 'during', 'between', 'based',
+    'coronavirus', 'covid', 'sars', 'patients', 'clinical', 'infection', 'respiratory',
+    'pneumonia', 'vaccine', 'treatment', 'outbreak', 'transmission', 'cases', 'hospital',
+    'severe', 'acute', 'syndrome', 'virus', 'viral', 'disease', 'health', 'public', 'model',
+    'cells', 'protein', 'spike', 'antibody', 'immune', 'response', 'children', 'mortality',
+    'risk', 'factors', 'symptoms', 'testing', 'diagnosis', 'epidemic', 'pandemic', 'china',
+    'wuhan', 'influenza', 'mers', 'therapy', 'drug', 'trial', 'care', 'intensive', 'lung',
+    'sequencing', 'genome', 'variant', 'receptor', 'ace2', 'mask', 'distancing', 'lockdown',
+    'mental', 'survey', 'workers', 'review', 'systematic', 'cohort', 'outcomes', 'data',
+])
+SURNAMES = np.array(['Wang', 'Li', 'Zhang', 'Smith', 'Garcia', 'Müller', 'Rossi', 'Kim', 'Nguyen',
+                     'Patel', 'Silva', 'Cohen', 'Jones', 'Chen', 'Liu', 'Yang', 'Brown', 'Dubois'])
+SOURCES = np.array(['PMC', 'Medline', 'WHO', 'Elsevier', 'MedRxiv', 'BioRxiv', 'ArXiv'])
+LICENSES = np.array(['cc-by', 'cc-by-nc', 'els-covid', 'no-cc', 'unk', 'medrxiv'])
+MONTHS = np.array(['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
+N_JOURNALS = 2_000
+
+def parse_size(label):
+    """'100k' -> 100000 (plain integers are accepted too)"""
+    if label in SIZES:
+        return SIZES[label]
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(label[-1].lower(), 1)
+    return int(float(label.rstrip('kKmM')) * multiplier)
+
+def _zipf_choice(rng, n_items, size, exponent=1.1):
+    """Indices in [0, n_items) whose frequencies follow a Zipf law"""
+    weights = 1.0 / np.arange(1, n_items + 1) ** exponent
+    return rng.choice(n_items, size=size, p=weights / weights.sum())
+
+def _join(items, lengths, sep=' '):
+    """One string per row, joining the next lengths[i] items"""
+    ends = np.cumsum(lengths)
+    return [sep.join(items[end - length:end]) for end, length in zip(ends, lengths)]
+
+def _texts(rng, size, mean_words, missing):
+    """Zipf-weighted word sequences of about mean_words words, a fraction of them missing"""
+    lengths = np.maximum(rng.poisson(mean_words, size), 1)
+    texts = pd.Series(_join(WORDS[_zipf_choice(rng, len(WORDS), lengths.sum())], lengths))
+    return texts.mask(rng.random(size) < missing)
+
+def _publish_times(rng, size):
+    """Dates in CORD-19's mix of formats, with some unparseable and missing values"""
+    years = pd.Series(np.where(rng.random(size) < 0.9,
+                               rng.choice([2019, 2020, 2021, 2022], size, p=[0.05, 0.45, 0.4, 0.1]),
+                               rng.integers(1970, 2019, size))).astype(str)
+    months = rng.integers(1, 13, size)
+    days = pd.Series(rng.integers(1, 29, size))
+    iso_month = years + '-' + pd.Series(months).map('{:02d}'.format)
+    formats = {
+        'YYYY-MM-DD': (0.70, iso_month + '-' + days.map('{:02d}'.format)),
+        'YYYY': (0.15, years),
+        'YYYY Mon DD': (0.07, years + ' ' + MONTHS[months - 1] + ' ' + days.astype(str)),
+        'YYYY Mon': (0.04, years + ' ' + MONTHS[months - 1]),
+        'YYYY-MM': (0.02, iso_month),
+        'unparseable': (0.02, 'Spring ' + years),
+    }
+    shares = [share for share, _ in formats.values()]
+    kind = rng.choice(len(formats), size, p=shares)
+    values = pd.Series(np.select([kind == i for i in range(len(formats))],
+                                 [values.to_numpy() for _, values in formats.values()]))
+    return values.mask(rng.random(size) < 0.01)
+
+def _metadata_chunk(rng, size, first_row):
+    """size rows of synthetic metadata; about 3% repeat an earlier row's paper"""
+    uids = pd.Series(np.char.mod('%08x', rng.integers(0, 2**32, size)))
+    titles = _texts(rng, size, 10, missing=0.003)
+    abstracts = _texts(rng, size, 150, missing=0.2)
+
+    # The same paper listed by another source: same cord_uid, title and abstract
+    repeats = np.flatnonzero(rng.random(size) < 0.03)
+    repeats = repeats[repeats > 0]
+    originals = (rng.random(len(repeats)) * repeats).astype(np.int64)
+    for column in (uids, titles, abstracts):
+        column.iloc[repeats] = column.iloc[originals].to_numpy()
+
+    n_authors = rng.integers(1, 9, size)
+    author_names = (SURNAMES[rng.integers(0, len(SURNAMES), n_authors.sum())].astype(object) + ', ' +
+                    np.array(list('ABCDEFGHJKLMNPRSTW'))[rng.integers(0, 18, n_authors.sum())] + '.')
+    journals = pd.Series(np.char.mod('Journal %d', _zipf_choice(rng, N_JOURNALS, size)))
+    row_ids = np.arange(first_row, first_row + size)
+    return pd.DataFrame({
+        'cord_uid': uids,
+        'sha': pd.Series(np.char.mod('%040x', row_ids)).mask(rng.random(size) < 0.4),
+        'source_x': SOURCES[rng.integers(0, len(SOURCES), size)],
+        'title': titles,
+        'doi': pd.Series(np.char.mod('10.1016/j.bench.%d', row_ids)).mask(rng.random(size) < 0.3),
+        'license': LICENSES[rng.integers(0, len(LICENSES), size)],
+        'abstract': abstracts,
+        'publish_time': _publish_times(rng, size),
+        'authors': pd.Series(_join(author_names, n_authors, sep='; ')).mask(rng.random(size) < 0.02),
+        'journal': journals.mask(rng.random(size) < 0.08),
+    })
+
+def generate_metadata(rows, output_file, seed=SEED):
+    """Write rows of synthetic metadata to output_file (the same file for the same rows and seed)"""
+    first_row = 0
+    while first_row < rows:
+        size = min(GENERATOR_CHUNK, rows - first_row)
+        rng = np.random.default_rng([seed, first_row])
+        chunk = _metadata_chunk(rng, size, first_row)
+        chunk.to_csv(output_file, mode='a' if first_row else 'w', header=not first_row, index=False)
+        first_row += size
+    return output_file
+
+def mixed_dtype_metadata(output_file, rows=MIXED_DTYPE_ROWS, seed=SEED):
+    """Write synthetic metadata with a pubmed_id column that is filled in the first half of
+    the rows only (read_csv infers int64 for that half and float64 for the whole file)"""
+    df = _metadata_chunk(np.random.default_rng([seed, rows]), rows, 0)
+    df['pubmed_id'] = pd.Series(np.arange(30_000_000, 30_000_000 + rows), dtype='Int64').mask(
+        np.arange(rows) >= rows // 2)
+    df.to_csv(output_file, index=False)
+    return output_file
+
+def data_file(rows, data_dir=DATA_DIR):
+    """Synthetic metadata file for rows, generated on first use"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'metadata_{rows}.csv')
+    if not os.path.exists(path):
+        print(f"Generating {rows:,} rows into '{path}'...")
+        tmp_path = f'{path}.tmp'
+        generate_metadata(rows, tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+def _measure(name, rows, func):
+    """Run func() quietly; returns (its result, a result record)"""
+    start = time.perf_counter()
+    with PeakMemory() as memory, contextlib.redirect_stdout(io.StringIO()):
+        result = func()
+    seconds = time.perf_counter() - start
+    record = {'rows': rows, 'benchmark': name, 'seconds': round(seconds, 4),
+              'peak_rss': memory.peak, 'rss_increase': None}
+    if memory.peak is not None and memory.start is not None:
+        record['rss_increase'] = memory.peak - memory.start
+    return result, record
+
+def run_size(rows, path, benchmarks=BENCHMARKS):
+    """Run the benchmarks on one generated file (in the calling process)"""
+    cleaning = importlib.import_module('2_cleaning')
+    analysis = importlib.import_module('3_analysis')
+    records = []
+
+    def measure(name, func):
+        result, record = _measure(name, rows, func)
+        if name in benchmarks:
+            records.append(record)
+            print(f"  {rows:>10,} {name:<11}{record['seconds']:>9.2f}s  "
+                  f"peak RSS {record['peak_rss'] / 1e6 if record['peak_rss'] else float('nan'):,.0f} MB")
+        return result
+
+    # Later benchmarks need the earlier results, so every step runs; only the selected ones are recorded
+    df = measure('load', lambda: pd.read_csv(path, low_memory=False))
+    df_clean = measure('clean', lambda: cleaning.clean_data(df))
+    del df
+    measure('analyze', lambda: cleaning.analyze_cleaned_data(df_clean))
+
+    def word_freq():
+        index = WordFrequencyIndex.from_frame(df_clean)
+        return index.top_words(20, stop_words=analysis.STOP_WORDS)
+    measure('word_freq', word_freq)
+
+    def dashboard():
+        # The app builds the cube once, then re-filters it on every sidebar change
+        cube = AggregateCube.from_frame(df_clean)
+        journals = list(cube.journal_counts().index)
+        rng = np.random.default_rng(SEED)
+        first, last = cube.year_range() or (2020, 2022)
+        for _ in range(DASHBOARD_QUERIES):
+            low = int(rng.integers(first, last + 1))
+            selected = cube.filter(year_range=(low, int(rng.integers(low, last + 1))),
+                                   journals=list(rng.choice(journals, size=min(3, len(journals)), replace=False)),
+                                   length_range=(0, int(rng.integers(100, 400))))
+            selected.year_counts(), top_counts(selected.journal_totals(), 10), selected.total(), selected.mean_length()
+    if 'dashboard' in benchmarks:
+        measure('dashboard', dashboard)
+    return records
+
+def _same_files(first, second):
+    """Return True if two files, or two directories of files, hold the same bytes"""
+    if os.path.isdir(first):
+        names = sorted(os.listdir(first))
+        return (os.path.isdir(second) and names == sorted(os.listdir(second)) and
+                all(_same_files(os.path.join(first, name), os.path.join(second, name)) for name in names))
+    with open(first, 'rb') as f, open(second, 'rb') as g:
+        return f.read() == g.read()
+
+def run_scaling(rows, path, processes):
+    """Time the cleaning stage serially, then on each number of processes; returns result records"""
+    cleaning = importlib.import_module('2_cleaning')
+    records = []
+    work_dir = tempfile.mkdtemp(prefix='scaling-')
+    try:
+        def outputs(name):
+            run_dir = os.path.join(work_dir, name)
+            os.makedirs(run_dir)
+            return (os.path.join(run_dir, 'cleaned_metadata.csv'), os.path.join(run_dir, 'cleaned_metadata.parquet'),
+                    os.path.join(run_dir, 'search_index'), os.path.join(run_dir, 'text_store'))
+
+        def serial(input_file, name):
+            csv_file, cache_file, index_dir, text_dir = outputs(name)
+            df_clean = cleaning.clean_data(pd.read_csv(input_file, low_memory=False))
+            cleaning.write_cleaned_csv(df_clean, csv_file)
+            cleaning.write_columnar_cache(df_clean, cache_file)
+            cleaning.write_text_store(df_clean, text_dir)
+            cleaning.build_search_index(df_clean['title'], df_clean['abstract'], index_dir=index_dir)
+            return csv_file, index_dir, text_dir
+
+        def parallel(input_file, name, count):
+            csv_file, cache_file, index_dir, text_dir = outputs(name)
+            cleaning.clean_data_parallel(input_file, csv_file, processes=count, cache_file=cache_file,
+                                         index_dir=index_dir, text_dir=text_dir,
+                                         sketch_file=os.path.join(os.path.dirname(csv_file), 'journal_sketch.json'))
+            return csv_file, index_dir, text_dir
+
+        def identical(first, second):
+            return all(_same_files(a, b) for a, b in zip(first, second))
+
+        mixed_file = mixed_dtype_metadata(os.path.join(work_dir, 'metadata_mixed_dtypes.csv'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            serial_mixed = serial(mixed_file, 'serial_mixed')
+
+        serial_outputs, record = _measure('clean_serial', rows, lambda: serial(path, 'serial'))
+        record.update(processes=0, speedup=1.0, identical=True)
+        records.append(record)
+        print(f"  {rows:>10,} {'serial':<11}{record['seconds']:>9.2f}s")
+
+        for count in processes:
+            parallel_outputs, record = _measure(f'clean_p{count}', rows,
+                                                lambda: parallel(path, f'processes_{count}', count))
+            with contextlib.redirect_stdout(io.StringIO()):
+                parallel_mixed = parallel(mixed_file, f'processes_{count}_mixed', count)
+            record.update(processes=count, speedup=round(records[0]['seconds'] / record['seconds'], 3),
+                          identical=(identical(serial_outputs, parallel_outputs)
+                                     and identical(serial_mixed, parallel_mixed)))
+            records.append(record)
+            print(f"  {rows:>10,} {f'{count} process' + ('es' if count > 1 else ''):<11}"
+                  f"{record['seconds']:>9.2f}s  speedup {record['speedup']:.2f}x  "
+                  f"{'identical output' if record['identical'] else 'OUTPUT DIFFERS'}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return records
+
+def _percentile_ms(latencies, q):
+    return round(float(np.percentile(latencies, q)) * 1000, 2) if latencies else None
+
+def run_load_test(rows, path, sessions, requests=SESSION_REQUESTS):
+    """Replay the scripted multi-session workload without and with a QueryService; returns result records"""
+    cleaning = importlib.import_module('2_cleaning')
+    analysis = importlib.import_module('3_analysis')
+    with contextlib.redirect_stdout(io.StringIO()):
+        df_clean = cleaning.clean_data(pd.read_csv(path, low_memory=False)).reset_index(drop=True)
+    cube = AggregateCube.from_frame(df_clean)
+    bitmaps = BitmapIndex.from_frame(df_clean)
+    word_index = WordFrequencyIndex.from_frame(df_clean)
+    index_dir = tempfile.mkdtemp(prefix='load-test-')
+    try:
+        build_search_index(df_clean['title'], df_clean['abstract'], index_dir=index_dir)
+        search_index = SearchIndex(index_dir)
+
+        # The filter states of the script: the default one, then popular searches and selections
+        journals = list(cube.journal_counts().index[:10])
+        first, last = cube.year_range() or (2020, 2022)
+        states = [dict(query='', year_range=(first, last), journals=journals, length_range=(0, 500))]
+        rng = np.random.default_rng(SEED)
+        for term in SEARCH_TERMS:
+            low = int(rng.integers(first, last + 1))
+            states.append(dict(query=term, year_range=(low, last),
+                               journals=list(rng.permutation(journals)[:int(rng.integers(1, len(journals) + 1))]),
+                               length_range=(0, int(rng.integers(100, 500)))))
+        weights = np.full(len(states), (1 - DEFAULT_STATE_SHARE) / (len(states) - 1))
+        weights[0] = DEFAULT_STATE_SHARE
+        scripts = [np.random.default_rng(SEED + session).choice(len(states), size=requests, p=weights)
+                   for session in range(sessions)]
+
+        def search(query):
+            rows_found = search_index.search(query)
+            searched = df_clean.iloc[rows_found]
+            return rows_found, AggregateCube.from_frame(searched), WordFrequencyIndex.from_frame(searched)
+
+        def request(service, state):
+            # What one dashboard rerun computes (see STREAMLIT APP/app.py)
+            filters = dict(year_range=state['year_range'], journals=state['journals'],
+                           length_range=state['length_range'])
+            get = ((lambda kind, compute, heavy=False, **key: compute()) if service is None else
+                   (lambda kind, compute, heavy=False, **key:
+                    service.get(query_key(kind, rows, **key), compute, heavy=heavy)))
+            rows_found, searched_cube, searched_words = None, cube, word_index
+            if state['query']:
+                rows_found, searched_cube, searched_words = get(
+                    'search', lambda: search(state['query']), heavy=True, query=state['query'])
+            get('cubes', lambda: searched_cube.filter(**filters), **state)
+            get('papers', lambda: bitmap_count(bitmaps.select(rows=rows_found, **filters)), **state)
+            get('words', lambda: searched_words.top_words(10, analysis.STOP_WORDS, **filters), **state)
+
+        records = []
+        for name, service in [('load_direct', None), ('load_service', QueryService())]:
+            latencies = []
+            lock = threading.Lock()
+            start_line = threading.Barrier(sessions)
+
+            def session(script):
+                start_line.wait()
+                for state in script:
+                    started = time.perf_counter()
+                    request(service, states[state])
+                    with lock:
+                        latencies.append(time.perf_counter() - started)
+
+            def run():
+                threads = [threading.Thread(target=session, args=(script,)) for script in scripts]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            _, record = _measure(name, rows, run)
+            record.update(sessions=sessions, requests=len(latencies),
+                          p50_ms=_percentile_ms(latencies, 50), p99_ms=_percentile_ms(latencies, 99),
+                          requests_per_second=round(len(latencies) / record['seconds'], 1))
+            if service is not None:
+                record['service'] = service.stats()
+                service.shutdown()
+            records.append(record)
+            print(f"  {rows:>10,} {name:<13}{sessions:>4} sessions  {record['requests_per_second']:>8,.1f} req/s  "
+                  f"p50 {record['p50_ms']:>8.2f} ms  p99 {record['p99_ms']:>8.2f} ms")
+        stats = records[-1]['service']
+        print(f"  {'':>10} query service: {stats.get('hits', 0):,} cached, {stats.get('coalesced', 0):,} "
+              f"joined in flight, {stats.get('misses', 0):,} computed")
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+    return records
+
+def _run_in_fresh_process(rows, path, benchmarks):
+    """run_size() in a new interpreter, so each size's peak RSS starts from a clean process.
+
+    A size that runs out of memory is recorded with an error instead of stopping the suite.
+    """
+    try:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+            return pool.submit(run_size, rows, path, benchmarks).result()
+    except (BrokenProcessPool, MemoryError) as e:
+        error = f"{type(e).__name__}: {e}" if str(e) else type(e).__name__
+        print(f"  {rows:>10,} FAILED ({error})")
+        return [{'rows': rows, 'benchmark': name, 'error': error} for name in benchmarks]
+
+def run_benchmarks(sizes, benchmarks=BENCHMARKS, data_dir=DATA_DIR, in_process=False, scaling=None,
+                   load_sessions=None):
+    """Generate (if needed) and benchmark every size; returns the results document.
+
+    With scaling (a list of process counts) the sizes run run_scaling() instead,
+    with load_sessions (a number of sessions) run_load_test().
+    """
+    records = []
+    for rows in sizes:
+        path = data_file(rows, data_dir)
+        if scaling:
+            records.extend(run_scaling(rows, path, scaling))
+        elif load_sessions:
+            records.extend(run_load_test(rows, path, load_sessions))
+        elif in_process:
+            records.extend(run_size(rows, path, benchmarks))
+        else:
+            records.extend(_run_in_fresh_process(rows, path, benchmarks))
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'seed': SEED,
+        'results': records,
+    }
+
+def compare_results(current, baseline, tolerance=TOLERANCE):
+    """Lines comparing time and peak RSS per (rows, benchmark) against a baseline"""
+    previous = {(r['rows'], r['benchmark']): r for r in baseline['results']}
+    lines = [f"{'Rows':>10} {'Benchmark':<11}{'Seconds':>9}{'Before':>9}{'Change':>9}"
+             f"{'Peak MB':>9}{'Before':>9}{'Change':>9}"]
+    regressions = 0
+    for record in current['results']:
+        old = previous.get((record['rows'], record['benchmark']))
+        if old is None or 'error' in record or 'error' in old:
+            continue
+        time_change = record['seconds'] / old['seconds'] - 1 if old['seconds'] else 0.0
+        rss_change = (record['peak_rss'] / old['peak_rss'] - 1
+                      if record['peak_rss'] and old['peak_rss'] else 0.0)
+        flag = time_change > tolerance or rss_change > tolerance
+        regressions += flag
+        lines.append(f"{record['rows']:>10,} {record['benchmark']:<11}{record['seconds']:>9.2f}"
+                     f"{old['seconds']:>9.2f}{time_change:>+9.0%}"
+                     f"{(record['peak_rss'] or 0) / 1e6:>9,.0f}{(old['peak_rss'] or 0) / 1e6:>9,.0f}"
+                     f"{rss_change:>+9.0%}{'  REGRESSION' if flag else ''}")
+    lines.append(f"{regressions} regression(s) beyond {tolerance:.0%}")
+    return lines
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic CORD-19 metadata")
+    parser.add_argument('--sizes', default=','.join(SIZES),
+                        help=f"Comma-separated row counts, e.g. 10k,100k (default: {','.join(SIZES)})")
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS),
+                        help=f"Comma-separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument('--output', default=RESULTS_FILE,
+                        help=f"Results JSON file (default: {RESULTS_FILE})")
+    parser.add_argument('--compare', default=None,
+                        help="Earlier results JSON file to compare against")
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help=f"Relative slowdown flagged as a regression (default: {TOLERANCE})")
+    parser.add_argument('--data-dir', default=DATA_DIR,
+                        help=f"Where generated files are kept (default: {DATA_DIR})")
+    parser.add_argument('--generate-only', action='store_true',
+                        help="Only generate the synthetic files")
+    parser.add_argument('--scaling', default=None,
+                        help="Comma-separated process counts: time parallel cleaning against serial, e.g. 1,2,4")
+    parser.add_argument('--load-test', type=int, default=None, metavar='SESSIONS',
+                        help="Replay the dashboard workload from this many concurrent sessions, "
+                             "without and with the shared query service")
+    args = parser.parse_args()
+
+    sizes = [parse_size(label) for label in args.sizes.split(',')]
+    if args.generate_only:
+        for rows in sizes:
+            print(data_file(rows, args.data_dir))
+    else:
+        benchmarks = args.benchmarks.split(',')
+        unknown = sorted(set(benchmarks) - set(BENCHMARKS))
+        if unknown:
+            parser.error(f"unknown benchmarks: {unknown}")
+        scaling = [int(count) for count in args.scaling.split(',')] if args.scaling else None
+        print("PARALLEL CLEANING SCALING" if scaling else
+              "DASHBOARD LOAD TEST" if args.load_test else "PIPELINE BENCHMARK")
+        print("=" * 40)
+        results = run_benchmarks(sizes, benchmarks, args.data_dir, scaling=scaling, load_sessions=args.load_test)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBENCHMARK RESULTS saved to '{args.output}'")
+        if args.compare:
+            with open(args.compare, encoding='utf-8') as f:
+                baseline = json.load(f)
+            print(f"\nCOMPARED WITH '{args.compare}':")
+            print("\n".join(compare_results(results, baseline, args.tolerance)))
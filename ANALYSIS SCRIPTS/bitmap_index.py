@@ -0,0 +1,167 @@
+# bitmap_index.py
+"""Row bitmaps for the dashboard's year, journal and abstract-length filters.
+
+A bitmap is a uint64 array with one bit per row of the loaded data, so
+combining filters is a word-wise AND over n/64 words instead of boolean
+masks over n rows (and no row of the frame is copied).
+
+- Year and abstract length are range filters. Each keeps its rows sorted by
+  value, so a range is a contiguous slice of that order (np.searchsorted on
+  the sorted values), plus prefix bitmaps at CHECKPOINTS evenly spaced ranks.
+  A range then costs two prefix lookups: one stored bitmap each, plus at most
+  n / CHECKPOINTS rows set on top of it.
+- Journal is an equality filter. Each journal's rows are stored as a sorted
+  posting list; journals holding more than n / DENSE_FRACTION rows also keep
+  a ready-made bitmap, so selecting any journal costs at most about n/64 words.
+
+The rows selected are identical to the boolean masks they replace.
+"""
+import numpy as np
+from aggregate_cube import MISSING_YEAR, cell_keys
+
+CHECKPOINTS = 32
+DENSE_FRACTION = 32
+
+def n_words(n_rows):
+    return (n_rows + 63) // 64
+
+def rows_to_bitmap(rows, n_rows):
+    """Bitmap of the given row positions (sorted or not)"""
+    bitmap = np.zeros(n_words(n_rows), dtype=np.uint64)
+    if len(rows):
+        rows = np.sort(np.asarray(rows, dtype=np.int64))
+        words = rows >> 6
+        bits = np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64))
+        starts = np.flatnonzero(np.r_[True, words[1:] != words[:-1]])
+        bitmap[words[starts]] = np.bitwise_or.reduceat(bits, starts)
+    return bitmap
+
+def bitmap_to_mask(bitmap, n_rows):
+    """Boolean mask of the rows whose bit is set"""
+    return np.unpackbits(bitmap.view(np.uint8), bitorder='little', count=n_rows).view(bool)
+
+def bitmap_rows(bitmap, n_rows):
+    """Row positions whose bit is set, in ascending order"""
+    return np.flatnonzero(bitmap_to_mask(bitmap, n_rows))
+
+def bitmap_count(bitmap):
+    """Number of set bits"""
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bitmap).sum())
+    return int(np.unpackbits(bitmap.view(np.uint8)).sum())
+
+class RangeBitmaps:
+    """Rows sorted by one numeric column, with prefix bitmaps for range lookups"""
+
+    def __init__(self, values, valid, n_rows, checkpoints=CHECKPOINTS):
+        self.n_rows = n_rows
+        rows = np.flatnonzero(valid)
+        order = np.argsort(values[rows], kind='stable')
+        self.rows = rows[order].astype(np.int32)
+        self.values = values[rows][order]
+        # prefixes[k] has the rows of ranks [0, ranks[k])
+        self.ranks = np.linspace(0, len(self.rows), checkpoints + 1).astype(np.int64)
+        self.prefixes = []
+        bitmap = np.zeros(n_words(n_rows), dtype=np.uint64)
+        for previous, rank in zip(np.r_[0, self.ranks[:-1]], self.ranks):
+            bitmap = bitmap | rows_to_bitmap(self.rows[previous:rank], n_rows)
+            self.prefixes.append(bitmap)
+
+    def _prefix(self, rank):
+        """Bitmap of the rows with sorted rank < rank"""
+        k = np.searchsorted(self.ranks, rank, side='right') - 1
+        return self.prefixes[k] | rows_to_bitmap(self.rows[self.ranks[k]:rank], self.n_rows)
+
+    def select(self, low, high):
+        """Bitmap of the rows with low <= value <= high"""
+        start = np.searchsorted(self.values, low, side='left')
+        end = np.searchsorted(self.values, high, side='right')
+        if end <= start:
+            return np.zeros(n_words(self.n_rows), dtype=np.uint64)
+        return self._prefix(end) & ~self._prefix(start)
+
+    def memory_bytes(self):
+        return self.rows.nbytes + self.values.nbytes + sum(prefix.nbytes for prefix in self.prefixes)
+
+class BitmapIndex:
+    """Filter bitmaps over the rows of one loaded DataFrame"""
+
+    def __init__(self, n_rows, years, lengths, journal_codes, journals):
+        self.n_rows = n_rows
+        self.has_year = years is not None
+        self.has_journal = journal_codes is not None
+        self.has_length = lengths is not None
+        self.years = RangeBitmaps(years, years != MISSING_YEAR, n_rows) if self.has_year else None
+        self.lengths = RangeBitmaps(lengths, np.ones(n_rows, dtype=bool), n_rows) if self.has_length else None
+        self.journals = journals
+        self.journal_lookup = {journal: code for code, journal in enumerate(journals)}
+        self.dense_journals = {}
+        if self.has_journal:
+            # Posting lists: row positions grouped by journal code (CSR)
+            order = np.argsort(journal_codes, kind='stable')
+            counts = np.bincount(journal_codes[journal_codes >= 0], minlength=len(journals))
+            self.journal_rows = order[np.count_nonzero(journal_codes < 0):].astype(np.int32)
+            self.journal_offsets = np.r_[0, np.cumsum(counts)]
+            for code in np.flatnonzero(counts > n_rows / DENSE_FRACTION):
+                self.dense_journals[code] = rows_to_bitmap(self._journal_postings(code), n_rows)
+
+    @classmethod
+    def from_frame(cls, df):
+        """Build the bitmaps of every filter column present in df"""
+        years, journal_codes, journals, lengths = cell_keys(df)
+        return cls(len(df),
+                   years if 'year' in df.columns else None,
+                   lengths if 'abstract_word_count' in df.columns else None,
+                   journal_codes if 'journal' in df.columns else None,
+                   journals)
+
+    def _journal_postings(self, code):
+        return self.journal_rows[self.journal_offsets[code]:self.journal_offsets[code + 1]]
+
+    def all_rows(self):
+        bitmap = np.full(n_words(self.n_rows), np.uint64(0xFFFFFFFFFFFFFFFF), dtype=np.uint64)
+        if self.n_rows % 64:
+            bitmap[-1] = np.uint64((1 << (self.n_rows % 64)) - 1)
+        return bitmap
+
+    def journal_bitmap(self, journals):
+        """Bitmap of the rows published in any of the given journals"""
+        bitmap = np.zeros(n_words(self.n_rows), dtype=np.uint64)
+        sparse = []
+        for journal in journals:
+            code = self.journal_lookup.get(journal)
+            if code is None:
+                continue
+            if code in self.dense_journals:
+                bitmap |= self.dense_journals[code]
+            else:
+                sparse.append(self._journal_postings(code))
+        if sparse:
+            bitmap |= rows_to_bitmap(np.concatenate(sparse), self.n_rows)
+        return bitmap
+
+    def select(self, year_range=None, journals=None, length_range=None, rows=None):
+        """Bitmap of the rows matching every given filter (and, if given, among rows).
+
+        Same rows as the dashboard's boolean masks: inclusive ranges, rows
+        without a year fail a year filter, an empty journal list is no filter.
+        """
+        bitmap = self.all_rows()
+        if length_range is not None and self.has_length:
+            bitmap &= self.lengths.select(*length_range)
+        if year_range and self.has_year:
+            bitmap &= self.years.select(*year_range)
+        if journals and self.has_journal:
+            bitmap &= self.journal_bitmap(journals)
+        if rows is not None:
+            bitmap &= rows_to_bitmap(rows, self.n_rows)
+        return bitmap
+
+    def memory_bytes(self):
+        total = sum(bitmap.nbytes for bitmap in self.dense_journals.values())
+        if self.has_journal:
+            total += self.journal_rows.nbytes + self.journal_offsets.nbytes
+        for ranges in (self.years, self.lengths):
+            if ranges is not None:
+                total += ranges.memory_bytes()
+        return total
@@ -0,0 +1,257 @@
+# data_store.py
+"""Typed columnar cache for cleaned_metadata.csv.
+
+The cleaning stage writes cleaned_metadata.parquet next to the CSV. Readers call
+load_cleaned_data() with the columns they need: the Parquet file is read with
+column projection when it exists and is at least as new as the CSV, otherwise
+the CSV is parsed and the cleaned dtypes are restored.
+
+In memory every cleaned frame uses the compact dtypes of DTYPE_PLAN (see
+optimize_dtypes()), and missing abstracts are missing values: the
+ABSTRACT_PLACEHOLDER text only exists in the CSV.
+"""
+import os
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, the CSV is always written
+    pa = None
+    pq = None
+
+CSV_FILE = 'cleaned_metadata.csv'
+CACHE_FILE = 'cleaned_metadata.parquet'
+
+# Columns whose values repeat a lot across rows are stored dictionary-encoded
+CATEGORY_COLUMNS = ['journal']
+
+# Compact in-memory dtypes of the cleaned columns (word counts are widened if a
+# value does not fit)
+DTYPE_PLAN = {
+    **{col: 'category' for col in CATEGORY_COLUMNS},
+    'year': 'Int16',
+    'month': 'Int8',
+    'abstract_word_count': 'uint32',
+    'title_word_count': 'uint16',
+    'has_abstract': 'bool',
+}
+
+# Columns that hold the same values as another column and share its data
+ALIAS_COLUMNS = {'paper_id': 'cord_uid'}
+
+# dtypes the cleaned columns had before DTYPE_PLAN (for the memory report)
+UNOPTIMIZED_DTYPES = {
+    **{col: str for col in CATEGORY_COLUMNS},
+    'year': 'Int64',
+    'month': 'Int64',
+    'abstract_word_count': 'int64',
+    'title_word_count': 'int64',
+}
+
+# Written to the CSV for papers without an abstract
+ABSTRACT_PLACEHOLDER = 'No abstract available'
+
+# With copy-on-write (pandas >= 3) an aliased column shares the other column's buffers
+_COPY_ON_WRITE = int(pd.__version__.split('.')[0]) >= 3
+
+def _widen(series, dtype):
+    """Unsigned integer dtype, widened until the values of series fit in it"""
+    dtype = np.dtype(dtype)
+    largest = series.max() if not series.empty else 0
+    while pd.notna(largest) and largest > np.iinfo(dtype).max:
+        dtype = np.dtype(f'uint{dtype.itemsize * 16}')
+    return dtype
+
+def optimize_dtypes(df):
+    """Convert a cleaned frame (in place) to the dtypes of DTYPE_PLAN.
+
+    A column of ALIAS_COLUMNS that equals its source column is re-pointed at
+    it, so e.g. paper_id doesn't keep a second copy of every cord_uid string.
+    """
+    for col, dtype in DTYPE_PLAN.items():
+        if col in df.columns:
+            if pd.api.types.is_unsigned_integer_dtype(dtype):
+                dtype = _widen(df[col], dtype)
+            df[col] = df[col].astype(dtype)
+    for col, source in ALIAS_COLUMNS.items():
+        if col in df.columns and source in df.columns and df[col].equals(df[source]):
+            df[col] = df[source]
+    return df
+
+def memory_report(df):
+    """Bytes per column of an optimized cleaned frame, and of the same data before optimization.
+
+    Returns a DataFrame with columns dtype, bytes_before and bytes_after.
+    """
+    rows = {}
+    for col in df.columns:
+        series = df[col]
+        after = int(series.memory_usage(index=False, deep=True))
+        before = after
+        if col in UNOPTIMIZED_DTYPES:
+            before = int(series.astype(UNOPTIMIZED_DTYPES[col]).memory_usage(index=False, deep=True))
+        elif col == 'abstract':
+            before = int(series.fillna(ABSTRACT_PLACEHOLDER).memory_usage(index=False, deep=True))
+        source = ALIAS_COLUMNS.get(col)
+        if source in df.columns and series.equals(df[source]):
+            after = 0 if _COPY_ON_WRITE else int(series.memory_usage(index=False, deep=False))
+        rows[col] = {'dtype': str(series.dtype), 'bytes_before': before, 'bytes_after': after}
+    return pd.DataFrame.from_dict(rows, orient='index')
+
+def write_cleaned_csv(df, csv_file=CSV_FILE, append=False, chunksize=100_000):
+    """Write (or append) cleaned rows to the CSV with missing abstracts spelled out as
+    ABSTRACT_PLACEHOLDER. Rows are written in slices, so the placeholder text is
+    only materialized for chunksize rows at a time.
+    """
+    for start in range(0, max(len(df), 1), chunksize):
+        part = df.iloc[start:start + chunksize]
+        if 'abstract' in part.columns:
+            part = part.assign(abstract=part['abstract'].fillna(ABSTRACT_PLACEHOLDER))
+        first = start == 0
+        part.to_csv(csv_file, index=False, mode='a' if append or not first else 'w',
+                    header=first and not append)
+
+def columnar_cache_available():
+    """Return True if pyarrow is installed and the Parquet cache can be used"""
+    return pq is not None
+
+def _to_table(df, schema=None):
+    """Convert a cleaned frame to an Arrow table, category-encoding repetitive columns"""
+    df = df.copy(deep=False)
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if schema is None:
+        # Use fixed-width dictionary indices so later chunks can share the schema
+        fields = []
+        for field in table.schema:
+            if pa.types.is_dictionary(field.type):
+                field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+            fields.append(field)
+        schema = pa.schema(fields, metadata=table.schema.metadata)
+    return table.cast(schema), schema
+
+class ColumnarCacheWriter:
+    """Write the Parquet cache incrementally, one cleaned chunk at a time"""
+
+    def __init__(self, cache_file=CACHE_FILE):
+        self.cache_file = cache_file
+        self.tmp_file = cache_file + '.tmp'
+        self.writer = None
+        self.schema = None
+
+    def write(self, df):
+        if not columnar_cache_available():
+            return
+        table, self.schema = _to_table(df, self.schema)
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.tmp_file, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        """Finish the file and move it into place (after the CSV, so it is not stale)"""
+        if self.writer is None:
+            return False
+        self.writer.close()
+        os.replace(self.tmp_file, self.cache_file)
+        return True
+
+def write_columnar_cache(df, cache_file=CACHE_FILE):
+    """Write the whole cleaned frame to the Parquet cache; returns False without pyarrow"""
+    writer = ColumnarCacheWriter(cache_file)
+    writer.write(df)
+    return writer.close()
+
+def cache_is_fresh(csv_file=CSV_FILE, cache_file=CACHE_FILE):
+    """The cache is valid if it exists and was written no earlier than the CSV"""
+    if not os.path.exists(cache_file):
+        return False
+    if not os.path.exists(csv_file):
+        return True
+    return os.path.getmtime(cache_file) >= os.path.getmtime(csv_file)
+
+def _restore_dtypes(df):
+    """Give a frame parsed from CSV the dtypes clean_data() produced"""
+    if 'publish_time' in df.columns:
+        df['publish_time'] = pd.to_datetime(df['publish_time'], errors='coerce', utc=True)
+    if 'abstract' in df.columns:
+        df['abstract'] = df['abstract'].mask(df['abstract'] == ABSTRACT_PLACEHOLDER)
+    return optimize_dtypes(df)
+
+def load_cleaned_data(columns=None, csv_file=CSV_FILE, cache_file=CACHE_FILE):
+    """Load the cleaned dataset, reading only `columns` (all columns if None).
+
+    Columns that don't exist in the file are ignored. Raises FileNotFoundError
+    if neither the cache nor the CSV exists.
+    """
+    if columnar_cache_available() and cache_is_fresh(csv_file, cache_file):
+        if columns is not None:
+            available = pq.read_schema(cache_file).names
+            columns = [col for col in available if col in columns]
+        return optimize_dtypes(pq.read_table(cache_file, columns=columns).to_pandas())
+
+    usecols = None if columns is None else (lambda col: col in columns)
+    df = pd.read_csv(csv_file, usecols=usecols)
+    return _restore_dtypes(df)
+
+def source_signature(csv_file=CSV_FILE, cache_file=CACHE_FILE):
+    """Identify the current version of the cleaned data by file size and mtime"""
+    signature = []
+    for path in (csv_file, cache_file):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((path, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+class SharedDataCache:
+    """Keep one loaded DataFrame per process and reload it when the files change.
+
+    get() is thread-safe, so concurrent sessions share a single load. The
+    returned frame is shared and must not be modified in place.
+    """
+
+    def __init__(self, columns=None, csv_file=CSV_FILE, cache_file=CACHE_FILE):
+        self.columns = columns
+        self.csv_file = csv_file
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.df = None
+        self.signature = None
+        self.hits = 0
+        self.misses = 0
+        self.last_load_seconds = 0.0
+        self.total_load_seconds = 0.0
+        self.memory_bytes = 0
+
+    def get(self):
+        signature = source_signature(self.csv_file, self.cache_file)
+        if not signature:
+            raise FileNotFoundError(f"{self.csv_file} not found")
+        with self.lock:
+            if self.df is not None and signature == self.signature:
+                self.hits += 1
+                return self.df
+            start = time.perf_counter()
+            df = load_cleaned_data(self.columns, self.csv_file, self.cache_file)
+            self.last_load_seconds = time.perf_counter() - start
+            self.total_load_seconds += self.last_load_seconds
+            self.misses += 1
+            self.memory_bytes = int(df.memory_usage(deep=True).sum())
+            self.df, self.signature = df, signature
+            return df
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'last_load_seconds': self.last_load_seconds,
+                'total_load_seconds': self.total_load_seconds,
+                'rows': 0 if self.df is None else len(self.df),
+                'memory_bytes': self.memory_bytes
+            }
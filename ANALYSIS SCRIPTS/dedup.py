@@ -0,0 +1,246 @@
+# dedup.py
+"""Duplicate removal for the cleaning stage, in two tiers.
+
+1. Title tier: titles are normalized (lowercased, punctuation removed,
+   whitespace collapsed) and hashed to 64 bits, so "COVID-19: a review" and
+   "Covid-19 - A Review " are the same paper. Only the sorted array of hashes
+   seen so far is kept (8 bytes per paper), never the title strings.
+2. Near-duplicate tier (optional): title + abstract are shingled into word
+   3-grams and summarized by a 64-value MinHash signature (one-permutation
+   hashing). LSH banding (16 bands of 4 values) proposes candidate pairs, which
+   are kept only if their estimated Jaccard similarity reaches the threshold.
+   Each row is compared with the first earlier row of each of its buckets, so
+   the work grows linearly with the number of rows, not quadratically.
+
+Deduplicator.filter() can be called on a whole frame or chunk by chunk; the
+first occurrence (in file order) is always the one that is kept, and the
+result does not depend on the chunk boundaries.
+"""
+import time
+from collections import Counter
+import numpy as np
+import pandas as pd
+
+# MinHash signature length and LSH banding (NUM_BANDS * BAND_ROWS == NUM_PERM)
+NUM_PERM = 64
+NUM_BANDS = 16
+BAND_ROWS = NUM_PERM // NUM_BANDS
+SHINGLE_SIZE = 3
+
+# Minimum estimated Jaccard similarity of title + abstract shingles
+NEAR_DUPLICATE_THRESHOLD = 0.8
+
+# Texts filling fewer MinHash bins than this have too few distinct shingles for a
+# reliable estimate; their exact duplicates are still caught by the title tier
+MIN_FILLED_BINS = 16
+
+_EMPTY = np.uint32(0xFFFFFFFF)
+_MIX = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9], dtype=np.uint64)
+
+def normalize_titles(titles):
+    """Lowercase, strip punctuation and collapse whitespace (titles that become empty are kept as is)"""
+    normalized = (titles.str.lower()
+                  .str.replace(r'[^\w\s]', '', regex=True)
+                  .str.replace(r'\s+', ' ', regex=True)
+                  .str.strip())
+    return normalized.where(normalized != '', titles)
+
+def title_hashes(titles):
+    """64-bit hash of every normalized title"""
+    return pd.util.hash_pandas_object(normalize_titles(titles), index=False).to_numpy()
+
+def _sorted_lookup(keys, values, queries):
+    """values[i] where keys[i] == query (keys sorted), or -1 for queries not in keys"""
+    result = np.full(len(queries), -1, dtype=np.int64)
+    if len(keys):
+        pos = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        found = keys[pos] == queries
+        result[found] = values[pos[found]]
+    return result
+
+class TitleHashSet:
+    """Sorted array of the normalized-title hashes seen so far (starting with seen)"""
+
+    def __init__(self, seen=()):
+        self.seen = np.unique(np.asarray(seen, dtype=np.uint64))
+
+    def add(self, hashes):
+        """Mask of the hashes not seen before (the first of equal hashes counts as new)"""
+        keep = np.zeros(len(hashes), dtype=bool)
+        keep[np.unique(hashes, return_index=True)[1]] = True
+        if len(self.seen):
+            pos = np.minimum(np.searchsorted(self.seen, hashes), len(self.seen) - 1)
+            keep &= self.seen[pos] != hashes
+        # The kept hashes are unique and not in seen: insert them in place of re-sorting everything
+        new = np.sort(hashes[keep])
+        self.seen = np.insert(self.seen, np.searchsorted(self.seen, new), new)
+        return keep
+
+    def memory_bytes(self):
+        return self.seen.nbytes
+
+def minhash_signatures(texts):
+    """(NUM_PERM MinHash values per text, mask of texts with enough shingles to compare)"""
+    n_docs = len(texts)
+    tokens = texts.reset_index(drop=True).str.lower().str.findall(r'[a-z0-9]+').explode().dropna()
+    doc = tokens.index.to_numpy(dtype=np.int64)
+    token_hashes = pd.util.hash_pandas_object(tokens, index=False).to_numpy()
+
+    # Word 3-gram hashes (texts with fewer than 3 words use their single words)
+    shingles, shingle_docs = [token_hashes], [doc]
+    if len(token_hashes) >= SHINGLE_SIZE:
+        span = len(token_hashes) - SHINGLE_SIZE + 1
+        same_doc = doc[:span] == doc[SHINGLE_SIZE - 1:]
+        combined = np.zeros(span, dtype=np.uint64)
+        for offset in range(SHINGLE_SIZE):
+            combined ^= token_hashes[offset:offset + span] * _MIX[offset]
+        long_docs = np.zeros(n_docs, dtype=bool)
+        long_docs[doc[:span][same_doc]] = True
+        shingles = [token_hashes[~long_docs[doc]], combined[same_doc]]
+        shingle_docs = [doc[~long_docs[doc]], doc[:span][same_doc]]
+    shingles = np.concatenate(shingles)
+    shingle_docs = np.concatenate(shingle_docs)
+
+    # One-permutation hashing: the high bits pick a bin, the low 32 bits compete for its minimum
+    signatures = np.full((n_docs, NUM_PERM), _EMPTY, dtype=np.uint32)
+    mixed = shingles * _MIX[0]
+    bins = ((mixed >> np.uint64(32)) % np.uint64(NUM_PERM)).astype(np.int64)
+    values = (mixed & np.uint64(0xFFFFFFFF)).astype(np.uint32)
+    np.minimum.at(signatures.reshape(-1), shingle_docs * NUM_PERM + bins, values)
+    filled_bins = (signatures != _EMPTY).sum(axis=1)
+    has_words = filled_bins > 0
+
+    # Densify: an empty bin copies a non-empty bin picked by a fixed pseudo-random
+    # sequence, so two texts agree on it with probability ~ their Jaccard similarity
+    sparse = np.flatnonzero(((signatures == _EMPTY) & has_words[:, None]).any(axis=1))
+    original = signatures[sparse]
+    filled = original.copy()
+    bins = np.arange(NUM_PERM, dtype=np.uint64)
+    live = np.arange(len(sparse))  # rows of filled that still have empty bins
+    # Pass number as a uint64 array: its products wrap around silently (numpy scalars warn)
+    attempt = np.zeros(1, dtype=np.uint64)
+    while len(live):
+        donor = (((bins * _MIX[1] + attempt * _MIX[2]) * _MIX[0]) >> np.uint64(32)) % np.uint64(NUM_PERM)
+        donated = original[live][:, donor.astype(np.int64)]
+        rows = filled[live]
+        fill = (rows == _EMPTY) & (donated != _EMPTY)
+        rows[fill] = donated[fill]
+        filled[live] = rows
+        live = live[(rows == _EMPTY).any(axis=1)]
+        attempt += 1
+    signatures[sparse] = filled
+    return signatures, filled_bins >= MIN_FILLED_BINS
+
+def band_keys(signatures):
+    """One 64-bit key per LSH band of every signature"""
+    keys = np.zeros((len(signatures), NUM_BANDS), dtype=np.uint64)
+    for band in range(NUM_BANDS):
+        for value in signatures[:, band * BAND_ROWS:(band + 1) * BAND_ROWS].T:
+            keys[:, band] = (keys[:, band] ^ value.astype(np.uint64)) * _MIX[1]
+    return keys
+
+class NearDuplicateIndex:
+    """Per-band first occurrences of the rows seen so far, with the MinHash signatures of
+    those rows only (no other earlier row can be a candidate)"""
+
+    def __init__(self, threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.threshold = threshold
+        # Signatures of the stored rows, one array per chunk; band_rows hold their stored ids
+        self.signature_chunks = []
+        self.chunk_starts = []
+        self.stored = 0
+        self.band_keys = [np.zeros(0, dtype=np.uint64) for _ in range(NUM_BANDS)]
+        self.band_rows = [np.zeros(0, dtype=np.int32) for _ in range(NUM_BANDS)]
+
+    def _stored_signatures(self, ids):
+        """Signatures of the given stored ids"""
+        signatures = np.empty((len(ids), NUM_PERM), dtype=np.uint32)
+        chunk = np.searchsorted(self.chunk_starts, ids, side='right') - 1
+        for number in np.unique(chunk):
+            mask = chunk == number
+            signatures[mask] = self.signature_chunks[number][ids[mask] - self.chunk_starts[number]]
+        return signatures
+
+    def add(self, titles, abstracts):
+        """Mask of the rows that are not near-duplicates of an earlier row"""
+        texts = titles.fillna('') + ' ' + abstracts.fillna('')
+        signatures, comparable = minhash_signatures(texts)
+        rows = np.arange(len(signatures))
+        keys = band_keys(signatures)
+
+        duplicate = np.zeros(len(signatures), dtype=bool)
+        claimed = np.zeros(len(signatures), dtype=bool)
+        new_keys = []
+        for band in range(NUM_BANDS):
+            band_key = keys[:, band]
+            # First earlier row with the same key: in an earlier chunk, else in this one
+            candidate = _sorted_lookup(self.band_keys[band], self.band_rows[band], band_key)
+            unique_keys, first, inverse = np.unique(band_key, return_index=True, return_inverse=True)
+            in_chunk = first[inverse]
+
+            check = np.flatnonzero((candidate >= 0) & comparable & ~duplicate)
+            if len(check):
+                agreement = (self._stored_signatures(candidate[check]) == signatures[check]).mean(axis=1)
+                duplicate[check[agreement >= self.threshold]] = True
+            check = np.flatnonzero((candidate < 0) & (in_chunk < rows) & comparable & ~duplicate)
+            if len(check):
+                agreement = (signatures[in_chunk[check]] == signatures[check]).mean(axis=1)
+                duplicate[check[agreement >= self.threshold]] = True
+
+            # The first row of every new key claims it (and gets its signature stored)
+            new = _sorted_lookup(self.band_keys[band], self.band_rows[band], unique_keys) < 0
+            new_keys.append((unique_keys[new], first[new]))
+            claimed[first[new]] = True
+
+        stored_rows = np.flatnonzero(claimed)
+        stored_ids = np.full(len(signatures), -1, dtype=np.int64)
+        stored_ids[stored_rows] = self.stored + np.arange(len(stored_rows))
+        if len(stored_rows):
+            self.signature_chunks.append(signatures[stored_rows])
+            self.chunk_starts.append(self.stored)
+            self.stored += len(stored_rows)
+        for band, (unique_keys, first) in enumerate(new_keys):
+            merged_keys = np.concatenate([self.band_keys[band], unique_keys])
+            merged_rows = np.concatenate([self.band_rows[band], stored_ids[first].astype(np.int32)])
+            order = np.argsort(merged_keys, kind='stable')
+            self.band_keys[band], self.band_rows[band] = merged_keys[order], merged_rows[order]
+        return ~duplicate
+
+    def memory_bytes(self):
+        return sum(chunk.nbytes for chunk in self.signature_chunks) + sum(
+            keys.nbytes + rows.nbytes for keys, rows in zip(self.band_keys, self.band_rows))
+
+class Deduplicator:
+    """Apply the title tier and (optionally) the near-duplicate tier, recording what each removed"""
+
+    def __init__(self, near_duplicates=False, threshold=NEAR_DUPLICATE_THRESHOLD):
+        self.titles = TitleHashSet()
+        self.near = NearDuplicateIndex(threshold) if near_duplicates else None
+        self.removed = Counter()
+        self.seconds = Counter()
+
+    def filter(self, df, hashes=None):
+        """Rows of df that are not duplicates of an earlier row (of this or an earlier call);
+        hashes are title_hashes(df['title']) if the caller already has them"""
+        start = time.perf_counter()
+        keep = self.titles.add(title_hashes(df['title']) if hashes is None else hashes)
+        df = df[keep]
+        self.removed['title'] += int((~keep).sum())
+        self.seconds['title'] += time.perf_counter() - start
+
+        if self.near is not None:
+            start = time.perf_counter()
+            keep = self.near.add(df['title'], df['abstract'])
+            df = df[keep]
+            self.removed['near'] += int((~keep).sum())
+            self.seconds['near'] += time.perf_counter() - start
+        return df
+
+    def report(self):
+        """[(tier description, rows removed, seconds, bytes of state)]"""
+        tiers = [('Normalized title hash', self.removed['title'], self.seconds['title'],
+                  self.titles.memory_bytes())]
+        if self.near is not None:
+            tiers.append((f'Near-duplicate (MinHash/LSH, Jaccard >= {self.near.threshold})',
+                          self.removed['near'], self.seconds['near'], self.near.memory_bytes()))
+        return tiers
@@ -0,0 +1,341 @@
+# delta_ingest.py
+"""Cleaned store for ingesting new CORD-19 releases incrementally
+(2_cleaning.py --incremental).
+
+CORD-19 was republished as snapshots that mostly repeat the previous one. The
+store keeps the cleaned rows of earlier runs, so a new metadata.csv only needs
+the rows that differ to be cleaned:
+
+    cleaned_store/
+        segment-00000.csv    cleaned rows written by one run (+ .parquet with pyarrow)
+        segment-00000.index  search index of those rows
+        state.pkl            manifest, segment sizes and running aggregates
+
+The manifest has one entry per raw row. A row's key is its cord_uid plus its
+occurrence number (a cord_uid repeats when several sources list the same
+paper); the entry holds a hash of the raw row's content, the hash of its
+normalized title and where its cleaned row is stored (or why it has none).
+
+diff() compares a new file with the manifest. A paper (cord_uid) with an added,
+changed or removed row is cleaned again as a whole; every other cleaned row
+stays where it is. Segments are append-only: the stored rows of changed and
+removed papers become dead and are dropped when their segment is compacted
+(once more than COMPACT_DEAD_FRACTION of it is dead).
+
+Duplicate titles: a cleaned row is dropped if a live row already holds its
+normalized title, so the earliest ingested copy is the one kept (a full clean
+keeps the first in file order). When the row holding a title is removed or
+changed, the unchanged rows dropped as its duplicates are cleaned again and
+the first of them takes its place.
+
+RunningAggregates keeps the counts the analysis figures are drawn from; rows
+are added to and subtracted from them, so they stay current without reading
+the whole store. Likewise the search index of the live rows is merged from the
+segments' indexes (search_index.merge_search_indexes), so only new rows are
+tokenized.
+"""
+import os
+import pickle
+import shutil
+from collections import Counter
+import numpy as np
+import pandas as pd
+from data_store import load_cleaned_data, optimize_dtypes, write_cleaned_csv, write_columnar_cache
+from dedup import TitleHashSet, title_hashes
+from heavy_hitters import top_counts
+from search_index import SearchIndex, build_search_index, merge_search_indexes
+from text_features import tokenize
+
+STORE_DIR = 'cleaned_store'
+STATE_FILE = 'state.pkl'
+
+# A segment is rewritten without its dead rows once they are more than this fraction of it
+COMPACT_DEAD_FRACTION = 0.5
+
+# Manifest 'segment' values of raw rows that have no stored cleaned row
+NO_TITLE = -1
+DUPLICATE = -2
+
+# Cleaned columns the running aggregates are computed from
+AGGREGATE_COLUMNS = ['title', 'journal', 'year', 'abstract_word_count', 'has_abstract']
+
+def row_keys(raw):
+    """(key, cord_uid) of every raw row; rows without a cord_uid share the uid ''"""
+    if 'cord_uid' not in raw.columns:
+        raise ValueError("incremental cleaning needs a cord_uid column")
+    uids = raw['cord_uid'].fillna('').astype(str).reset_index(drop=True)
+    occurrence = uids.groupby(uids, sort=False).cumcount()
+    return (uids + '#' + occurrence.astype(str)).to_numpy(dtype=object), uids.to_numpy(dtype=object)
+
+def content_hashes(raw):
+    """64-bit hash of every raw row's values"""
+    return pd.util.hash_pandas_object(raw, index=False).to_numpy()
+
+class RunningAggregates:
+    """Year, journal, abstract-length and title-word counts of the live cleaned rows"""
+
+    def __init__(self):
+        self.rows = 0
+        self.has_abstract = 0
+        self.years = Counter()
+        self.journals = Counter()
+        self.lengths = Counter()
+        self.words = Counter()  # keeps the order words first appeared in
+
+    def update(self, df, sign=1):
+        """Add the rows of df to the counts (sign=-1 subtracts them)"""
+        self.rows += sign * len(df)
+        self.has_abstract += sign * int(df['has_abstract'].sum())
+        for counter, values in ((self.years, df['year'].dropna().astype(int)),
+                                (self.journals, df['journal'].astype(str)),
+                                (self.lengths, df['abstract_word_count'].astype(int))):
+            for value, count in values.value_counts(sort=False).items():
+                counter[value] += sign * int(count)
+        for title in df['title']:
+            if title is None or title != title:
+                continue
+            for word in tokenize(title):
+                self.words[word] += sign
+
+    def year_counts(self):
+        counts = pd.Series({year: count for year, count in self.years.items() if count > 0},
+                           dtype='int64', name='count').sort_index()
+        counts.index.name = 'year'
+        return counts
+
+    def journal_counts(self):
+        """Papers per journal, most published first (ties in journal name order)"""
+        counts = pd.Series({journal: count for journal, count in self.journals.items() if count > 0},
+                           dtype='int64', name='count').sort_index()
+        counts.index.name = 'journal'
+        return counts.sort_values(ascending=False, kind='stable')
+
+    def top_journals(self, n):
+        """The n most published journals, as journal_counts().head(n) without sorting every journal"""
+        return top_counts(pd.Series(self.journals, dtype='int64'), n)
+
+    def length_counts(self, max_length=None):
+        """(sorted abstract lengths, papers with each length), optionally up to max_length"""
+        lengths = np.array(sorted(length for length, count in self.lengths.items() if count > 0),
+                           dtype=np.int64)
+        if max_length is not None:
+            lengths = lengths[lengths <= max_length]
+        return lengths, np.array([self.lengths[length] for length in lengths], dtype=np.int64)
+
+    def mean_length(self):
+        lengths, counts = self.length_counts()
+        return (lengths * counts).sum() / counts.sum() if counts.sum() else 0.0
+
+    def top_words(self, n, stop_words=()):
+        """The n most frequent words outside stop_words (ties in order of first appearance),
+        like WordFrequencyIndex.top_words()"""
+        vocabulary = np.array(list(self.words), dtype=object)
+        totals = np.array(list(self.words.values()), dtype=np.int64)
+        if stop_words and len(vocabulary):
+            totals[np.isin(vocabulary, list(stop_words))] = 0
+        candidates = np.flatnonzero(totals > 0)
+        order = candidates[np.lexsort((candidates, -totals[candidates]))][:n]
+        return [(vocabulary[i], int(totals[i])) for i in order]
+
+class CleanedStore:
+    """Append-only segments of cleaned rows plus the manifest of the raw rows they came from"""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.state_file = os.path.join(store_dir, STATE_FILE)
+        if os.path.exists(self.state_file):
+            with open(self.state_file, 'rb') as f:
+                state = pickle.load(f)
+            self.columns = state['columns']
+            self.manifest = state['manifest']
+            self.segments = state['segments']
+            self.aggregates = state['aggregates']
+        else:
+            self.reset()
+
+    def reset(self):
+        """Forget every stored row (the next diff() treats every raw row as added)"""
+        self.columns = None
+        self.manifest = pd.DataFrame({
+            'key': pd.Series(dtype=object), 'uid': pd.Series(dtype=object),
+            'content_hash': pd.Series(dtype=np.uint64), 'title_hash': pd.Series(dtype=np.uint64),
+            'segment': pd.Series(dtype=np.int32), 'row': pd.Series(dtype=np.int64)})
+        self.segments = {}  # segment id -> rows stored in its file
+        self.aggregates = RunningAggregates()
+
+    def segment_file(self, segment, extension='.csv'):
+        return os.path.join(self.store_dir, f'segment-{segment:05d}{extension}')
+
+    def read_segment(self, segment, columns=None):
+        """The cleaned rows stored in one segment (Parquet copy if fresh, else the CSV)"""
+        return load_cleaned_data(columns, self.segment_file(segment), self.segment_file(segment, '.parquet'))
+
+    def _write_segment(self, segment, df):
+        os.makedirs(self.store_dir, exist_ok=True)
+        write_cleaned_csv(df, self.segment_file(segment))
+        write_columnar_cache(df, self.segment_file(segment, '.parquet'))
+        self.segments[segment] = len(df)
+
+    def segment_index(self, segment):
+        """Directory of a segment's search index, built from its rows if missing"""
+        index_dir = self.segment_file(segment, '.index')
+        if not SearchIndex.exists(index_dir):
+            df = self.read_segment(segment, ['title', 'abstract'])
+            build_search_index(df['title'], df['abstract'], index_dir=index_dir)
+        return index_dir
+
+    def search_index_parts(self):
+        """merge_search_indexes() parts mapping every segment's live rows to their
+        position in iter_live()"""
+        parts = []
+        offset = 0
+        for segment in sorted(self.segments):
+            rows = self.live_rows(segment)
+            if len(rows):
+                row_map = np.full(self.segments[segment], -1, dtype=np.int64)
+                row_map[rows] = offset + np.arange(len(rows))
+                parts.append((self.segment_index(segment), row_map))
+                offset += len(rows)
+        return parts
+
+    def live_rows(self, segment):
+        """Positions of the live rows in a segment's file, in order"""
+        rows = self.manifest.loc[self.manifest['segment'] == segment, 'row'].to_numpy()
+        return np.sort(rows)
+
+    def diff(self, raw):
+        """Compare the raw rows of a new snapshot with the manifest.
+
+        Returns a dict with the rows' keys, uids and content hashes, the added,
+        changed and removed cord_uids, a mask of the raw rows to clean and a
+        mask of the manifest entries they replace.
+        """
+        keys, uids = row_keys(raw)
+        hashes = content_hashes(raw)
+        old = self.manifest
+        new = pd.DataFrame({'key': keys, 'uid': uids, 'content_hash': hashes})
+
+        # A paper is dirty if any of its rows was added, changed or removed
+        merged = new[['key', 'uid', 'content_hash']].merge(
+            old[['key', 'uid', 'content_hash']], on='key', how='outer', suffixes=('', '_old'))
+        differs = merged['content_hash'].isna() | merged['content_hash_old'].isna() | \
+            (merged['content_hash'] != merged['content_hash_old'])
+        dirty = set(merged.loc[differs, 'uid'].dropna()) | set(merged.loc[differs, 'uid_old'].dropna())
+        old_uids, new_uids = set(old['uid']), set(uids)
+        added = dirty - old_uids
+        removed = dirty - new_uids
+        changed = dirty - added - removed
+        replaced = old['uid'].isin(dirty).to_numpy(copy=True)
+
+        # Duplicates of a title whose holder is gone are cleaned again, so one of them can take over
+        stored = (old['segment'] >= 0).to_numpy()
+        freed = old.loc[replaced & stored, 'title_hash']
+        held = old.loc[~replaced & stored, 'title_hash']
+        promoted = ~replaced & (old['segment'] == DUPLICATE).to_numpy() & \
+            old['title_hash'].isin(freed).to_numpy() & ~old['title_hash'].isin(held).to_numpy()
+        replaced |= promoted
+        clean = new['uid'].isin(dirty).to_numpy() | new['key'].isin(old.loc[promoted, 'key']).to_numpy()
+
+        return {'keys': keys, 'uids': uids, 'hashes': hashes, 'added': added, 'changed': changed,
+                'removed': removed, 'promoted': int(promoted.sum()), 'clean': clean, 'replaced': replaced}
+
+    def live_titles(self, replaced):
+        """Title hashes held by the stored rows that stay live"""
+        held = self.manifest.loc[~replaced & (self.manifest['segment'] >= 0).to_numpy(), 'title_hash']
+        return held.to_numpy(dtype=np.uint64)
+
+    def ingest(self, raw, delta, clean, index=True):
+        """Clean the raw rows selected by diff(), store them as a new segment and
+        update the manifest and the aggregates.
+
+        clean(df) must return (cleaned rows, counts) like 2_cleaning.clean_frame();
+        raw must have a RangeIndex. With index, the new segment's search index is
+        built too. Returns the clean() counts plus the number of 'duplicates'
+        dropped and the 'segment' written (None if no row was kept).
+        """
+        replaced = delta['replaced']
+        raw_rows = np.flatnonzero(delta['clean'])
+        entries = pd.DataFrame({
+            'key': delta['keys'][raw_rows], 'uid': delta['uids'][raw_rows],
+            'content_hash': delta['hashes'][raw_rows],
+            'title_hash': np.zeros(len(raw_rows), dtype=np.uint64),
+            'segment': np.full(len(raw_rows), NO_TITLE, dtype=np.int32),
+            'row': np.zeros(len(raw_rows), dtype=np.int64)})
+
+        df_clean, counts = clean(raw.iloc[raw_rows])
+        cleaned = np.searchsorted(raw_rows, df_clean.index.to_numpy())
+        hashes = title_hashes(df_clean['title'])
+        entries.loc[cleaned, 'title_hash'] = hashes
+
+        # Titles already held by a live row (or by an earlier row of this delta) are duplicates
+        keep = TitleHashSet(self.live_titles(replaced)).add(hashes)
+        entries.loc[cleaned[~keep], 'segment'] = DUPLICATE
+        df_clean = optimize_dtypes(df_clean[keep])
+        counts['duplicates'] = int((~keep).sum())
+
+        # Take the replaced rows out of the aggregates, reading only their segments
+        gone = self.manifest[replaced & (self.manifest['segment'] >= 0).to_numpy()]
+        for segment, rows in gone.groupby('segment')['row']:
+            stored = self.read_segment(segment, AGGREGATE_COLUMNS)
+            self.aggregates.update(stored.iloc[np.sort(rows.to_numpy())], sign=-1)
+
+        counts['segment'] = None
+        if len(df_clean):
+            counts['segment'] = max(self.segments, default=-1) + 1
+            self._write_segment(counts['segment'], df_clean)
+            if index:
+                self.segment_index(counts['segment'])
+            self.aggregates.update(df_clean)
+            entries.loc[cleaned[keep], 'segment'] = counts['segment']
+            entries.loc[cleaned[keep], 'row'] = np.arange(len(df_clean))
+        self.columns = list(raw.columns)
+        self.manifest = pd.concat([self.manifest[~replaced], entries], ignore_index=True)
+        return counts
+
+    def compact(self):
+        """Rewrite the segments that are mostly dead rows; returns the ids rewritten"""
+        compacted = []
+        for segment, size in sorted(self.segments.items()):
+            rows = self.live_rows(segment)
+            if size == 0 or (size - len(rows)) / size <= COMPACT_DEAD_FRACTION:
+                continue
+            entries = self.manifest['segment'] == segment
+            index_dir = self.segment_file(segment, '.index')
+            if len(rows):
+                if SearchIndex.exists(index_dir):
+                    row_map = np.full(size, -1, dtype=np.int64)
+                    row_map[rows] = np.arange(len(rows))
+                    merge_search_indexes([(index_dir, row_map)], index_dir + '.tmp')
+                    shutil.rmtree(index_dir)
+                    os.replace(index_dir + '.tmp', index_dir)
+                self._write_segment(segment, self.read_segment(segment).iloc[rows])
+                # New position of every live row: its rank among the live rows
+                self.manifest.loc[entries, 'row'] = np.searchsorted(rows, self.manifest.loc[entries, 'row'])
+            else:
+                for extension in ('.csv', '.parquet'):
+                    if os.path.exists(self.segment_file(segment, extension)):
+                        os.remove(self.segment_file(segment, extension))
+                shutil.rmtree(index_dir, ignore_errors=True)
+                del self.segments[segment]
+            compacted.append(segment)
+        return compacted
+
+    def save(self):
+        """Write the state (after the segments, so it never points at a missing file)"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump({'columns': self.columns, 'manifest': self.manifest, 'segments': self.segments,
+                         'aggregates': self.aggregates}, f)
+        os.replace(tmp_file, self.state_file)
+
+    def live_count(self):
+        return int((self.manifest['segment'] >= 0).sum())
+
+    def iter_live(self, columns=None):
+        """The live cleaned rows, segment by segment, in the order they were ingested"""
+        for segment in sorted(self.segments):
+            rows = self.live_rows(segment)
+            if len(rows):
+                df = self.read_segment(segment, columns)
+                yield df if len(rows) == len(df) else df.iloc[rows]
@@ -0,0 +1,116 @@
+# figure_cache.py
+"""Content-addressed cache of rendered figure PNGs.
+
+A figure's key is a SHA-256 hash of everything that determines its pixels: the
+aggregates it is drawn from, the rendering parameters (dpi, size, ...) and the
+source code of the function that draws it. Unchanged charts are therefore
+served from the cache directory instead of being re-rendered, and editing a
+plotting function invalidates only that function's figures.
+
+The cache is bounded: once it holds more than max_bytes or max_entries, the
+least recently used files are deleted. 3_analysis.py and the Streamlit app share
+the same implementation (each with its own directory by default).
+"""
+import hashlib
+import inspect
+import os
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = 'figure_cache'
+
+def _update_hash(digest, obj):
+    """Feed a canonical byte representation of obj into digest"""
+    if isinstance(obj, pd.Series):
+        digest.update(b'series')
+        _update_hash(digest, obj.index.tolist())
+        _update_hash(digest, obj.tolist())
+    elif isinstance(obj, np.ndarray):
+        digest.update(f'ndarray{obj.dtype.str}{obj.shape}'.encode())
+        digest.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        digest.update(f'dict{len(obj)}'.encode())
+        for key in sorted(obj, key=repr):
+            _update_hash(digest, key)
+            _update_hash(digest, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        digest.update(f'{type(obj).__name__}{len(obj)}'.encode())
+        for item in obj:
+            _update_hash(digest, item)
+    elif isinstance(obj, (set, frozenset)):
+        # Set iteration order changes between runs, so hash the items sorted
+        digest.update(f'set{len(obj)}'.encode())
+        for item in sorted(obj, key=repr):
+            _update_hash(digest, item)
+    elif callable(obj) or inspect.ismodule(obj):
+        # Functions and modules are identified by their source code
+        digest.update(inspect.getsource(obj).encode())
+    else:
+        digest.update(f'{type(obj).__name__}:{obj!r};'.encode())
+
+def content_hash(*parts):
+    """SHA-256 hex digest of the canonical representation of parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        _update_hash(digest, part)
+    return digest.hexdigest()
+
+def figure_key(*parts):
+    """Hash the inputs, parameters and plotting function(s) of a figure"""
+    return content_hash(*parts)
+
+class FigureCache:
+    """Directory of <key>.png files with least-recently-used eviction"""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=200 * 1024 * 1024, max_entries=500):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.png')
+
+    def get(self, key):
+        """PNG bytes for key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """Store PNG bytes under key and evict old entries if the cache is full"""
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used files until the size and entry limits hold"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.png'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,202 @@
+# heavy_hitters.py
+"""Top journals from a bounded heavy-hitters sketch (Space-Saving).
+
+CORD-19 has tens of thousands of distinct journal strings, but every report
+and chart only shows the top 10 or 15. JournalSketch keeps a Space-Saving
+summary of at most `capacity` journals for all papers and one per
+publication year; the cleaning stage fills it chunk by chunk (or partition by
+partition) and writes it next to the cleaned CSV as SKETCH_FILE.
+
+Every tracked journal has an upper bound of its count and a bound of how much
+that may overestimate it; a journal that isn't tracked has at most `floor`
+papers. Summaries are mergeable: adding a chunk merges its exact counts in,
+and a year range is answered by merging the summaries of its years.
+
+top() says whether its ranking is guaranteed exact: every returned journal's
+count is known exactly and no other journal can reach the last one. When it
+isn't, callers fall back to exact counts (top_counts() only sorts the
+journals that can still make the top n, never the full distinct set).
+Ties are ranked by journal name, as AggregateCube.journal_counts() does.
+"""
+import heapq
+import json
+import os
+import numpy as np
+import pandas as pd
+from aggregate_cube import MISSING_YEAR, cell_keys
+
+SKETCH_FILE = 'journal_sketch.json'
+
+# Journals tracked per summary (all papers, and each year)
+CAPACITY = 512
+
+def top_counts(counts, n, index_name='journal'):
+    """The n largest positive values of counts (a Series), largest first, ties in index order"""
+    counts = counts[counts > 0]
+    items, values = counts.index.to_numpy(dtype=object), counts.to_numpy()
+    if len(values) > n > 0:
+        # Everything above the n-th largest value, and as many of the items equal to it
+        # as fit, first names first (there can be thousands of journals with 1 paper)
+        threshold = np.partition(values, len(values) - n)[len(values) - n]
+        above = values > threshold
+        tied = heapq.nsmallest(n - int(above.sum()), items[values == threshold])
+        items = np.concatenate([items[above], np.array(tied, dtype=object)])
+        values = np.concatenate([values[above], np.full(len(tied), threshold, dtype=values.dtype)])
+    ranked = sorted(zip(items.tolist(), values.tolist()), key=lambda item: (-item[1], item[0]))[:max(n, 0)]
+    return pd.Series([count for _, count in ranked], index=pd.Index([item for item, _ in ranked], name=index_name),
+                     name='count', dtype='int64')
+
+class SpaceSaving:
+    """Space-Saving summary: at most capacity counters, each an upper bound of its item's count"""
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.counts = {}  # item -> upper bound of its count
+        self.errors = {}  # item -> how much counts[item] may overestimate it
+        self.floor = 0    # upper bound of the count of every item that isn't tracked
+        self.total = 0
+
+    @classmethod
+    def exact(cls, counts, capacity=CAPACITY):
+        """Summary of exact counts (a Series): the top capacity of them are kept"""
+        summary = cls(capacity)
+        kept = top_counts(counts, capacity)
+        summary.counts = dict(zip(map(str, kept.index), kept.tolist()))
+        summary.errors = dict.fromkeys(summary.counts, 0)
+        positive = counts.to_numpy()[counts.to_numpy() > 0]
+        if len(positive) > capacity:
+            summary.floor = int(np.partition(positive, len(positive) - capacity - 1)[len(positive) - capacity - 1])
+        summary.total = int(positive.sum())
+        return summary
+
+    def add(self, counts):
+        """Count a batch of items, given as a Series of item -> occurrences"""
+        return self.merge(SpaceSaving.exact(counts, self.capacity))
+
+    def merge(self, other):
+        """Add another summary's counts to this one (in place); returns self"""
+        counts, errors = {}, {}
+        for item in self.counts.keys() | other.counts.keys():
+            counts[item] = self.counts.get(item, self.floor) + other.counts.get(item, other.floor)
+            errors[item] = self.errors.get(item, self.floor) + other.errors.get(item, other.floor)
+        self.floor += other.floor
+        self.total += other.total
+        if len(counts) > self.capacity:
+            ranked = sorted(counts, key=lambda item: (-counts[item], item))
+            self.floor = max(self.floor, counts[ranked[self.capacity]])
+            counts = {item: counts[item] for item in ranked[:self.capacity]}
+            errors = {item: errors[item] for item in counts}
+        self.counts, self.errors = counts, errors
+        return self
+
+    def top(self, n):
+        """(the n items with the highest counts as a Series, True if that ranking and its
+        counts are guaranteed exact)"""
+        top = top_counts(pd.Series(self.counts, dtype='int64'), n)
+        exact = all(self.errors[item] == 0 for item in top.index)
+        if len(top) < n:
+            exact &= self.floor == 0
+        elif n > 0:
+            last = int(top.iloc[-1])
+            exact &= last > self.floor
+            # Tracked items level with the last one must be exact too, for the tie order to hold
+            exact &= all(self.errors[item] == 0 for item, count in self.counts.items()
+                         if count == last and item not in top.index)
+        return top, bool(exact)
+
+    def to_dict(self):
+        return {'counts': self.counts, 'errors': self.errors, 'floor': self.floor, 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, data, capacity=CAPACITY):
+        summary = cls(capacity)
+        summary.counts, summary.errors = data['counts'], data['errors']
+        summary.floor, summary.total = data['floor'], data['total']
+        return summary
+
+class JournalSketch:
+    """Space-Saving summaries of the journals of all papers and of each publication year"""
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.all = SpaceSaving(capacity)
+        self.years = {}
+        self.rows = 0
+
+    @classmethod
+    def from_frame(cls, df, capacity=CAPACITY):
+        sketch = cls(capacity)
+        sketch.add(df)
+        return sketch
+
+    def add(self, df):
+        """Count the journals of the next rows of the cleaned data"""
+        self.rows += len(df)
+        years, journal_codes, journals, _ = cell_keys(df)
+        known = journal_codes >= 0
+        cells = pd.DataFrame({'year': years[known], 'journal': journal_codes[known]}).value_counts(sort=False)
+        for year, year_counts in cells.groupby(level='year', sort=True):
+            if year == MISSING_YEAR:
+                continue
+            names = journals[year_counts.index.get_level_values('journal').to_numpy()]
+            counts = pd.Series(year_counts.to_numpy(), index=names)
+            self.years.setdefault(int(year), SpaceSaving(self.capacity)).add(counts)
+        totals = cells.groupby(level='journal').sum()
+        self.all.add(pd.Series(totals.to_numpy(), index=journals[totals.index.to_numpy()]))
+        return self
+
+    def merge(self, other):
+        """Add the counts of a sketch of other rows (e.g. another partition); returns self"""
+        self.all.merge(other.all)
+        for year, summary in other.years.items():
+            self.years.setdefault(year, SpaceSaving(self.capacity)).merge(summary)
+        self.rows += other.rows
+        return self
+
+    def top(self, n, year_range=None):
+        """(top n journals with their paper counts, True if guaranteed exact), over all papers
+        or the papers of an inclusive year range"""
+        if year_range is None:
+            return self.all.top(n)
+        merged = SpaceSaving(self.capacity)
+        for year in sorted(self.years):
+            if year_range[0] <= year <= year_range[1]:
+                merged.merge(self.years[year])
+        return merged.top(n)
+
+    def save(self, sketch_file=SKETCH_FILE):
+        data = {'capacity': self.capacity, 'rows': self.rows, 'all': self.all.to_dict(),
+                'years': {str(year): summary.to_dict() for year, summary in sorted(self.years.items())}}
+        with open(sketch_file + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(sketch_file + '.tmp', sketch_file)
+
+    @classmethod
+    def load(cls, sketch_file=SKETCH_FILE):
+        with open(sketch_file, encoding='utf-8') as f:
+            data = json.load(f)
+        sketch = cls(data['capacity'])
+        sketch.rows = data['rows']
+        sketch.all = SpaceSaving.from_dict(data['all'], sketch.capacity)
+        sketch.years = {int(year): SpaceSaving.from_dict(summary, sketch.capacity)
+                        for year, summary in data['years'].items()}
+        return sketch
+
+def load_journal_sketch(csv_file, rows, sketch_file=SKETCH_FILE):
+    """The sketch written with csv_file, or None if it is missing, older than the CSV or
+    wasn't built from `rows` rows"""
+    if not os.path.exists(sketch_file):
+        return None
+    if os.path.exists(csv_file) and os.path.getmtime(sketch_file) < os.path.getmtime(csv_file):
+        return None
+    sketch = JournalSketch.load(sketch_file)
+    return sketch if sketch.rows == rows else None
+
+def top_journal_counts(journals, n, sketch=None):
+    """(top n journals with their paper counts, True if guaranteed exact): from the sketch when
+    it vouches for its ranking, otherwise counted exactly from the journal column (if given)"""
+    if sketch is not None:
+        top, exact = sketch.top(n)
+        if exact or journals is None:
+            return top, exact
+    return top_counts(journals.value_counts(sort=False), n), True
@@ -0,0 +1,244 @@
+# instrumentation.py
+"""Lightweight spans for seeing where time goes inside the scripts and the app.
+
+    with span('clean.1_missing_titles', rows_in=len(df)) as step:
+        df = df[df['title'].notna()]
+        step.rows_out = len(df)
+
+Tracing is off by default: span() then returns a shared no-op object, so an
+instrumented step costs one global lookup. enable() switches it on for the
+rest of the process. Each finished span records its wall time, CPU time
+(of the whole process, so worker threads count), rows in/out and the change
+in resident memory. The records can be written as JSON lines or in Chrome
+trace format (open the .json file in chrome://tracing or ui.perfetto.dev).
+
+Steps named in enable(profile=...) ('*' for all) are also run under cProfile;
+calls of the same step accumulate into profiles/<step>.prof.
+
+The scripts expose this as --trace FILE [--profile STEP]; the Streamlit app
+reads the CORD19_TRACE and CORD19_PROFILE environment variables.
+"""
+import cProfile
+import functools
+import json
+import os
+import threading
+import time
+from pipeline_graph import current_rss
+
+TRACE_ENV = 'CORD19_TRACE'
+PROFILE_ENV = 'CORD19_PROFILE'
+PROFILE_DIR = 'profiles'
+
+_tracer = None
+
+class _NullSpan:
+    """What span() returns while tracing is off"""
+    rows_out = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    """One timed step; set rows_out (or other attributes with set()) before it ends"""
+
+    def __init__(self, tracer, name, rows_in=None, attrs=None):
+        self.tracer = tracer
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.attrs = dict(attrs or {})
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.profiler = self.tracer._start_profile(self.name)
+        self.start_us = time.time_ns() // 1000
+        self.rss = current_rss()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        rss = current_rss()
+        self.tracer._stop_profile(self.name, self.profiler)
+        self.tracer._stack().pop()
+        record = {
+            'name': self.name, 'parent': self.parent, 'depth': self.depth,
+            'start_us': self.start_us, 'wall_s': wall, 'cpu_s': cpu,
+            'rows_in': self.rows_in, 'rows_out': self.rows_out,
+            'rss_delta': rss - self.rss if rss is not None and self.rss is not None else None,
+            'pid': os.getpid(), 'tid': threading.get_ident(),
+        }
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        if self.attrs:
+            record['attrs'] = self.attrs
+        self.record = record
+        self.tracer.add(record)
+        return False
+
+class Tracer:
+    """Collects span records and writes them out"""
+
+    def __init__(self, trace_file=None, profile=(), profile_dir=PROFILE_DIR):
+        self.trace_file = trace_file
+        self.profile = set(profile)
+        self.profile_dir = profile_dir
+        self.records = []
+        self._written = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profilers = {}
+        self._profiling = False
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _start_profile(self, name):
+        # Only one cProfile profiler can be active at a time, so nested steps are not profiled
+        if self._profiling or not (name in self.profile or '*' in self.profile):
+            return None
+        self._profiling = True
+        profiler = self._profilers.setdefault(name, cProfile.Profile())
+        profiler.enable()
+        return profiler
+
+    def _stop_profile(self, name, profiler):
+        if profiler is None:
+            return
+        profiler.disable()
+        self._profiling = False
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.profile_dir, f'{name}.prof'))
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def extend(self, records):
+        """Add records collected elsewhere (e.g. in a worker process)"""
+        with self._lock:
+            self.records.extend(records)
+
+    def write(self, trace_file=None):
+        """Write the records to trace_file (JSON lines are appended, a Chrome trace is rewritten)"""
+        trace_file = trace_file or self.trace_file
+        if trace_file is None:
+            return None
+        with self._lock:
+            if trace_file.endswith('.json'):
+                with open(trace_file, 'w', encoding='utf-8') as f:
+                    json.dump(chrome_trace(self.records), f)
+            else:
+                with open(trace_file, 'a', encoding='utf-8') as f:
+                    for record in self.records[self._written:]:
+                        f.write(json.dumps(record) + '\n')
+                self._written = len(self.records)
+        return trace_file
+
+def enable(trace_file=None, profile=(), profile_dir=PROFILE_DIR):
+    """Start tracing (replacing any active tracer) and return the tracer"""
+    global _tracer
+    _tracer = Tracer(trace_file, profile, profile_dir)
+    return _tracer
+
+def disable():
+    """Stop tracing; returns the tracer that was active (or None)"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+def active_tracer():
+    return _tracer
+
+def enable_from_env():
+    """Enable tracing if CORD19_TRACE is set, keeping an already active tracer"""
+    if _tracer is None and os.environ.get(TRACE_ENV):
+        profile = [name for name in os.environ.get(PROFILE_ENV, '').split(',') if name]
+        enable(os.environ[TRACE_ENV], profile)
+    return _tracer
+
+def span(name, rows_in=None, **attrs):
+    """Context manager timing one step (a no-op while tracing is off)"""
+    tracer = _tracer
+    if tracer is None:
+        return _NULL_SPAN
+    return Span(tracer, name, rows_in, attrs)
+
+def traced(name=None):
+    """Decorator: run every call of the function inside a span"""
+    def decorate(func):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return func(*args, **kwargs)
+            with Span(tracer, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def chrome_trace(records):
+    """Records as a Chrome trace event document (complete 'X' events)"""
+    events = []
+    for record in records:
+        args = {key: record[key] for key in ('cpu_s', 'rows_in', 'rows_out', 'rss_delta')
+                if record.get(key) is not None}
+        args.update(record.get('attrs', {}))
+        events.append({'name': record['name'], 'ph': 'X', 'ts': record['start_us'],
+                       'dur': round(record['wall_s'] * 1e6), 'pid': record['pid'],
+                       'tid': record['tid'], 'args': args})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def format_span_report(records):
+    """Table of calls, wall and CPU time, rows and memory change per span name"""
+    totals = {}
+    for record in sorted(records, key=lambda record: record['start_us']):
+        entry = totals.setdefault(record['name'], {'depth': record['depth'], 'calls': 0, 'wall': 0.0,
+                                                   'cpu': 0.0, 'rows_in': 0, 'rows_out': 0, 'rss': 0})
+        entry['calls'] += 1
+        entry['wall'] += record['wall_s']
+        entry['cpu'] += record['cpu_s']
+        entry['rows_in'] += record['rows_in'] or 0
+        entry['rows_out'] += record['rows_out'] or 0
+        entry['rss'] += record['rss_delta'] or 0
+    lines = [f"{'Span':<36}{'Calls':>6}{'Wall (s)':>10}{'CPU (s)':>10}{'Rows in':>12}{'Rows out':>12}"
+             f"{'RSS +/- (MB)':>14}"]
+    for name, entry in totals.items():
+        label = '  ' * entry['depth'] + name
+        lines.append(f"{label:<36}{entry['calls']:>6}{entry['wall']:>10.3f}{entry['cpu']:>10.3f}"
+                     f"{entry['rows_in']:>12,}{entry['rows_out']:>12,}{entry['rss'] / 1e6:>14.1f}")
+    return "\n".join(lines)
+
+def finish():
+    """Stop tracing, write the trace file and print the span table (if tracing was on)"""
+    tracer = disable()
+    if tracer is None:
+        return None
+    print("\nTRACE SUMMARY:")
+    print(format_span_report(tracer.records))
+    if tracer.write() is not None:
+        print(f"TRACE saved to '{tracer.trace_file}'")
+    if tracer._profilers:
+        print(f"PROFILES saved to '{tracer.profile_dir}/'")
+    return tracer
@@ -0,0 +1,172 @@
+# parallel_clean.py
+"""Partitioned cleaning on several processes (2_cleaning.py --processes N).
+
+The raw CSV is split into byte ranges that each end on a record boundary: a
+newline is a boundary only when an even number of quote characters precede it
+(a quoted abstract may contain newlines; an escaped quote "" doesn't change the
+parity). Every worker parses its range with the file's header, runs the
+per-row cleaning steps and hashes the normalized titles. The cleaned partition
+goes back to the parent as an Arrow IPC file in a temporary directory, which
+the parent memory-maps, so large frames are never pickled (without pyarrow
+the frame is returned through the pool instead). With index set, the worker
+also writes the partition's search index.
+
+read_csv would infer each partition's dtypes from its own rows, so a first
+round of tasks only parses the ranges and reports what it inferred; the parent
+merges that into the dtypes of the whole file (see raw_dtypes.py) and every
+partition is then read with them, as clean_data() reads the file.
+
+Duplicate titles span partitions, so they are removed by the parent, which
+takes the partitions in file order and keeps the first occurrence, as the
+serial path does (see dedup.Deduplicator).
+"""
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import instrumentation
+from instrumentation import span
+from dedup import title_hashes
+from raw_dtypes import frame_dtypes, merge_dtypes
+from search_index import SearchIndexBuilder
+
+try:
+    import pyarrow as pa
+except ImportError:  # pyarrow is optional, frames are then pickled
+    pa = None
+
+# Target size of one partition; there are at least as many partitions as processes
+PARTITION_BYTES = 64 << 20
+
+# Bytes scanned at a time when looking for record boundaries
+SCAN_BLOCK = 16 << 20
+
+_QUOTE = ord('"')
+_NEWLINE = ord('\n')
+
+def _record_end(data, start, quotes_before):
+    """Position after the first newline at or after start that is outside quotes
+    (len(data) if there is none); quotes_before is the number of quotes in data[:start]"""
+    while start < len(data):
+        block = data[start:start + SCAN_BLOCK]
+        parity = (quotes_before + np.cumsum(block == _QUOTE)) % 2
+        ends = np.flatnonzero((block == _NEWLINE) & (parity == 0))
+        if len(ends):
+            return start + int(ends[0]) + 1
+        quotes_before += int(np.count_nonzero(block == _QUOTE))
+        start += len(block)
+    return len(data)
+
+def partition_ranges(path, partitions):
+    """(header bytes, [(start, end), ...]): about `partitions` byte ranges of
+    path's data rows, every one ending on a record boundary"""
+    if os.path.getsize(path) == 0:
+        return b'', []
+    data = np.memmap(path, dtype=np.uint8, mode='r')
+    header_end = _record_end(data, 0, 0)
+    targets = np.linspace(header_end, len(data), partitions + 1).astype(np.int64)[1:-1]
+
+    boundaries = [header_end]
+    quotes, counted = 0, 0
+    for target in targets:
+        if target <= boundaries[-1]:
+            continue
+        # Quotes before target, counted block by block from where the last count stopped
+        for block_start in range(counted, target, SCAN_BLOCK):
+            quotes += int(np.count_nonzero(data[block_start:min(block_start + SCAN_BLOCK, target)] == _QUOTE))
+        counted = target
+        end = _record_end(data, int(target), quotes)
+        if end > boundaries[-1]:
+            boundaries.append(end)
+    if boundaries[-1] < len(data):
+        boundaries.append(len(data))
+    header = bytes(data[:header_end])
+    del data
+    return header, list(zip(boundaries[:-1], boundaries[1:]))
+
+def _frame_file(work_dir, number):
+    return os.path.join(work_dir, f'partition-{number:05d}.arrow')
+
+def _index_dir(work_dir, number):
+    return os.path.join(work_dir, f'partition-{number:05d}.index')
+
+def _read_range(path, header, start, end, dtypes=None):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        return pd.read_csv(io.BytesIO(header + f.read(end - start)), dtype=dtypes, low_memory=False)
+
+def _partition_dtypes(path, header, start, end):
+    """Process-pool entry point: the frame_dtypes() read_csv infers for one byte range of path"""
+    return frame_dtypes(_read_range(path, header, start, end))
+
+def _clean_partition(path, header, start, end, number, clean, work_dir, index, dtypes=None, trace=False):
+    """Process-pool entry point: parse, clean and hash one byte range of path.
+
+    Returns a dict with the cleaned frame (or the Arrow file holding it), its
+    title hashes, the rows read, the cleaning counts and, if trace is set, the
+    worker's span records.
+    """
+    if trace:
+        instrumentation.enable()
+    started = time.perf_counter()
+    with span('parallel.partition', partition=number) as step:
+        raw = _read_range(path, header, start, end, dtypes)
+        rows_in = step.rows_in = len(raw)
+        df, counts = clean(raw)
+        del raw
+        df = df.reset_index(drop=True)
+        result = {'number': number, 'rows_in': rows_in, 'counts': counts,
+                  'hashes': title_hashes(df['title']), 'frame': df, 'frame_file': None, 'index_dir': None}
+        if index:
+            builder = SearchIndexBuilder()
+            builder.add(df['title'], df['abstract'])
+            result['index_dir'] = _index_dir(work_dir, number)
+            builder.save(result['index_dir'])
+        if pa is not None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            result['frame_file'] = _frame_file(work_dir, number)
+            with pa.OSFile(result['frame_file'], 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            result['frame'] = None
+        step.rows_out = len(df)
+    result['seconds'] = time.perf_counter() - started
+    tracer = instrumentation.disable() if trace else None
+    result['records'] = tracer.records if tracer is not None else []
+    return result
+
+def read_partition(result):
+    """The cleaned frame of a partition result (memory-mapped from its Arrow file)"""
+    if result['frame_file'] is None:
+        return result['frame']
+    with pa.memory_map(result['frame_file']) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+def clean_partitions(path, clean, processes, work_dir, index=False, partition_bytes=PARTITION_BYTES):
+    """Clean path's partitions on `processes` processes; yields their results in file order.
+
+    clean(raw) -> (cleaned frame, counts) must be picklable (e.g. a module-level
+    function or a functools.partial of one). A result is yielded as soon as it
+    and every earlier partition are done, so the caller can merge partition i
+    while later ones are still being cleaned.
+    """
+    size = os.path.getsize(path)
+    partitions = max(processes, -(-size // partition_bytes))
+    with span('parallel.partition_ranges') as step:
+        header, ranges = partition_ranges(path, partitions)
+        step.set(partitions=len(ranges), bytes=size)
+    tracer = instrumentation.active_tracer()
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        with span('parallel.dtypes') as step:
+            futures = [pool.submit(_partition_dtypes, path, header, start, end) for start, end in ranges]
+            dtypes = merge_dtypes(future.result() for future in futures)
+            step.set(columns=len(dtypes))
+        futures = [pool.submit(_clean_partition, path, header, start, end, number, clean, work_dir, index,
+                               dtypes, trace=tracer is not None)
+                   for number, (start, end) in enumerate(ranges)]
+        for future in futures:
+            result = future.result()
+            if tracer is not None:
+                tracer.extend(result.pop('records'))
+            yield result
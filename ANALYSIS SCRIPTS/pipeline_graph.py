@@ -0,0 +1,214 @@
+# pipeline_graph.py
+"""Incremental stage graph for the CORD-19 pipeline.
+
+Each Stage declares the stages it depends on, the files it reads, the
+parameters and code (functions or modules) that determine its result, and the
+files it writes. Its fingerprint hashes all of those together with the
+fingerprints of its upstream stages. StageGraph.run() executes the stages in
+dependency order and skips a stage whose fingerprint equals the one recorded
+after its last successful run (in pipeline_state.json) while all its outputs
+still exist. A skipped stage's result is only loaded from disk if a stage that
+does run asks for it.
+
+Input files are fingerprinted by size and modification time, so a large raw
+file is never read just to find out that nothing changed.
+"""
+import json
+import os
+import pickle
+import threading
+import time
+from figure_cache import content_hash
+
+STATE_FILE = 'pipeline_state.json'
+RESULTS_DIR = 'pipeline_cache'
+
+def file_signature(path):
+    """(size, mtime in ns) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+def current_rss():
+    """Resident memory of this process in bytes (None where /proc is not available)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+class PeakMemory:
+    """Sample the resident memory in a background thread while a stage runs"""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = self.peak = self.end = None
+
+    def __enter__(self):
+        self.start = self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._record(current_rss())
+
+    def _record(self, rss):
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.end = current_rss()
+        self._record(self.end)
+
+class Stage:
+    """One pipeline step.
+
+    run(context) computes the stage's result; context.result(name) returns the
+    result of an upstream stage and context.memo is scratch space shared by the
+    stages of one run. Results are pickled to RESULTS_DIR unless the stage
+    passes its own load() to rebuild the result from its outputs.
+    """
+
+    def __init__(self, name, run, deps=(), inputs=(), params=None, code=(), outputs=(), load=None):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.params = params or {}
+        self.code = list(code)
+        self.outputs = list(outputs)
+        self.load = load
+
+    def result_file(self, results_dir):
+        return os.path.join(results_dir, f'{self.name}.pkl')
+
+class RunContext:
+    """Results of the stages of one StageGraph.run(), loaded on demand"""
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.results = {}
+        self.memo = {}
+
+    def result(self, name):
+        if name not in self.results:
+            stage = self.graph.stages[name]
+            if stage.load is not None:
+                self.results[name] = stage.load(self)
+            else:
+                with open(stage.result_file(self.graph.results_dir), 'rb') as f:
+                    self.results[name] = pickle.load(f)
+        return self.results[name]
+
+class StageGraph:
+    """Stages in dependency order, with their last successful fingerprints"""
+
+    def __init__(self, state_file=STATE_FILE, results_dir=RESULTS_DIR):
+        self.state_file = state_file
+        self.results_dir = results_dir
+        self.stages = {}
+
+    def add(self, stage):
+        """Add a stage; its dependencies must already be in the graph"""
+        missing = [dep for dep in stage.deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def _load_state(self):
+        try:
+            with open(self.state_file, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, state):
+        tmp_file = f'{self.state_file}.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, self.state_file)
+
+    def fingerprints(self):
+        """{stage name: fingerprint} for the current inputs, parameters and code"""
+        fingerprints = {}
+        for name, stage in self.stages.items():
+            fingerprints[name] = content_hash(
+                name, stage.code, stage.params,
+                [(path, file_signature(path)) for path in stage.inputs],
+                [fingerprints[dep] for dep in stage.deps]
+            )
+        return fingerprints
+
+    def _missing_outputs(self, stage):
+        outputs = list(stage.outputs)
+        if stage.load is None:
+            outputs.append(stage.result_file(self.results_dir))
+        return [path for path in outputs if not os.path.exists(path)]
+
+    def status(self, force=False):
+        """[(stage name, reason it must run or None if up to date)] in run order"""
+        state = self._load_state()
+        statuses = []
+        for name, fingerprint in self.fingerprints().items():
+            stage = self.stages[name]
+            missing = self._missing_outputs(stage)
+            if force:
+                reason = 'forced'
+            elif name not in state:
+                reason = 'never run'
+            elif state[name] != fingerprint:
+                reason = 'inputs, parameters or code changed'
+            elif missing:
+                reason = f"missing output {missing[0]}"
+            else:
+                reason = None
+            statuses.append((name, reason))
+        return statuses
+
+    def run(self, force=False):
+        """Run every stale stage; returns one timing record per stage"""
+        os.makedirs(self.results_dir, exist_ok=True)
+        state = self._load_state()
+        fingerprints = self.fingerprints()
+        context = RunContext(self)
+        timings = []
+        for name, reason in self.status(force):
+            stage = self.stages[name]
+            if reason is None:
+                print(f"\n>>> STAGE: {name.upper()} (up to date, skipped)")
+                timings.append({'stage': name, 'status': 'skipped', 'seconds': 0.0,
+                                'peak_rss': None, 'end_rss': None})
+                continue
+            print(f"\n>>> STAGE: {name.upper()} ({reason})")
+            start = time.perf_counter()
+            with PeakMemory() as memory:
+                result = stage.run(context)
+            context.results[name] = result
+            if stage.load is None:
+                with open(stage.result_file(self.results_dir), 'wb') as f:
+                    pickle.dump(result, f)
+            state[name] = fingerprints[name]
+            self._save_state(state)
+            timings.append({'stage': name, 'status': 'ran', 'seconds': time.perf_counter() - start,
+                            'peak_rss': memory.peak, 'end_rss': memory.end})
+        return timings
+
+def format_stage_report(timings):
+    """Table of the per-stage status, timings and memory use"""
+    def megabytes(value):
+        return f"{value / 1e6:,.1f}" if value is not None else "n/a"
+
+    lines = [f"{'Stage':<12}{'Status':>9}{'Seconds':>10}{'Peak RSS (MB)':>16}{'RSS after (MB)':>17}"]
+    for timing in timings:
+        lines.append(f"{timing['stage']:<12}{timing['status']:>9}{timing['seconds']:>10.2f}"
+                     f"{megabytes(timing['peak_rss']):>16}{megabytes(timing['end_rss']):>17}")
+    lines.append(f"{'total':<12}{'':>9}{sum(timing['seconds'] for timing in timings):>10.2f}")
+    return "\n".join(lines)
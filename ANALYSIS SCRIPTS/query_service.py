@@ -0,0 +1,113 @@
+# query_service.py
+"""Shared query service for the dashboard's concurrent sessions.
+
+Every Streamlit session reruns app.py on each interaction, so ten analysts
+looking at the default filters compute the same search, filter and figure ten
+times. The app instead asks one QueryService per server process for each
+result, under a key built from the normalized filter state (query_key()):
+
+- single flight: while a key is being computed, other requests for it wait for
+  that computation instead of starting their own;
+- results are cached for ttl seconds, least recently used first out once there
+  are more than max_entries;
+- computations run on two bounded thread pools, one for light requests (cube
+  filters, counts) and one for heavy ones (searches, rendered figures), so a
+  burst of figures can't hold up the filters of other sessions.
+
+Cached results are shared between sessions and must not be modified.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+MAX_ENTRIES = 256
+TTL_SECONDS = 600
+LIGHT_WORKERS = 4
+HEAVY_WORKERS = 2
+
+def _normalize(value):
+    """Hashable, order-insensitive form of one filter value"""
+    if isinstance(value, str):
+        return ' '.join(value.split())
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_normalize(item) for item in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(item) for item in value)
+    if hasattr(value, 'item'):  # numpy scalars
+        return value.item()
+    return value
+
+def query_key(kind, data_version, **filters):
+    """Cache key of one request: the same filter state gives the same key, whichever
+    session sends it (journal selections are compared as sets)"""
+    state = []
+    for name in sorted(filters):
+        value = filters[name]
+        if name == 'journals' and value is not None:
+            value = set(value)
+        state.append((name, _normalize(value)))
+    return (kind, data_version, tuple(state))
+
+class QueryService:
+    """Single-flight, TTL/LRU-cached computations on bounded light and heavy thread pools"""
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, light_workers=LIGHT_WORKERS,
+                 heavy_workers=HEAVY_WORKERS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pools = {False: ThreadPoolExecutor(light_workers, thread_name_prefix='query-light'),
+                      True: ThreadPoolExecutor(heavy_workers, thread_name_prefix='query-heavy')}
+        self.lock = threading.Lock()
+        self.results = OrderedDict()
+        self.in_flight = {}
+        self.counts = Counter()
+
+    def get(self, key, compute, heavy=False):
+        """compute()'s result for key: cached, joined while in flight, or computed on a pool.
+
+        compute is only called by the request that starts the computation. An
+        exception is raised in every request waiting for it and is not cached.
+        """
+        with self.lock:
+            entry = self.results.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.results.move_to_end(key)
+                self.counts['hits'] += 1
+                return entry[1]
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.counts['coalesced'] += 1
+            else:
+                self.counts['misses'] += 1
+                future = self.in_flight[key] = self.pools[heavy].submit(self._compute, key, compute)
+        return future.result()
+
+    def _compute(self, key, compute):
+        try:
+            value = compute()
+        except BaseException:
+            with self.lock:
+                self.in_flight.pop(key, None)
+                self.counts['errors'] += 1
+            raise
+        with self.lock:
+            self.results[key] = (time.monotonic() + self.ttl, value)
+            self.results.move_to_end(key)
+            while len(self.results) > self.max_entries:
+                self.results.popitem(last=False)
+                self.counts['evictions'] += 1
+            self.in_flight.pop(key, None)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts, entries=len(self.results), in_flight=len(self.in_flight))
+
+    def shutdown(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
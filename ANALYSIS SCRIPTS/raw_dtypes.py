@@ -0,0 +1,65 @@
+# raw_dtypes.py
+"""Whole-file dtypes for reading metadata.csv in pieces.
+
+pd.read_csv infers every column's dtype from the rows it parses, so a chunk
+(or partition) gets different dtypes from the whole file: a pubmed_id column
+that is filled in one chunk and empty in the next is int64 in the first and
+float64 in the second (written out as "0" vs "0.0"), and a column of numbers
+that only turns into text later makes the chunks disagree about its type.
+
+frame_dtypes() records what read_csv inferred for one piece, merge_dtypes()
+combines the pieces into the dtypes read_csv would have inferred for the whole
+file, and passing those as dtype= to every piece gives each one the columns
+the in-memory path reads.
+"""
+import numpy as np
+import pandas as pd
+
+def frame_dtypes(df):
+    """{column: (dtype read_csv inferred, True if the column has any value, True if it has
+    a missing value)} of one parsed piece"""
+    dtypes = {}
+    for col in df.columns:
+        values = df[col].notna()
+        dtype = df[col].dtype
+        if dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) == 'boolean':
+            # Booleans with missing values come back as an object column of True/False/NaN
+            dtype = np.dtype(bool)
+        dtypes[col] = (dtype, bool(values.any()), not values.all())
+    return dtypes
+
+def merge_dtypes(pieces):
+    """dtype= for read_csv that gives every piece the dtypes of the whole file, from the
+    frame_dtypes() of all of its pieces"""
+    seen, missing = {}, set()
+    for piece in pieces:
+        for col, (dtype, has_values, has_missing) in piece.items():
+            kinds = seen.setdefault(col, set())
+            if has_values:
+                # An empty piece reads as float64 and says nothing about the values
+                kinds.add(dtype)
+            if has_missing:
+                missing.add(col)
+
+    dtypes = {}
+    for col, kinds in seen.items():
+        if not kinds:
+            dtypes[col] = 'float64'
+        elif all(pd.api.types.is_bool_dtype(dtype) for dtype in kinds):
+            dtypes[col] = 'boolean' if col in missing else 'bool'
+        elif any(not pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)
+                 for dtype in kinds):
+            # Text, or booleans mixed with numbers, are read as strings
+            dtypes[col] = str
+        else:
+            dtype = np.result_type(*kinds)
+            # Integers with missing values are read as floats
+            if col in missing and dtype.kind in 'iu':
+                dtype = np.dtype('float64')
+            dtypes[col] = dtype.name
+    return dtypes
+
+def infer_csv_dtypes(path, chunksize):
+    """Whole-file dtypes of path, from one pass over it in chunks of chunksize rows"""
+    reader = pd.read_csv(path, chunksize=chunksize, low_memory=False)
+    return merge_dtypes(frame_dtypes(chunk) for chunk in reader)
@@ -1,75 +1,211 @@
-# ultra_fast_simple.py
+# run_all.py
+"""Run exploration, cleaning and analysis as one incremental, in-memory pipeline.
+
+The stages form a graph (see pipeline_graph.py):
+
+    explore    metadata.csv -> exploration_results.txt
+    clean      metadata.csv -> cleaned_metadata.csv, Parquet cache, search index
+    aggregate  clean -> yearly counts, top journals, word counts, ...
+    render     aggregate -> figures/*.png
+    report     clean, aggregate -> cleaning_report.txt, analysis_report.txt
+
+A stage only runs when its inputs, parameters or code changed since its last
+successful run (or an output is missing), so e.g. editing a plotting function
+re-renders the figures without re-cleaning metadata.csv. When several stages
+run, metadata.csv is parsed once and the same DataFrame is passed between them.
+Each stage's wall time and peak resident memory are reported.
+
+With --incremental the clean stage only cleans the papers added or changed
+since the last incremental run (see delta_ingest.py) and the aggregate stage
+uses the cleaned store's running counts instead of reading the cleaned rows.
+"""
+import argparse
+import importlib
+import os
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import time
+import aggregate_cube
+import data_store
+import date_parsing
+import dedup
+import delta_ingest
+import heavy_hitters
+import instrumentation
+import search_index
+import text_features
+import text_store
+import word_frequency
+from instrumentation import traced
+from pipeline_graph import Stage, StageGraph, format_stage_report
+
+# The stage scripts' file names start with a digit, so they are imported by name
+exploration = importlib.import_module('1_exploration')
+cleaning = importlib.import_module('2_cleaning')
+analysis = importlib.import_module('3_analysis')
+
+PIPELINE_REPORT = 'pipeline_report.txt'
+
+def build_pipeline(input_file='metadata.csv', workers=1, figure_workers=None, skip_index=False,
+                   show_figures=False, use_figure_cache=True, near_duplicates=False, incremental=False):
+    """The stage graph of the whole analysis (incremental: clean only the papers changed
+    since the last run and aggregate from the cleaned store's running counts)"""
+    graph = StageGraph()
+
+    def raw_frame(context):
+        """metadata.csv, parsed at most once per run"""
+        if 'raw' not in context.memo:
+            context.memo['raw'] = pd.read_csv(input_file, low_memory=False)
+            print(f"Loaded {len(context.memo['raw']):,} rows from '{input_file}'")
+        return context.memo['raw']
+
+    @traced('stage.explore')
+    def explore(context):
+        summary = exploration.explore_data(raw_frame(context))
+        exploration.write_exploration_results(summary)
+        print("EXPLORATION RESULTS saved to 'exploration_results.txt'")
+        return summary
 
-def main():
-    print("ULTRA-FAST CORD-19 ANALYSIS")
+    @traced('stage.clean')
+    def clean(context):
+        if incremental:
+            stats = cleaning.clean_data_incremental(
+                input_file, data_store.CSV_FILE, workers=workers, raw=raw_frame(context),
+                index_dir=None if skip_index else search_index.INDEX_DIR)
+            del context.memo['raw']
+            print(f"CLEANED DATA saved to '{data_store.CSV_FILE}'")
+            return stats
+        df_clean = cleaning.clean_data(raw_frame(context), workers=workers,
+                                       near_duplicates=near_duplicates)
+        del context.memo['raw']  # explore runs first, so the raw frame is no longer needed
+        stats = cleaning.analyze_cleaned_data(df_clean)
+        cleaning.save_cleaned_data(df_clean, index_dir=None if skip_index else search_index.INDEX_DIR,
+                                   journal_sketch=stats['journal_sketch'])
+        print(f"CLEANED DATA saved to '{data_store.CSV_FILE}'")
+        context.memo['cleaned'] = df_clean
+        return stats
+
+    @traced('stage.aggregate')
+    def aggregate(context):
+        if incremental:
+            return analysis.aggregates_from_counts(delta_ingest.CleanedStore().aggregates)
+        # Reuse the frame cleaned in this run, otherwise read the stored one
+        df_clean = context.memo.pop('cleaned', None)
+        texts = None
+        if df_clean is None:
+            df_clean, texts = analysis.load_analysis_data()
+            print(f"Loaded {len(df_clean):,} cleaned rows")
+        return analysis.compute_aggregates(df_clean, texts,
+                                           heavy_hitters.load_journal_sketch(data_store.CSV_FILE, len(df_clean)))
+
+    @traced('stage.render')
+    def render(context):
+        analysis.render_all_figures(context.result('aggregate'), batch=not show_figures,
+                                    workers=figure_workers, use_cache=use_figure_cache)
+
+    @traced('stage.report')
+    def report(context):
+        cleaning.write_cleaning_report(context.result('clean'))
+        print("CLEANING REPORT saved to 'cleaning_report.txt'")
+        analysis.write_analysis_report(analysis.analysis_stats(context.result('aggregate')))
+        print("ANALYSIS REPORT saved to 'analysis_report.txt'")
+
+    graph.add(Stage('explore', explore, inputs=[input_file], code=[exploration],
+                    outputs=['exploration_results.txt']))
+    graph.add(Stage('clean', clean, inputs=[input_file], params={'skip_index': skip_index, 'near_duplicates': near_duplicates,
+                                                           'incremental': incremental},
+                    code=[cleaning, text_features, date_parsing, data_store, search_index, dedup, delta_ingest,
+                          text_store, heavy_hitters],
+                    outputs=[data_store.CSV_FILE, os.path.join(text_store.TEXT_DIR, 'meta.json'),
+                             heavy_hitters.SKETCH_FILE] +
+                            ([] if skip_index else [os.path.join(search_index.INDEX_DIR, 'meta.json')])))
+    graph.add(Stage('aggregate', aggregate, deps=['clean'],
+                    params={'columns': analysis.ANALYSIS_COLUMNS, 'stop_words': analysis.STOP_WORDS,
+                            'cloud_stop_words': analysis.STOPWORDS, 'incremental': incremental},
+                    code=[analysis.compute_aggregates, analysis.aggregates_from_counts,
+                          analysis.load_analysis_data, word_frequency, aggregate_cube, text_features,
+                          text_store, heavy_hitters]))
+    graph.add(Stage('render', render, deps=['aggregate'],
+                    params={'dpi': analysis.FIGURE_DPI,
+                            'figures': [(name, inputs) for name, _, _, inputs in analysis.FIGURES]},
+                    code=[analysis.render_figure] + [plot for _, _, plot, _ in analysis.FIGURES],
+                    outputs=[analysis.figure_path(name) for name, _, _, _ in analysis.FIGURES]))
+    graph.add(Stage('report', report, deps=['clean', 'aggregate'],
+                    code=[cleaning.write_cleaning_report, analysis.write_analysis_report,
+                          analysis.analysis_stats],
+                    outputs=['cleaning_report.txt', 'analysis_report.txt']))
+    return graph
+
+def main(input_file='metadata.csv', workers=1, figure_workers=None, skip_index=False,
+         show_figures=False, use_figure_cache=True, near_duplicates=False, incremental=False, force=False):
+    print("CORD-19 PIPELINE")
     print("=" * 40)
-    start_time = time.time()
-    
-    # Step 1: Load minimal data
-    print("1. Loading data...")
+    graph = build_pipeline(input_file, workers=workers, figure_workers=figure_workers,
+                           skip_index=skip_index, show_figures=show_figures,
+                           use_figure_cache=use_figure_cache, near_duplicates=near_duplicates,
+                           incremental=incremental)
     try:
-        df = pd.read_csv('metadata.csv', 
-                        nrows=2000,  # Small sample
-                        usecols=['title', 'abstract', 'publish_time', 'journal'],
-                        low_memory=False)
-        print(f"   Loaded {len(df)} rows")
-    except Exception as e:
-        print(f"   Error: {e}")
-        return
-    
-    # Step 2: Quick cleaning
-    print("2. Quick cleaning...")
-    df_clean = df[df['title'].notna()].copy()
-    df_clean['publish_time'] = pd.to_datetime(df_clean['publish_time'], errors='coerce')
-    df_clean['year'] = df_clean['publish_time'].dt.year
-    df_clean['abstract'] = df_clean['abstract'].fillna('')
-    df_clean['journal'] = df_clean['journal'].fillna('Unknown')
-    df_clean['abstract_length'] = df_clean['abstract'].str.split().str.len()
-    
-    print(f"   Cleaned {len(df_clean)} rows")
-    
-    # Step 3: Fast analysis
-    print("3. Fast analysis...")
-    year_counts = df_clean['year'].value_counts().sort_index()
-    journal_counts = df_clean['journal'].value_counts().head(6)
-    
-    # Create visualization
-    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 5))
-    
-    # Plot 1: Publications by year
-    ax1.bar(year_counts.index, year_counts.values, color='lightblue', alpha=0.8)
-    ax1.set_title('Publications by Year', fontweight='bold')
-    ax1.set_xlabel('Year')
-    ax1.set_ylabel('Number of Papers')
-    ax1.grid(axis='y', alpha=0.3)
-    
-    # Plot 2: Top journals
-    ax2.barh(list(journal_counts.index), journal_counts.values, color='lightcoral', alpha=0.8)
-    ax2.set_title('Top Journals', fontweight='bold')
-    ax2.set_xlabel('Number of Papers')
-    ax2.grid(axis='x', alpha=0.3)
-    
-    plt.tight_layout()
-    plt.savefig('fast_analysis_results.png', dpi=150, bbox_inches='tight')
-    plt.show()
-    
-    # Step 4: Results
-    total_time = time.time() - start_time
+        timings = graph.run(force=force)
+    except FileNotFoundError as e:
+        print(f"ERROR: {e.filename} not found!")
+        return None
+
+    report = format_stage_report(timings)
     print("\n" + "=" * 40)
-    print("ANALYSIS COMPLETE!")
-    print(f"Time: {total_time:.1f} seconds")
-    print(f"Publications by year: {dict(year_counts)}")
-    print(f"Top 3 journals: {dict(journal_counts.head(3))}")
-    print(f"Average abstract length: {df_clean['abstract_length'].mean():.1f} words")
-    print(f"Results saved to: fast_analysis_results.png")
-    
-    # Save cleaned data for future use
-    df_clean.to_csv('cleaned_data_fast.csv', index=False)
-    print(f"Cleaned data saved to: cleaned_data_fast.csv")
+    print("PIPELINE COMPLETE!")
+    print(report)
+    with open(PIPELINE_REPORT, 'w', encoding='utf-8') as f:
+        f.write("CORD-19 Pipeline Report\n")
+        f.write("=" * 40 + "\n")
+        f.write(report + "\n")
+    print(f"PIPELINE REPORT saved to '{PIPELINE_REPORT}'")
+    return timings
+
+def print_status(graph):
+    """List the stages and why each one would run"""
+    print("PIPELINE STATUS")
+    print("=" * 40)
+    for name, reason in graph.status():
+        print(f"  {name:<12}{'up to date' if reason is None else 'stale: ' + reason}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Explore, clean and analyze metadata.csv, "
+                                                 "re-running only the stages that are out of date")
+    parser.add_argument('--input', default='metadata.csv',
+                        help="Raw CORD-19 metadata file (default: metadata.csv)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Threads used for word counting (default: 1)")
+    parser.add_argument('--figure-workers', type=int, default=None,
+                        help="Processes used to render the figures (default: one per CPU)")
+    parser.add_argument('--skip-index', action='store_true',
+                        help="Don't build the title/abstract search index")
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help="Also drop papers whose title + abstract nearly match an earlier one")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only clean the papers added or changed since the last incremental run "
+                             "(matched by cord_uid)")
+    parser.add_argument('--show', action='store_true',
+                        help="Show each figure instead of rendering them headless")
+    parser.add_argument('--no-figure-cache', action='store_true',
+                        help="Render every figure even if an identical one is cached")
+    parser.add_argument('--force', action='store_true',
+                        help="Run every stage, even the ones that are up to date")
+    parser.add_argument('--status', action='store_true',
+                        help="Only list which stages are out of date and why")
+    parser.add_argument('--trace', default=None,
+                        help="Time every stage and step and write the trace to this file "
+                             "(.json: Chrome trace format, otherwise JSON lines)")
+    parser.add_argument('--profile', action='append', default=[],
+                        help="Also run this step under cProfile (repeatable, '*' for all)")
+    args = parser.parse_args()
+    if args.incremental and args.near_duplicates:
+        parser.error("--incremental can't be combined with --near-duplicates")
+    if args.trace or args.profile:
+        instrumentation.enable(args.trace, profile=args.profile)
+    if args.status:
+        print_status(build_pipeline(args.input, skip_index=args.skip_index,
+                                    near_duplicates=args.near_duplicates, incremental=args.incremental))
+    else:
+        main(input_file=args.input, workers=args.workers, figure_workers=args.figure_workers,
+             skip_index=args.skip_index, show_figures=args.show,
+             use_figure_cache=not args.no_figure_cache, near_duplicates=args.near_duplicates,
+             incremental=args.incremental, force=args.force)
+        instrumentation.finish()
\ No newline at end of file
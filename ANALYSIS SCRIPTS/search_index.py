@@ -0,0 +1,234 @@
+# search_index.py
+"""On-disk positional inverted index over paper titles and abstracts.
+
+The cleaning stage builds the index with SearchIndexBuilder; each row id is the
+row's position in cleaned_metadata.csv. SearchIndex memory-maps the arrays, so
+opening it costs almost nothing and a query only touches the posting lists of
+its terms.
+
+merge_search_indexes() combines saved indexes (e.g. one per segment of the
+incremental cleaned store) without tokenizing their text again.
+
+Query syntax: words are ANDed, OR separates alternatives and "double quotes"
+mark a phrase, e.g.  vaccine "clinical trial" OR remdesivir
+Query words are tokenized like the indexed text (see text_features.tokenize).
+
+Files in the index directory:
+    terms.npy        sorted vocabulary (fixed-width bytes)
+    doc_offsets.npy  posting list of term i is docs[doc_offsets[i]:doc_offsets[i + 1]]
+    docs.npy         row ids, sorted within each term
+    pos_offsets.npy  positions of posting j are positions[pos_offsets[j]:pos_offsets[j + 1]]
+    positions.npy    token positions within the row
+    meta.json        number of indexed rows
+"""
+import json
+import os
+import re
+from array import array
+import numpy as np
+from text_features import tokenize
+
+INDEX_DIR = 'search_index'
+
+def _row_tokens(title, abstract, skip_abstract=None):
+    """Tokens of a row; abstract positions start after a gap so phrases don't span fields"""
+    tokens = tokenize(title)
+    if abstract is not None and abstract == abstract and abstract != skip_abstract:
+        tokens.append(None)
+        tokens.extend(tokenize(abstract))
+    return tokens
+
+class SearchIndexBuilder:
+    """Collect postings chunk by chunk, then write the index with save()"""
+
+    def __init__(self, skip_abstract=None):
+        self.skip_abstract = skip_abstract
+        self.term_ids = {}
+        self.terms = array('i')
+        self.rows = array('i')
+        self.positions = array('i')
+        self.n_rows = 0
+
+    def add(self, titles, abstracts):
+        """Index the next rows; row ids continue from the previous call"""
+        term_ids = self.term_ids
+        for title, abstract in zip(titles, abstracts):
+            row = self.n_rows
+            self.n_rows += 1
+            tokens = _row_tokens(title, abstract, self.skip_abstract)
+            for position, token in enumerate(tokens):
+                if token is None:
+                    continue
+                term_id = term_ids.get(token)
+                if term_id is None:
+                    term_id = term_ids[token] = len(term_ids)
+                self.terms.append(term_id)
+                self.rows.append(row)
+                self.positions.append(position)
+
+    def save(self, index_dir=INDEX_DIR):
+        """Sort the postings by (term, row, position) and write the index files"""
+        os.makedirs(index_dir, exist_ok=True)
+        vocabulary = sorted(self.term_ids)
+        rank = np.empty(len(vocabulary), dtype=np.int32)
+        for new_id, term in enumerate(vocabulary):
+            rank[self.term_ids[term]] = new_id
+
+        terms = rank[np.frombuffer(self.terms, dtype=np.int32)] if len(self.terms) else np.zeros(0, np.int32)
+        rows = np.frombuffer(self.rows, dtype=np.int32)
+        positions = np.frombuffer(self.positions, dtype=np.int32)
+        order = np.lexsort((positions, rows, terms))
+        vocabulary = np.array([term.encode('ascii') for term in vocabulary], dtype='S')
+        _write_index(index_dir, vocabulary, terms[order], rows[order], positions[order], self.n_rows)
+
+def _write_index(index_dir, vocabulary, terms, rows, positions, n_rows):
+    """Write the index files from occurrences sorted by (term, row, position)"""
+    # One posting per distinct (term, row) pair
+    new_posting = np.ones(len(terms), dtype=bool)
+    new_posting[1:] = (terms[1:] != terms[:-1]) | (rows[1:] != rows[:-1])
+    posting_starts = np.flatnonzero(new_posting)
+    posting_terms = terms[posting_starts]
+
+    np.save(os.path.join(index_dir, 'terms.npy'), vocabulary)
+    np.save(os.path.join(index_dir, 'doc_offsets.npy'),
+            np.searchsorted(posting_terms, np.arange(len(vocabulary) + 1)).astype(np.int64))
+    np.save(os.path.join(index_dir, 'docs.npy'), rows[posting_starts])
+    np.save(os.path.join(index_dir, 'pos_offsets.npy'),
+            np.append(posting_starts, len(terms)).astype(np.int64))
+    np.save(os.path.join(index_dir, 'positions.npy'), positions)
+    with open(os.path.join(index_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({'rows': n_rows, 'terms': len(vocabulary), 'postings': len(posting_starts)}, f)
+
+def build_search_index(titles, abstracts, index_dir=INDEX_DIR, skip_abstract=None):
+    """Build and save the index for whole title and abstract columns"""
+    builder = SearchIndexBuilder(skip_abstract=skip_abstract)
+    builder.add(titles, abstracts)
+    builder.save(index_dir)
+    return builder.n_rows
+
+class SearchIndex:
+    """Read-only, memory-mapped view of an index written by SearchIndexBuilder"""
+
+    def __init__(self, index_dir=INDEX_DIR):
+        def load(name):
+            return np.load(os.path.join(index_dir, name), mmap_mode='r')
+        self.terms = load('terms.npy')
+        self.doc_offsets = load('doc_offsets.npy')
+        self.docs = load('docs.npy')
+        self.pos_offsets = load('pos_offsets.npy')
+        self.positions = load('positions.npy')
+        with open(os.path.join(index_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.rows = self.meta['rows']
+
+    @staticmethod
+    def exists(index_dir=INDEX_DIR):
+        return os.path.exists(os.path.join(index_dir, 'meta.json'))
+
+    def _term_index(self, term):
+        """Position of term in the vocabulary, or None"""
+        key = term.encode('ascii')
+        i = int(np.searchsorted(self.terms, key))
+        if i < len(self.terms) and self.terms[i] == key:
+            return i
+        return None
+
+    def _postings(self, term_index):
+        """(first posting, row ids) of a term"""
+        start, end = self.doc_offsets[term_index], self.doc_offsets[term_index + 1]
+        return start, np.asarray(self.docs[start:end])
+
+    def term_rows(self, term):
+        """Sorted row ids containing term"""
+        term_index = self._term_index(term)
+        if term_index is None:
+            return np.zeros(0, dtype=np.int32)
+        return self._postings(term_index)[1]
+
+    def _position_keys(self, term_index, rows, shift):
+        """(row << 32 | position - shift) for every occurrence of a term in the given rows"""
+        first_posting, term_docs = self._postings(term_index)
+        postings = first_posting + np.searchsorted(term_docs, rows)
+        starts = np.asarray(self.pos_offsets[postings])
+        lengths = np.asarray(self.pos_offsets[postings + 1]) - starts
+        # Gather all position slices at once
+        gather = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        positions = np.asarray(self.positions[gather]).astype(np.int64) - shift
+        return (np.repeat(rows.astype(np.int64), lengths) << 32) | (positions & 0xFFFFFFFF)
+
+    def phrase_rows(self, words):
+        """Sorted row ids where the words appear consecutively"""
+        term_indexes = [self._term_index(word) for word in words]
+        if not term_indexes or any(index is None for index in term_indexes):
+            return np.zeros(0, dtype=np.int32)
+        rows = self._postings(term_indexes[0])[1]
+        for term_index in term_indexes[1:]:
+            rows = np.intersect1d(rows, self._postings(term_index)[1], assume_unique=True)
+        if len(term_indexes) == 1 or len(rows) == 0:
+            return rows
+
+        keys = self._position_keys(term_indexes[0], rows, 0)
+        for shift, term_index in enumerate(term_indexes[1:], start=1):
+            keys = np.intersect1d(keys, self._position_keys(term_index, rows, shift), assume_unique=True)
+        return np.unique(keys >> 32).astype(np.int32)
+
+    def search(self, query):
+        """Row ids (sorted) matching a query string; see the module docstring for the syntax"""
+        result = None
+        for alternative in re.split(r'\s+OR\s+', query.strip()):
+            rows = None
+            for phrase, word in re.findall(r'"([^"]*)"|(\S+)', alternative):
+                words = tokenize(phrase if phrase else word)
+                if not words:
+                    # Short or non-alphabetic words are not indexed
+                    continue
+                clause_rows = self.phrase_rows(words) if phrase else self.term_rows(words[0])
+                if not phrase:
+                    for extra in words[1:]:
+                        clause_rows = np.intersect1d(clause_rows, self.term_rows(extra), assume_unique=True)
+                rows = clause_rows if rows is None else np.intersect1d(rows, clause_rows, assume_unique=True)
+            if rows is None:
+                continue
+            result = rows if result is None else np.union1d(result, rows)
+        return np.zeros(0, dtype=np.int32) if result is None else result
+
+def merge_search_indexes(parts, index_dir=INDEX_DIR):
+    """Write one index from saved ones without tokenizing any text again.
+
+    parts is a list of (index directory, row_map): row_map[i] is the row id
+    row i of that index gets in the merged index, or -1 to leave it out. The
+    new row ids must increase from part to part (as when the parts' rows are
+    concatenated). The result is the index build_search_index() would write
+    for the kept rows.
+    """
+    vocabularies, terms, rows, positions = [], [], [], []
+    n_rows = 0
+    for part_dir, row_map in parts:
+        part = SearchIndex(part_dir)
+        row_map = np.asarray(row_map, dtype=np.int64)
+        doc_offsets, pos_offsets = np.asarray(part.doc_offsets), np.asarray(part.pos_offsets)
+        # Expand the postings to one (term, row, position) triple per occurrence
+        posting_terms = np.repeat(np.arange(len(part.terms), dtype=np.int64), np.diff(doc_offsets))
+        occurrences = np.diff(pos_offsets)
+        part_rows = row_map[np.repeat(np.asarray(part.docs), occurrences)]
+        kept = part_rows >= 0
+        vocabularies.append(np.asarray(part.terms))
+        terms.append((len(vocabularies) - 1, np.repeat(posting_terms, occurrences)[kept]))
+        rows.append(part_rows[kept].astype(np.int32))
+        positions.append(np.asarray(part.positions)[kept])
+        n_rows += int((row_map >= 0).sum())
+
+    # Global vocabulary of the terms that still occur
+    vocabulary = np.unique(np.concatenate(
+        [vocabularies[i][np.unique(part_terms)] for i, part_terms in terms] or [np.zeros(0, dtype='S1')]))
+    terms = np.concatenate([np.searchsorted(vocabulary, vocabularies[i][part_terms]).astype(np.int32)
+                            for i, part_terms in terms] or [np.zeros(0, dtype=np.int32)])
+    rows = np.concatenate(rows or [np.zeros(0, dtype=np.int32)])
+    positions = np.concatenate(positions or [np.zeros(0, dtype=np.int32)])
+
+    # Each part is sorted by (term, row, position) and its rows come after the
+    # previous part's, so a stable sort by term keeps that order overall
+    order = np.argsort(terms, kind='stable')
+    os.makedirs(index_dir, exist_ok=True)
+    _write_index(index_dir, vocabulary, terms[order], rows[order], positions[order], n_rows)
+    return n_rows
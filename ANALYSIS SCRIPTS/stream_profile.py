@@ -0,0 +1,226 @@
+# stream_profile.py
+"""Single-pass column statistics for exploring a CSV larger than memory.
+
+DatasetProfile.update() is fed one chunk at a time and keeps, per column:
+
+- null and non-null counts and the dtype pandas would infer for the whole file,
+- min/max, and for numeric columns count/mean/std merged chunk by chunk,
+- an approximate distinct count (HyperLogLog, 4 KB per column, ~1.6% error),
+- approximate quantiles (a merging t-digest of at most ~200 centroids).
+
+Nothing grows with the number of rows, so the memory needed is that of one
+chunk plus a few kilobytes per column.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api import types as ptypes
+
+HLL_PRECISION = 12
+DIGEST_COMPRESSION = 200
+QUANTILES = (0.25, 0.5, 0.75)
+
+class HyperLogLog:
+    """Approximate distinct count of 64-bit hashes"""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        p = np.uint64(self.precision)
+        index = (hashes >> (np.uint64(64) - p)).astype(np.int64)
+        # Rank = leading zeros + 1 of the remaining bits; the top 53 of them
+        # convert to float64 exactly, and frexp's exponent is their bit length
+        rest = (hashes << p) >> np.uint64(11)
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        np.maximum.at(self.registers, index, (54 - bit_length).astype(np.uint8))
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.exp2(-self.registers.astype(np.float64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)  # linear counting for small cardinalities
+        return raw
+
+class QuantileDigest:
+    """Merging t-digest: centroids are small at the tails and larger in the middle"""
+
+    def __init__(self, compression=DIGEST_COMPRESSION):
+        self.compression = compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        means = np.concatenate([self.means, values])
+        weights = np.concatenate([self.weights, np.ones(len(values))])
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+
+        # Merge neighbours that fall into the same step of the arcsine scale
+        q_left = (np.cumsum(weights) - weights) / weights.sum()
+        k = np.floor(self.compression * (np.arcsin(2 * q_left - 1) / np.pi + 0.5))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        if not len(self.weights):
+            return np.nan
+        centers = (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum()
+        return float(np.interp(q, np.r_[0.0, centers, 1.0], np.r_[self.min, self.means, self.max]))
+
+def _chunk_kind(dtype):
+    """Coarse dtype of one chunk's column"""
+    if ptypes.is_bool_dtype(dtype):
+        return 'bool'
+    if ptypes.is_integer_dtype(dtype):
+        return 'int64'
+    if ptypes.is_float_dtype(dtype):
+        return 'float64'
+    if ptypes.is_string_dtype(dtype):
+        return 'str'
+    return 'object'
+
+class ColumnProfile:
+    """Running statistics of one column"""
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.kinds = set()
+        self.distinct = HyperLogLog()
+        self.digest = QuantileDigest()
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.text_min = None
+        self.text_max = None
+
+    def update(self, series):
+        values = series.dropna()
+        self.nulls += len(series) - len(values)
+        if not len(values):
+            return
+        kind = _chunk_kind(series.dtype)
+        self.kinds.add(kind)
+        if kind in ('int64', 'float64'):
+            numbers = values.to_numpy(dtype=np.float64)
+            self.distinct.add_hashes(pd.util.hash_array(numbers))
+            self.digest.add(numbers)
+            # Chan et al.: merge this chunk's mean and sum of squared deviations
+            n, chunk_mean = len(numbers), numbers.mean()
+            delta = chunk_mean - self.mean
+            total = self.count + n
+            self.m2 += ((numbers - chunk_mean) ** 2).sum() + delta ** 2 * self.count * n / total
+            self.mean += delta * n / total
+        else:
+            text = values.astype(str)
+            self.distinct.add_hashes(pd.util.hash_pandas_object(text, index=False).to_numpy())
+            chunk_min, chunk_max = text.min(), text.max()
+            self.text_min = chunk_min if self.text_min is None else min(self.text_min, chunk_min)
+            self.text_max = chunk_max if self.text_max is None else max(self.text_max, chunk_max)
+        self.count += len(values)
+
+    @property
+    def dtype(self):
+        """The dtype read_csv would give the column if it read the whole file"""
+        if not self.kinds:
+            return 'float64'  # only empty fields
+        if len(self.kinds) == 1:
+            kind = next(iter(self.kinds))
+            if self.nulls and kind == 'int64':
+                return 'float64'
+            if self.nulls and kind == 'bool':
+                return 'object'
+            return kind
+        if self.kinds <= {'int64', 'float64'}:
+            return 'float64'
+        return 'str' if 'str' in self.kinds else 'object'
+
+    @property
+    def is_numeric(self):
+        return self.dtype in ('int64', 'float64')
+
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.nan
+
+    def value_range(self):
+        """(min, max): numeric for numeric columns, lexicographic for text columns"""
+        if self.is_numeric and self.count:
+            return self.digest.min, self.digest.max
+        if self.kinds == {'str'} or self.kinds == {'object'}:
+            return self.text_min, self.text_max
+        return None, None  # mixed or empty column
+
+class DatasetProfile:
+    """Column profiles of a whole file, built chunk by chunk"""
+
+    def __init__(self):
+        self.rows = 0
+        self.chunks = 0
+        self.columns = {}
+        self.head = None
+        self.first_row = None
+
+    def update(self, chunk):
+        if self.head is None:
+            self.head = chunk.head(3)
+            self.first_row = chunk.iloc[0] if len(chunk) else None
+        for name in chunk.columns:
+            if name not in self.columns:
+                self.columns[name] = ColumnProfile(name)
+            self.columns[name].update(chunk[name])
+        self.rows += len(chunk)
+        self.chunks += 1
+
+    @property
+    def shape(self):
+        return (self.rows, len(self.columns))
+
+    def dtypes(self):
+        return pd.Series({name: column.dtype for name, column in self.columns.items()}, dtype=object)
+
+    def non_null(self):
+        return pd.Series({name: column.count for name, column in self.columns.items()}, dtype='int64')
+
+    def missing(self):
+        """Null count per column, like df.isnull().sum()"""
+        return pd.Series({name: column.nulls for name, column in self.columns.items()}, dtype='int64')
+
+    def describe(self):
+        """df.describe() of the numeric columns, with approximate quartiles"""
+        stats = {}
+        for name, column in self.columns.items():
+            if column.is_numeric and column.count:
+                stats[name] = [column.count, column.mean, column.std(), column.digest.min] + \
+                              [column.digest.quantile(q) for q in QUANTILES] + [column.digest.max]
+        index = ['count', 'mean', 'std', 'min'] + [f'{q:.0%}' for q in QUANTILES] + ['max']
+        return pd.DataFrame(stats, index=index)
+
+    def column_table(self):
+        """One row per column: dtype, counts, approximate distinct values and range"""
+        rows = []
+        for name, column in self.columns.items():
+            low, high = column.value_range()
+            rows.append({'Column': name, 'Dtype': column.dtype, 'Non_Null': column.count,
+                         'Missing': column.nulls, 'Distinct_Approx': int(round(column.distinct.estimate())),
+                         'Min': low, 'Max': high})
+        return pd.DataFrame(rows).set_index('Column')
+
+def profile_csv(input_file, chunksize=100_000, on_chunk=None):
+    """Profile input_file in one pass of chunksize-row chunks"""
+    profile = DatasetProfile()
+    for chunk in pd.read_csv(input_file, chunksize=chunksize, low_memory=False):
+        profile.update(chunk)
+        if on_chunk is not None:
+            on_chunk(profile)
+    return profile
@@ -0,0 +1,167 @@
+# text_store.py
+"""Memory-mapped store of the cleaned titles and abstracts.
+
+Titles and abstracts are most of the bytes of the cleaned data, but the
+dashboard only shows a page of them at a time and the word-frequency builders
+read them once. The cleaning stage writes every text column into one
+contiguous UTF-8 file next to the cleaned CSV; TextStore memory-maps it and
+decodes only the rows that are asked for, so no Python string is held while
+nothing reads them (the OS can drop the mapped pages at any time).
+
+Files in the store directory, for each column in TEXT_COLUMNS:
+    title.bin            UTF-8 text of every row, back to back
+    title.offsets.npy    row i is title.bin[offsets[i]:offsets[i + 1]] (int64)
+    title.missing.npy    True where the value is missing (its text is empty)
+    meta.json            number of rows and the stored columns
+
+Missing abstracts are missing values here too; ABSTRACT_PLACEHOLDER only
+exists in the CSV.
+"""
+import json
+import mmap
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+TEXT_DIR = 'text_store'
+TEXT_COLUMNS = ['title', 'abstract']
+
+# Rows decoded at a time by TextStore.iter_texts()
+DECODE_CHUNK_ROWS = 50_000
+
+def _files(text_dir, column):
+    return (os.path.join(text_dir, f'{column}.bin'), os.path.join(text_dir, f'{column}.offsets.npy'),
+            os.path.join(text_dir, f'{column}.missing.npy'))
+
+class TextStoreWriter:
+    """Append cleaned chunks to a new store; close() moves it into place"""
+
+    def __init__(self, text_dir=TEXT_DIR, columns=TEXT_COLUMNS):
+        self.text_dir = text_dir
+        self.tmp_dir = text_dir + '.tmp'
+        self.columns = None
+        self.wanted = list(columns)
+        self.blobs = {}
+        self.lengths = {}
+        self.missing = {}
+        self.rows = 0
+
+    def add(self, df):
+        """Append the text columns of the next rows of the cleaned data"""
+        if self.columns is None:
+            self.columns = [col for col in self.wanted if col in df.columns]
+            shutil.rmtree(self.tmp_dir, ignore_errors=True)
+            os.makedirs(self.tmp_dir)
+            for col in self.columns:
+                self.blobs[col] = open(_files(self.tmp_dir, col)[0], 'wb')
+                self.lengths[col], self.missing[col] = [], []
+        for col in self.columns:
+            missing = df[col].isna().to_numpy()
+            encoded = df[col].fillna('').str.encode('utf-8')
+            self.blobs[col].write(b''.join(encoded.tolist()))
+            self.lengths[col].append(encoded.str.len().to_numpy(dtype=np.int64))
+            self.missing[col].append(missing)
+        self.rows += len(df)
+
+    def close(self):
+        """Write the offsets and move the store into place; returns False if nothing was added"""
+        if self.columns is None:
+            return False
+        for col in self.columns:
+            self.blobs[col].close()
+            _, offsets_file, missing_file = _files(self.tmp_dir, col)
+            lengths = np.concatenate(self.lengths[col] or [np.zeros(0, dtype=np.int64)])
+            np.save(offsets_file, np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64))
+            np.save(missing_file, np.concatenate(self.missing[col] or [np.zeros(0, dtype=bool)]))
+        with open(os.path.join(self.tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'rows': self.rows, 'columns': self.columns}, f)
+
+        # Swap directories, so a reader never maps a half-written file (open maps stay valid)
+        old_dir = self.text_dir + '.old'
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.text_dir):
+            os.replace(self.text_dir, old_dir)
+        os.replace(self.tmp_dir, self.text_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        return True
+
+def write_text_store(df, text_dir=TEXT_DIR):
+    """Write the text columns of the whole cleaned frame; returns False if it has none"""
+    writer = TextStoreWriter(text_dir)
+    writer.add(df)
+    return writer.close()
+
+def text_store_is_fresh(csv_file, text_dir=TEXT_DIR):
+    """The store is valid if it exists and was written no earlier than the CSV"""
+    meta_file = os.path.join(text_dir, 'meta.json')
+    if not os.path.exists(meta_file):
+        return False
+    return not os.path.exists(csv_file) or os.path.getmtime(meta_file) >= os.path.getmtime(csv_file)
+
+class TextStore:
+    """Read-only, memory-mapped view of a store written by TextStoreWriter"""
+
+    def __init__(self, text_dir=TEXT_DIR):
+        with open(os.path.join(text_dir, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.rows = meta['rows']
+        self.columns = meta['columns']
+        self.blobs = {}
+        self.offsets = {}
+        self.missing = {}
+        for col in self.columns:
+            blob_file, offsets_file, missing_file = _files(text_dir, col)
+            with open(blob_file, 'rb') as f:
+                # mmap can't map an empty file
+                empty = os.path.getsize(blob_file) == 0
+                self.blobs[col] = b'' if empty else mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.offsets[col] = np.load(offsets_file, mmap_mode='r')
+            self.missing[col] = np.load(missing_file, mmap_mode='r')
+
+    @staticmethod
+    def exists(text_dir=TEXT_DIR):
+        return os.path.exists(os.path.join(text_dir, 'meta.json'))
+
+    def _decode(self, column, rows):
+        blob = self.blobs[column]
+        starts = self.offsets[column][rows].tolist()
+        ends = self.offsets[column][rows + 1].tolist()
+        missing = self.missing[column][rows].tolist()
+        return [None if gone else blob[start:end].decode('utf-8')
+                for start, end, gone in zip(starts, ends, missing)]
+
+    def texts(self, column, rows=None):
+        """Series of the text of the given row positions (all rows if None), missing values as NaN"""
+        rows = np.arange(self.rows) if rows is None else np.asarray(rows, dtype=np.int64)
+        return pd.Series(self._decode(column, rows))
+
+    def iter_texts(self, column, rows=None, chunk_rows=DECODE_CHUNK_ROWS):
+        """Text of the given row positions (all rows if None) one by one, None where missing;
+        at most chunk_rows of them are decoded at a time"""
+        n_rows = self.rows if rows is None else len(rows)
+        for start in range(0, n_rows, chunk_rows):
+            chunk = (np.arange(start, min(start + chunk_rows, n_rows)) if rows is None
+                     else np.asarray(rows[start:start + chunk_rows], dtype=np.int64))
+            yield from self._decode(column, chunk)
+
+    def mapped_bytes(self):
+        """Bytes of the mapped files (an upper bound: only pages that are read become resident)"""
+        return sum(len(self.blobs[col]) + self.offsets[col].nbytes + self.missing[col].nbytes
+                   for col in self.columns)
+
+class FrameTexts:
+    """The TextStore interface over text columns that are already in a frame"""
+
+    def __init__(self, df):
+        self.df = df.reset_index(drop=True)
+        self.rows = len(df)
+        self.columns = [col for col in TEXT_COLUMNS if col in df.columns]
+
+    def texts(self, column, rows=None):
+        values = self.df[column] if rows is None else self.df[column].iloc[np.asarray(rows, dtype=np.int64)]
+        return values.reset_index(drop=True)
+
+    def iter_texts(self, column, rows=None, chunk_rows=DECODE_CHUNK_ROWS):
+        for text in self.texts(column, rows):
+            yield None if text != text else text
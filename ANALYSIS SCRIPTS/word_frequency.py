@@ -0,0 +1,104 @@
+# word_frequency.py
+"""Partitioned word-frequency engine for paper titles.
+
+WordFrequencyIndex tokenizes every title once (text_features.tokenize) and keeps
+a sparse count matrix: one row per partition, one column per word. Partitions
+are the aggregate cube's cells (year, journal, abstract word count), so any
+dashboard filter selects whole partitions. top_words() merges the counts of the
+selected partitions, so no string of all titles is ever built. The titles can
+also be streamed from the memory-mapped text store (see text_store.py) instead
+of a column of the frame.
+"""
+from array import array
+import numpy as np
+import pandas as pd
+from aggregate_cube import cell_keys, cell_mask
+from text_features import tokenize
+
+class WordFrequencyIndex:
+    """Sparse (partition x word) count matrix stored partition by partition (CSR)"""
+
+    def __init__(self, vocabulary, years, journal_codes, lengths, journals, offsets, term_ids, counts):
+        self.vocabulary = vocabulary
+        self.years = years
+        self.journal_codes = journal_codes
+        self.lengths = lengths
+        self.journals = journals
+        self.offsets = offsets
+        self.term_ids = term_ids
+        self.counts = counts
+
+    @classmethod
+    def from_frame(cls, df, text_column='title', texts=None):
+        """Tokenize text_column once and count words per partition.
+
+        texts, if given, is an iterable of the texts of df's rows in order
+        (None for missing), e.g. TextStore.iter_texts(); df then doesn't need
+        text_column.
+        """
+        years, journal_codes, journals, lengths = cell_keys(df)
+        cells = pd.DataFrame({'year': years, 'journal': journal_codes, 'length': lengths})
+        grouper = cells.groupby(['year', 'journal', 'length'], sort=True)
+        partition_of_row = grouper.ngroup().to_numpy()
+        partitions = grouper.size().index
+
+        # Tokenize once; word ids are assigned in order of first appearance
+        word_ids = {}
+        entry_partitions = array('i')
+        entry_words = array('i')
+        for partition, text in zip(partition_of_row, df[text_column] if texts is None else texts):
+            if text is None or text != text:
+                continue
+            for word in tokenize(text):
+                word_id = word_ids.get(word)
+                if word_id is None:
+                    word_id = word_ids[word] = len(word_ids)
+                entry_partitions.append(partition)
+                entry_words.append(word_id)
+
+        # Count (partition, word) pairs; unique keys come out sorted by partition
+        n_words = max(len(word_ids), 1)
+        keys = np.frombuffer(entry_partitions, dtype=np.int32).astype(np.int64) * n_words \
+            + np.frombuffer(entry_words, dtype=np.int32)
+        keys, counts = np.unique(keys, return_counts=True)
+        entry_partition = keys // n_words
+        offsets = np.searchsorted(entry_partition, np.arange(len(partitions) + 1))
+
+        return cls(
+            vocabulary=np.array(list(word_ids), dtype=object),
+            years=partitions.get_level_values('year').to_numpy(dtype=np.int32),
+            journal_codes=partitions.get_level_values('journal').to_numpy(dtype=np.int32),
+            lengths=partitions.get_level_values('length').to_numpy(dtype=np.int64),
+            journals=journals,
+            offsets=offsets,
+            term_ids=(keys % n_words).astype(np.int32),
+            counts=counts.astype(np.int64)
+        )
+
+    def word_counts(self, year_range=None, journals=None, length_range=None):
+        """Total count of every vocabulary word over the partitions matching the filter"""
+        selected = np.flatnonzero(cell_mask(self.years, self.journal_codes, self.lengths, self.journals,
+                                            year_range, journals, length_range))
+        if len(selected) == len(self.years):
+            term_ids, counts = self.term_ids, self.counts
+        else:
+            # Gather the selected partitions' slices of the entry arrays
+            starts, ends = self.offsets[selected], self.offsets[selected + 1]
+            lengths = ends - starts
+            gather = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            term_ids, counts = self.term_ids[gather], self.counts[gather]
+        return np.bincount(term_ids, weights=counts, minlength=len(self.vocabulary)).astype(np.int64)
+
+    def top_words(self, n, stop_words=(), year_range=None, journals=None, length_range=None):
+        """The n most frequent words outside stop_words, as (word, count) pairs like Counter.most_common"""
+        totals = self.word_counts(year_range, journals, length_range)
+        if stop_words:
+            totals[np.isin(self.vocabulary, list(stop_words))] = 0
+        candidates = np.flatnonzero(totals)
+        # Highest counts first; ties keep the order of first appearance
+        order = candidates[np.lexsort((candidates, -totals[candidates]))][:n]
+        return [(self.vocabulary[i], int(totals[i])) for i in order]
+
+    def frequencies(self, stop_words=(), **filters):
+        """{word: count} for every word with a non-zero count (e.g. for a word cloud)"""
+        return dict(self.top_words(len(self.vocabulary), stop_words, **filters))
@@ -3,9 +3,32 @@ import streamlit as st
 import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
-from collections import Counter
-import re
 import numpy as np
+import io
+import os
+import sys
+import threading
+try:
+    import altair as alt
+except ImportError:  # altair ships with Streamlit; without it the matplotlib figure is shown
+    alt = None
+
+# Shared data-loading helpers live next to the analysis scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ANALYSIS SCRIPTS'))
+from data_store import SharedDataCache, columnar_cache_available
+from search_index import INDEX_DIR, SearchIndex
+from text_store import TEXT_DIR, FrameTexts, TextStore
+from aggregate_cube import AggregateCube
+from bitmap_index import BitmapIndex, bitmap_count, bitmap_rows, bitmap_to_mask
+from word_frequency import WordFrequencyIndex
+from figure_cache import FigureCache, figure_key
+from heavy_hitters import SKETCH_FILE, JournalSketch, top_counts
+from query_service import QueryService, query_key
+import instrumentation
+from instrumentation import span
+
+# Time every rerun when CORD19_TRACE names a trace file (see instrumentation.py)
+instrumentation.enable_from_env()
 
 # Set page configuration
 st.set_page_config(
@@ -42,16 +65,147 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Columns the dashboard displays, filters on or exports (abstracts are not needed, and
+# titles are read lazily from the memory-mapped text store, see load_texts())
+APP_COLUMNS = ['journal', 'year', 'publish_time', 'authors',
+               'abstract_word_count', 'title_word_count', 'has_abstract', 'paper_id']
+
+@st.cache_resource
+def get_data_cache():
+    """One data cache per server process, shared by every session"""
+    return SharedDataCache(columns=APP_COLUMNS)
+
 def load_data():
-    """Load the cleaned dataset"""
+    """Load the cleaned dataset (parsed once per process, reloaded when the file changes)"""
     try:
-        df = pd.read_csv('cleaned_metadata.csv')
-        return df
+        return get_data_cache().get()
     except FileNotFoundError:
         # If cleaned data doesn't exist, create a sample
         st.warning("Creating sample data for demonstration...")
         return create_sample_data()
 
+@st.cache_resource(max_entries=1)
+def open_search_index(index_version):
+    """Memory-map the search index (index_version changes when it is rebuilt)"""
+    return SearchIndex(INDEX_DIR)
+
+def load_search_index(df):
+    """Return the search index if it was built for the loaded data, else None"""
+    if not SearchIndex.exists(INDEX_DIR):
+        return None
+    index = open_search_index(os.path.getmtime(os.path.join(INDEX_DIR, 'meta.json')))
+    return index if index.rows == len(df) else None
+
+@st.cache_resource(max_entries=1)
+def open_journal_sketch(sketch_version):
+    """Read the journal sketch (sketch_version changes when it is rewritten)"""
+    return JournalSketch.load(SKETCH_FILE)
+
+def load_journal_sketch(df):
+    """Return the journal sketch if it was built for the loaded data, else None"""
+    if not os.path.exists(SKETCH_FILE):
+        return None
+    sketch = open_journal_sketch(os.path.getmtime(SKETCH_FILE))
+    return sketch if sketch.rows == len(df) else None
+
+@st.cache_resource(max_entries=1)
+def open_text_store(store_version):
+    """Memory-map the text store (store_version changes when it is rewritten)"""
+    return TextStore(TEXT_DIR)
+
+@st.cache_resource
+def get_title_cache():
+    """Titles loaded into memory, for when the text store is missing or out of date"""
+    return SharedDataCache(columns=['title'])
+
+def load_texts(df):
+    """Titles of the loaded data: the text store if it was written for it, else the titles
+    loaded into memory (None if there are none)"""
+    if 'title' in df.columns:
+        return FrameTexts(df)
+    if TextStore.exists(TEXT_DIR):
+        store = open_text_store(os.path.getmtime(os.path.join(TEXT_DIR, 'meta.json')))
+        if 'title' in store.columns and store.rows == len(df):
+            return store
+    try:
+        titles = get_title_cache().get()
+    except FileNotFoundError:
+        return None
+    return FrameTexts(titles) if 'title' in titles.columns and len(titles) == len(df) else None
+
+@st.cache_resource(max_entries=2)
+def build_aggregate_cube(_df, data_version):
+    """Aggregate cube of the loaded data, built once per data version"""
+    return AggregateCube.from_frame(_df)
+
+@st.cache_resource(max_entries=2)
+def build_word_index(_df, _texts, data_version):
+    """Per-partition title word counts of the loaded data, built once per data version"""
+    return WordFrequencyIndex.from_frame(_df, texts=_texts.iter_texts('title'))
+
+@st.cache_resource(max_entries=2)
+def build_bitmap_index(_df, data_version):
+    """Year, journal and abstract-length row bitmaps of the loaded data, built once per data version"""
+    return BitmapIndex.from_frame(_df)
+
+@st.cache_resource
+def get_query_service():
+    """One query service per server process: sessions with the same filters share each result"""
+    return QueryService()
+
+@st.cache_resource
+def get_figure_cache():
+    """Rendered dashboard figures, keyed by a hash of the data they show"""
+    return FigureCache(os.path.join('figure_cache', 'app'))
+
+# Paper browser page sizes and the rows serialized per block when exporting
+PAGE_SIZES = [10, 25, 50, 100]
+EXPORT_CHUNK_ROWS = 50_000
+
+@st.cache_resource(max_entries=8)
+def sort_order(_df, _texts, data_version, column, ascending):
+    """Row positions of the loaded data sorted by column (missing values last), built once per data version"""
+    values = _texts.texts(column) if column not in _df.columns else _df[column].reset_index(drop=True)
+    return values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+
+def page_rows(df, texts, data_version, mask, sort_column, ascending, page, page_size):
+    """Row positions of one page of the masked rows, in sort order (or file order)"""
+    if sort_column is None:
+        rows = np.flatnonzero(mask)
+    else:
+        order = sort_order(df, texts, data_version, sort_column, ascending)
+        rows = order[mask[order]]
+    start = (page - 1) * page_size
+    return rows[start:start + page_size]
+
+def with_titles(frame, texts, rows):
+    """frame (the given rows of the loaded data) with their titles as its first column"""
+    if texts is None or 'title' in frame.columns:
+        return frame
+    titles = texts.texts('title', rows)
+    titles.index = frame.index
+    frame.insert(0, 'title', titles)
+    return frame
+
+def export_bytes(df, texts, rows, file_format):
+    """Serialize the given rows block by block (CSV or Parquet), without copying them all first"""
+    buffer = io.BytesIO()
+    if file_format == 'Parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.Schema.from_pandas(with_titles(df.iloc[rows[:1]], texts, rows[:1]), preserve_index=False)
+        with pq.ParquetWriter(buffer, schema) as writer:
+            for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+                block_rows = rows[start:start + EXPORT_CHUNK_ROWS]
+                block = with_titles(df.iloc[block_rows], texts, block_rows)
+                writer.write_table(pa.Table.from_pandas(block, schema=schema, preserve_index=False))
+    else:
+        for start in range(0, max(len(rows), 1), EXPORT_CHUNK_ROWS):
+            block_rows = rows[start:start + EXPORT_CHUNK_ROWS]
+            block = with_titles(df.iloc[block_rows], texts, block_rows)
+            buffer.write(block.to_csv(index=False, header=start == 0).encode('utf-8'))
+    return buffer.getvalue()
+
 def create_sample_data():
     """Create sample data if cleaned_metadata.csv doesn't exist"""
     sample_data = {
@@ -105,27 +259,26 @@ def create_sample_data():
     
     return df
 
-def create_visualizations(df, year_range, selected_journals):
-    """Create all required visualizations"""
-    
-    # Filter data based on selections
-    filtered_df = df.copy()
-    
-    if year_range:
-        filtered_df = filtered_df[
-            (filtered_df['year'] >= year_range[0]) & 
-            (filtered_df['year'] <= year_range[1])
-        ]
-    
-    if selected_journals:
-        filtered_df = filtered_df[filtered_df['journal'].isin(selected_journals)]
+# Words left out of the title word chart
+STOP_WORDS = {
+    'this', 'that', 'with', 'from', 'have', 'were', 'been', 'their',
+    'which', 'study', 'using', 'based', 'during', 'among', 'between'
+}
+
+def create_visualizations(chart_cube, common_words, top_journals):
+    """Create all required visualizations.
+
+    Year and abstract-length panels are drawn from the filtered aggregate cube;
+    top_journals and common_words are the top journals and title words for the
+    same filter (common_words is None if the data has no titles).
+    """
     
     # Create subplots
     fig, axes = plt.subplots(2, 2, figsize=(15, 12))
     
     # 1. Publications by Year
-    if 'year' in filtered_df.columns and not filtered_df.empty:
-        yearly_counts = filtered_df['year'].value_counts().sort_index()
+    yearly_counts = chart_cube.year_counts()
+    if not yearly_counts.empty:
         axes[0, 0].bar(yearly_counts.index, yearly_counts.values, color='skyblue', alpha=0.8)
         axes[0, 0].set_title('Publications by Year', fontweight='bold', fontsize=14)
         axes[0, 0].set_xlabel('Year')
@@ -137,8 +290,7 @@ def create_visualizations(df, year_range, selected_journals):
         axes[0, 0].set_title('Publications by Year', fontweight='bold')
     
     # 2. Top Journals
-    if 'journal' in filtered_df.columns and not filtered_df.empty:
-        top_journals = filtered_df['journal'].value_counts().head(10)
+    if not top_journals.empty:
         colors = plt.cm.Set3(np.linspace(0, 1, len(top_journals)))
         top_journals.plot(kind='bar', ax=axes[0, 1], color=colors, alpha=0.8)
         axes[0, 1].set_title('Top Publishing Journals', fontweight='bold', fontsize=14)
@@ -152,21 +304,8 @@ def create_visualizations(df, year_range, selected_journals):
         axes[0, 1].set_title('Top Publishing Journals', fontweight='bold')
     
     # 3. Word Frequency in Titles
-    if 'title' in filtered_df.columns and not filtered_df.empty:
-        all_titles = ' '.join(filtered_df['title'].dropna().astype(str))
-        words = re.findall(r'\b[a-zA-Z]{4,}\b', all_titles.lower())
-        
-        # Custom stop words
-        stop_words = {
-            'this', 'that', 'with', 'from', 'have', 'were', 'been', 'their',
-            'which', 'study', 'using', 'based', 'during', 'among', 'between'
-        }
-        
-        filtered_words = [word for word in words if word not in stop_words]
-        
-        if filtered_words:
-            word_freq = Counter(filtered_words)
-            common_words = word_freq.most_common(10)
+    if common_words is not None:
+        if common_words:
             words, counts = zip(*common_words)
             
             axes[1, 0].barh(words, counts, color='lightgreen', alpha=0.8)
@@ -184,14 +323,16 @@ def create_visualizations(df, year_range, selected_journals):
         axes[1, 0].set_title('Most Frequent Words in Titles', fontweight='bold')
     
     # 4. Abstract Length Distribution
-    if 'abstract_word_count' in filtered_df.columns and not filtered_df.empty:
-        abstract_lengths = filtered_df['abstract_word_count']
-        axes[1, 1].hist(abstract_lengths, bins=20, color='orange', alpha=0.7, edgecolor='black')
+    if chart_cube.total() > 0:
+        length_counts, length_edges = chart_cube.length_histogram(bins=20)
+        axes[1, 1].hist(length_edges[:-1], bins=length_edges, weights=length_counts,
+                        color='orange', alpha=0.7, edgecolor='black')
         axes[1, 1].set_title('Abstract Length Distribution', fontweight='bold', fontsize=14)
         axes[1, 1].set_xlabel('Word Count')
         axes[1, 1].set_ylabel('Frequency')
-        axes[1, 1].axvline(abstract_lengths.mean(), color='red', linestyle='--', 
-                          label=f'Mean: {abstract_lengths.mean():.1f} words')
+        mean_length = chart_cube.mean_length()
+        axes[1, 1].axvline(mean_length, color='red', linestyle='--', 
+                          label=f'Mean: {mean_length:.1f} words')
         axes[1, 1].legend()
         axes[1, 1].grid(alpha=0.3)
     else:
@@ -200,7 +341,139 @@ def create_visualizations(df, year_range, selected_journals):
         axes[1, 1].set_title('Abstract Length Distribution', fontweight='bold')
     
     plt.tight_layout()
-    return fig, filtered_df
+    return fig
+
+# Resolution of the dashboard figure (st.pyplot's default)
+FIGURE_DPI = 200
+
+# pyplot keeps global state, so figures are drawn one at a time
+RENDER_LOCK = threading.Lock()
+
+def dashboard_figure_png(chart_cube, common_words, top_journals, cache):
+    """PNG of the dashboard figure, rendered only if no identical figure is in cache"""
+    length_histogram = chart_cube.length_histogram(bins=20) if chart_cube.total() > 0 else None
+    key = figure_key(create_visualizations, chart_cube.year_counts(), top_journals,
+                     length_histogram, chart_cube.mean_length(), common_words, FIGURE_DPI)
+    png = cache.get(key)
+    if png is None:
+        with RENDER_LOCK:
+            fig = create_visualizations(chart_cube, common_words, top_journals)
+            try:
+                buffer = io.BytesIO()
+                fig.savefig(buffer, format='png', dpi=FIGURE_DPI, bbox_inches='tight')
+            finally:
+                plt.close(fig)
+        png = buffer.getvalue()
+        cache.put(key, png)
+    return png
+
+def chart_top_journals(chart_cube, journal_sketch, year_range):
+    """Top 10 journals of the filtered cube. journal_sketch is only given when the year range
+    is the sole filter; it answers if it guarantees its ranking, without summing every journal"""
+    if journal_sketch is not None:
+        top_journals, exact = journal_sketch.top(10, year_range)
+        if exact:
+            return top_journals
+    return top_counts(chart_cube.journal_totals(), 10)
+
+def search_papers(df, texts, search_index, query, with_words):
+    """Rows matching a keyword search, their aggregate cube and (if with_words) their title word counts"""
+    rows = search_index.search(query)
+    searched_df = df.iloc[rows]
+    words = WordFrequencyIndex.from_frame(searched_df, texts=texts.iter_texts('title', rows)) if with_words else None
+    return rows, AggregateCube.from_frame(searched_df), words
+
+def filter_cubes(searched_cube, year_range, journals, length_range):
+    """(cube with the abstract length filter, cube with every filter)"""
+    abstract_cube = searched_cube.filter(length_range=length_range)
+    return abstract_cube, abstract_cube.filter(year_range=year_range, journals=journals, length_range=length_range)
+
+def filter_papers(bitmaps, rows, year_range, journals, length_range):
+    """(bitmap of the rows matching the search and every filter, their number)"""
+    bitmap = bitmaps.select(year_range, journals, length_range, rows=rows)
+    return bitmap, bitmap_count(bitmap)
+
+def title_words(searched_words, filters):
+    """(top 10 title words outside STOP_WORDS, the single most common word) under the filters"""
+    return searched_words.top_words(10, STOP_WORDS, **filters), searched_words.top_words(1, **filters)
+
+# How the dashboard charts are drawn: Vega-Lite in the browser, or one matplotlib PNG
+CHART_STYLES = ['Interactive', 'Static image']
+
+def chart_data(chart_cube, common_words, top_journals):
+    """The few rows behind each dashboard chart, taken from the filtered aggregate cube
+    (None for a chart without data)"""
+    data = {'year': None, 'journal': None, 'words': None, 'lengths': None}
+    yearly_counts = chart_cube.year_counts()
+    if not yearly_counts.empty:
+        data['year'] = pd.DataFrame({'Year': yearly_counts.index.astype(int),
+                                     'Papers': yearly_counts.to_numpy()})
+    if not top_journals.empty:
+        data['journal'] = pd.DataFrame({'Journal': top_journals.index.astype(str),
+                                        'Papers': top_journals.to_numpy()})
+    if common_words:
+        data['words'] = pd.DataFrame(common_words, columns=['Word', 'Frequency'])
+    if chart_cube.total() > 0:
+        length_counts, length_edges = chart_cube.length_histogram(bins=20)
+        data['lengths'] = pd.DataFrame({'From': length_edges[:-1], 'To': length_edges[1:],
+                                        'Papers': length_counts.astype(np.int64)})
+        data['mean_length'] = chart_cube.mean_length()
+    return data
+
+def interactive_charts(data):
+    """Vega-Lite charts of chart_data() (rendered by the browser), None where there is no data"""
+    charts = {'year': None, 'journal': None, 'words': None, 'lengths': None}
+    
+    # 1. Publications by Year
+    if data['year'] is not None:
+        charts['year'] = alt.Chart(data['year'], title='Publications by Year').mark_bar(
+            color='skyblue', opacity=0.8).encode(
+            x=alt.X('Year:O'), y=alt.Y('Papers:Q', title='Number of Papers'),
+            tooltip=['Year', 'Papers'])
+    
+    # 2. Top Journals
+    if data['journal'] is not None:
+        charts['journal'] = alt.Chart(data['journal'], title='Top Publishing Journals').mark_bar(
+            opacity=0.8).encode(
+            x=alt.X('Journal:N', sort='-y', axis=alt.Axis(labelAngle=-45)),
+            y=alt.Y('Papers:Q', title='Number of Papers'),
+            color=alt.Color('Journal:N', scale=alt.Scale(scheme='set3'), legend=None),
+            tooltip=['Journal', 'Papers'])
+    
+    # 3. Word Frequency in Titles
+    if data['words'] is not None:
+        charts['words'] = alt.Chart(data['words'], title='Most Frequent Words in Titles').mark_bar(
+            color='lightgreen', opacity=0.8).encode(
+            x=alt.X('Frequency:Q'), y=alt.Y('Word:N', sort='-x', title=None),
+            tooltip=['Word', 'Frequency'])
+    
+    # 4. Abstract Length Distribution
+    if data['lengths'] is not None:
+        bars = alt.Chart(data['lengths']).mark_bar(color='orange', opacity=0.7, stroke='black').encode(
+            x=alt.X('From:Q', bin='binned', title='Word Count'), x2='To:Q',
+            y=alt.Y('Papers:Q', title='Frequency'), tooltip=['From', 'To', 'Papers'])
+        mean = pd.DataFrame({'Mean': [data['mean_length']]})
+        mean_rule = alt.Chart(mean).mark_rule(color='red', strokeDash=[6, 4]).encode(
+            x='Mean:Q', tooltip=[alt.Tooltip('Mean:Q', format='.1f', title='Mean words')])
+        charts['lengths'] = alt.layer(bars, mean_rule, title='Abstract Length Distribution')
+    return charts
+
+def show_interactive_charts(chart_cube, common_words, top_journals):
+    """Draw the four dashboard charts as interactive charts in a 2 x 2 grid"""
+    charts = interactive_charts(chart_data(chart_cube, common_words, top_journals))
+    empty_messages = {
+        'year': 'No year data available',
+        'journal': 'No journal data available',
+        'words': 'No title data available' if common_words is None else 'No title data for analysis',
+        'lengths': 'No abstract length data available',
+    }
+    for row in (['year', 'journal'], ['words', 'lengths']):
+        for column, name in zip(st.columns(2), row):
+            with column:
+                if charts[name] is not None:
+                    st.altair_chart(charts[name], width='stretch')
+                else:
+                    st.info(empty_messages[name])
 
 def main():
     # Header
@@ -214,17 +487,33 @@ def main():
     **Use the filters in the sidebar to customize your analysis.**
     """)
     
-    # Load data
-    df = load_data()
+    # Load data, its titles and its aggregate cube (all shared across sessions)
+    with span('app.load') as step:
+        df = load_data()
+        texts = load_texts(df)
+        cube = build_aggregate_cube(df, get_data_cache().signature)
+        word_index = build_word_index(df, texts, get_data_cache().signature) if texts is not None else None
+        bitmaps = build_bitmap_index(df, get_data_cache().signature)
+        step.rows_out = len(df)
     
     # Sidebar - Filters and Controls
     st.sidebar.markdown('<div class="section-header">🔍 Filters & Controls</div>', 
                        unsafe_allow_html=True)
     
+    # Keyword search over titles and abstracts
+    search_index = load_search_index(df)
+    if search_index is not None:
+        search_query = st.sidebar.text_input(
+            "Search Titles & Abstracts",
+            help='Words are combined with AND, use OR for alternatives and "quotes" for phrases'
+        )
+    else:
+        search_query = ''
+        st.sidebar.info("Search index not available (run the cleaning script)")
+    
     # Year range filter
-    if 'year' in df.columns:
-        min_year = int(df['year'].min())
-        max_year = int(df['year'].max())
+    if cube.year_range() is not None:
+        min_year, max_year = cube.year_range()
         year_range = st.sidebar.slider(
             "Select Publication Year Range",
             min_value=min_year,
@@ -237,7 +526,7 @@ def main():
     
     # Journal filter
     if 'journal' in df.columns:
-        available_journals = sorted(df['journal'].unique())
+        available_journals = sorted(cube.journal_counts().index)
         selected_journals = st.sidebar.multiselect(
             "Select Journals to Include",
             options=available_journals,
@@ -258,13 +547,47 @@ def main():
     else:
         min_abstract, max_abstract = (0, 300)
     
-    # Apply abstract length filter
-    filtered_df_abstract = df.copy()
-    if 'abstract_word_count' in df.columns:
-        filtered_df_abstract = filtered_df_abstract[
-            (filtered_df_abstract['abstract_word_count'] >= min_abstract) &
-            (filtered_df_abstract['abstract_word_count'] <= max_abstract)
-        ]
+    # Chart style (the static image is the fallback when altair is missing)
+    chart_styles = CHART_STYLES if alt is not None else CHART_STYLES[1:]
+    chart_style = st.sidebar.radio(
+        "Chart Style",
+        chart_styles,
+        horizontal=True,
+        help="Interactive charts are drawn by your browser from the aggregated counts"
+    )
+    
+    # Every result below is requested from the shared query service under the
+    # normalized filter state, so sessions with the same filters compute it once
+    queries = get_query_service()
+    data_version = get_data_cache().signature
+    chart_filters = dict(year_range=year_range, journals=selected_journals,
+                         length_range=(min_abstract, max_abstract))
+    state = dict(chart_filters, query=search_query)
+    
+    # Apply keyword search (posting-list lookup, no text scan); the cube and word
+    # counts of the matching rows are small enough to build on the fly
+    searched_cube, searched_words = cube, word_index
+    searched_rows = None
+    if search_query.strip():
+        with span('app.search', rows_in=len(df)) as step:
+            searched_rows, searched_cube, searched_words = queries.get(
+                query_key('search', data_version, query=search_query),
+                lambda: search_papers(df, texts, search_index, search_query, word_index is not None), heavy=True)
+            step.rows_out = len(searched_rows)
+        st.sidebar.caption(f"{len(searched_rows):,} papers match the search")
+    
+    # Apply abstract length filter (metric cards), then year and journal filters (charts)
+    with span('app.filter_cube', cells_in=len(searched_cube)) as step:
+        abstract_cube, chart_cube = queries.get(query_key('cubes', data_version, **state),
+                                                lambda: filter_cubes(searched_cube, **chart_filters))
+        step.set(cells_out=len(chart_cube))
+    
+    # Top journals: from the journal sketch when only the year range narrows the papers
+    only_years = (not search_query.strip() and not selected_journals and len(cube) > 0 and
+                  min_abstract <= cube.lengths.min() and max_abstract >= cube.lengths.max())
+    journal_sketch = load_journal_sketch(df) if only_years else None
+    top_journals = queries.get(query_key('journals', data_version, **state),
+                               lambda: chart_top_journals(chart_cube, journal_sketch, year_range))
     
     # Sidebar metrics
     st.sidebar.markdown("---")
@@ -274,10 +597,23 @@ def main():
     with col1:
         st.metric("Total Papers", len(df))
     with col2:
-        st.metric("Filtered Papers", len(filtered_df_abstract))
-    
-    if 'year' in df.columns:
-        st.sidebar.metric("Date Range", f"{int(df['year'].min())}-{int(df['year'].max())}")
+        st.metric("Filtered Papers", abstract_cube.total())
+    
+    if cube.year_range() is not None:
+        st.sidebar.metric("Date Range", "{}-{}".format(*cube.year_range()))
+    
+    # Data cache statistics
+    cache_stats = get_data_cache().stats()
+    with st.sidebar.expander("⚙️ Data Cache"):
+        st.write(f"Hits: {cache_stats['hits']:,} | Misses: {cache_stats['misses']:,}")
+        st.write(f"Last load: {cache_stats['last_load_seconds']:.2f}s "
+                 f"(total {cache_stats['total_load_seconds']:.2f}s)")
+        st.write(f"In memory: {cache_stats['memory_bytes'] / 1e6:.1f} MB")
+        if isinstance(texts, TextStore):
+            st.write(f"Text store: {texts.mapped_bytes() / 1e6:.1f} MB memory-mapped, read on demand")
+        query_stats = queries.stats()
+        st.write(f"Shared queries: {query_stats.get('hits', 0):,} cached | "
+                 f"{query_stats.get('coalesced', 0):,} joined in flight | {query_stats.get('misses', 0):,} computed")
     
     # Main content area
     if df.empty:
@@ -290,27 +626,25 @@ def main():
     metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
     
     with metric_col1:
-        total_papers = len(filtered_df_abstract)
+        total_papers = abstract_cube.total()
         st.metric("Total Research Papers", f"{total_papers:,}")
     
     with metric_col2:
-        if 'journal' in filtered_df_abstract.columns:
-            unique_journals = filtered_df_abstract['journal'].nunique()
-            st.metric("Unique Journals", unique_journals)
+        if 'journal' in df.columns:
+            st.metric("Unique Journals", abstract_cube.unique_journals())
         else:
             st.metric("Unique Journals", "N/A")
     
     with metric_col3:
-        if 'abstract_word_count' in filtered_df_abstract.columns:
-            avg_abstract = filtered_df_abstract['abstract_word_count'].mean()
+        if 'abstract_word_count' in df.columns:
+            avg_abstract = abstract_cube.mean_length()
             st.metric("Avg Abstract Length", f"{avg_abstract:.1f} words")
         else:
             st.metric("Avg Abstract Length", "N/A")
     
     with metric_col4:
-        if 'year' in filtered_df_abstract.columns:
-            years_covered = filtered_df_abstract['year'].nunique()
-            st.metric("Years Covered", years_covered)
+        if 'year' in df.columns:
+            st.metric("Years Covered", abstract_cube.years_covered())
         else:
             st.metric("Years Covered", "N/A")
     
@@ -318,29 +652,65 @@ def main():
     st.markdown('<div class="section-header">📊 Research Visualizations</div>', 
                 unsafe_allow_html=True)
     
-    # Create and display visualizations
-    fig, final_filtered_df = create_visualizations(filtered_df_abstract, year_range, selected_journals)
-    st.pyplot(fig)
+    # Rows matching the search and every filter, as a bitmap over the loaded data
+    # (only the rows that are shown or exported are ever copied)
+    with span('app.filter_papers', rows_in=len(df) if searched_rows is None else len(searched_rows)) as step:
+        filtered_bitmap, filtered_count = queries.get(
+            query_key('papers', data_version, **state),
+            lambda: filter_papers(bitmaps, searched_rows, **chart_filters))
+        step.rows_out = filtered_count
     
-    # Data Sample Section
-    st.markdown('<div class="section-header">📋 Research Papers Sample</div>', 
+    # Create and display visualizations
+    with span('app.figure', style=chart_style):
+        common_words, top_word = None, []
+        if searched_words is not None:
+            common_words, top_word = queries.get(query_key('words', data_version, **state),
+                                                 lambda: title_words(searched_words, chart_filters))
+        if chart_style == 'Interactive':
+            show_interactive_charts(chart_cube, common_words, top_journals)
+        else:
+            figure_cache = get_figure_cache()
+            st.image(queries.get(query_key('figure', data_version, **state),
+                                 lambda: dashboard_figure_png(chart_cube, common_words, top_journals, figure_cache),
+                                 heavy=True),
+                     width='stretch')
+    
+    # Paper Browser Section
+    st.markdown('<div class="section-header">📋 Research Papers</div>', 
                 unsafe_allow_html=True)
     
     # Select columns to display
     display_columns = []
     for col in ['title', 'journal', 'year', 'authors']:
-        if col in final_filtered_df.columns:
+        if col in df.columns or (col == 'title' and texts is not None):
             display_columns.append(col)
     
-    if display_columns and not final_filtered_df.empty:
-        st.dataframe(
-            final_filtered_df[display_columns].head(10),
-            use_container_width=True,
-            height=400
-        )
+    if display_columns and filtered_count:
+        browse_col1, browse_col2, browse_col3, browse_col4 = st.columns(4)
+        with browse_col1:
+            sort_column = st.selectbox("Sort by", ['(file order)'] + display_columns)
+        with browse_col2:
+            descending = st.checkbox("Descending", value=sort_column == 'year')
+        with browse_col3:
+            page_size = st.selectbox("Papers per page", PAGE_SIZES)
+        n_pages = -(-filtered_count // page_size)
+        # Filters may have shrunk the result below the page that was open
+        if st.session_state.get('paper_page', 1) > n_pages:
+            st.session_state['paper_page'] = n_pages
+        with browse_col4:
+            page = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages,
+                                   step=1, key='paper_page')
+        
+        with span('app.page', rows_in=filtered_count) as step:
+            rows = page_rows(df, texts, get_data_cache().signature, bitmap_to_mask(filtered_bitmap, len(df)),
+                             None if sort_column == '(file order)' else sort_column,
+                             not descending, page, page_size)
+            st.dataframe(with_titles(df.iloc[rows], texts, rows)[display_columns], width='stretch', height=400)
+            step.rows_out = len(rows)
         
-        # Show sample count
-        st.info(f"Showing {min(10, len(final_filtered_df))} of {len(final_filtered_df)} papers")
+        # Show page position
+        first = (page - 1) * page_size + 1
+        st.info(f"Showing {first:,}-{first + len(rows) - 1:,} of {filtered_count:,} papers")
     else:
         st.warning("No data available to display with current filters")
     
@@ -348,14 +718,17 @@ def main():
     st.markdown('<div class="section-header">📥 Export Data</div>', 
                 unsafe_allow_html=True)
     
-    if not final_filtered_df.empty:
-        csv_data = final_filtered_df.to_csv(index=False)
+    if filtered_count:
+        formats = ['CSV', 'Parquet'] if columnar_cache_available() else ['CSV']
+        export_format = st.radio("Export format", formats, horizontal=True)
+        export_rows = bitmap_rows(filtered_bitmap, len(df))
+        # The file is only generated when the button is clicked, not on every rerun
         st.download_button(
-            label="📥 Download Filtered Data as CSV",
-            data=csv_data,
-            file_name="cord19_filtered_data.csv",
-            mime="text/csv",
-            help="Download the currently filtered dataset"
+            label=f"📥 Download Filtered Data as {export_format}",
+            data=lambda: export_bytes(df, texts, export_rows, export_format),
+            file_name=f"cord19_filtered_data.{'parquet' if export_format == 'Parquet' else 'csv'}",
+            mime="application/octet-stream" if export_format == 'Parquet' else "text/csv",
+            help=f"Download the {filtered_count:,} currently filtered papers"
         )
     else:
         st.info("No data available for download with current filters")
@@ -364,36 +737,33 @@ def main():
     st.markdown('<div class="section-header">💡 Key Insights</div>', 
                 unsafe_allow_html=True)
     
-    if not final_filtered_df.empty:
+    if filtered_count:
         insights_col1, insights_col2 = st.columns(2)
         
         with insights_col1:
             st.subheader("Publication Trends")
-            if 'year' in final_filtered_df.columns:
-                yearly_stats = final_filtered_df['year'].value_counts()
+            if 'year' in df.columns:
+                yearly_stats = chart_cube.year_counts()
                 if not yearly_stats.empty:
                     peak_year = yearly_stats.idxmax()
                     peak_count = yearly_stats.max()
                     st.write(f"• **Peak publication year**: {int(peak_year)} ({peak_count} papers)")
             
-            if 'journal' in final_filtered_df.columns:
-                journal_stats = final_filtered_df['journal'].value_counts()
-                if not journal_stats.empty:
-                    top_journal = journal_stats.index[0]
-                    top_count = journal_stats.iloc[0]
+            if 'journal' in df.columns:
+                if not top_journals.empty:
+                    top_journal = top_journals.index[0]
+                    top_count = top_journals.iloc[0]
                     st.write(f"• **Top journal**: {top_journal} ({top_count} papers)")
         
         with insights_col2:
             st.subheader("Content Analysis")
-            if 'abstract_word_count' in final_filtered_df.columns:
-                avg_words = final_filtered_df['abstract_word_count'].mean()
+            if 'abstract_word_count' in df.columns:
+                avg_words = chart_cube.mean_length()
                 st.write(f"• **Average abstract length**: {avg_words:.1f} words")
             
-            if 'title' in final_filtered_df.columns:
-                all_titles = ' '.join(final_filtered_df['title'].dropna().astype(str))
-                words = re.findall(r'\b[a-zA-Z]{4,}\b', all_titles.lower())
-                if words:
-                    common_word = Counter(words).most_common(1)[0]
+            if searched_words is not None:
+                if top_word:
+                    common_word = top_word[0]
                     st.write(f"• **Most common word**: '{common_word[0]}' ({common_word[1]} times)")
     
     # Footer
@@ -403,5 +773,22 @@ def main():
         "Data Source: [CORD-19 Dataset](https://www.kaggle.com/allen-institute-for-ai/CORD-19-research-challenge)"
     )
 
+def traced_rerun():
+    """Run one rerun of the dashboard inside a span and append it to the trace file"""
+    tracer = instrumentation.active_tracer()
+    if tracer is None:
+        main()
+        return
+    with span('app.rerun') as rerun:
+        main()
+    tracer.write()
+    total = rerun.record
+    with st.sidebar.expander("⏱️ Rerun Timing"):
+        st.write(f"Rerun: {total['wall_s'] * 1000:.0f} ms (CPU {total['cpu_s'] * 1000:.0f} ms)")
+        for record in tracer.records:
+            if record['tid'] == total['tid'] and record['parent'] == 'app.rerun' \
+                    and record['start_us'] >= total['start_us']:
+                st.write(f"{record['name']}: {record['wall_s'] * 1000:.1f} ms")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    traced_rerun()
\ No newline at end of file